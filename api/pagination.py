@@ -0,0 +1,29 @@
+from collections import OrderedDict
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from file_handler import listing
+
+
+class KeysetPagination(BasePagination):
+    """ cursor pagination over (sort field, id), see file_handler.listing """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        sort = request.query_params.get('sort', listing.DEFAULT_SORT)
+        size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        try:
+            items, self.cursor = listing.keyset_page(queryset, size, sort, request.query_params.get('cursor'))
+        except ValueError as e:
+            raise ValidationError({'cursor': str(e)})
+        return items
+
+    def get_next_link(self):
+        if self.cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), 'cursor', self.cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([('next', self.get_next_link()), ('results', data)]))
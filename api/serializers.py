@@ -1,26 +1,58 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from django.conf import settings
 from file_handler.models import Folder, Document
+from file_handler import listing
 
 
 class DocumentSerializer(serializers.ModelSerializer):
+    # stored on the row, serializing a document never opens its file
+    file_mime = serializers.CharField(source='mime_type', read_only=True)
+
     class Meta:
         model = Document
-        fields = ('id', 'name', 'creation_date', 'filename', 'file_url', 'file_mime')
+        fields = ('id', 'name', 'creation_date', 'filename', 'file_url', 'file_mime', 'size')
 
 
 class ChildrenFolderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Folder
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'creation_date', 'total_size', 'total_documents', 'total_encrypted')
+        # kept up to date by the document signals, never written by clients
+        read_only_fields = ('total_size', 'total_documents', 'total_encrypted')
 
 
-class FolderSerializer(serializers.ModelSerializer):
-    documents = DocumentSerializer(many=True)
-    children = ChildrenFolderSerializer(many=True)
+class RootFolderSerializer(ChildrenFolderSerializer):
+    """ a root folder with links to its content lists, listing roots costs no query per folder """
+    children = serializers.HyperlinkedIdentityField(view_name='folder-children')
+    documents = serializers.HyperlinkedIdentityField(view_name='folder-documents')
 
-    class Meta:
-        model = Folder
-        fields = ('id', 'name', 'creation_date', 'parent', 'children', 'documents')
+    class Meta(ChildrenFolderSerializer.Meta):
+        fields = ChildrenFolderSerializer.Meta.fields + ('children', 'documents')
 
 
+class FolderSerializer(serializers.ModelSerializer):
+    """ a folder with the first page of its children and documents, the next pages are served by their lists """
+    children = serializers.SerializerMethodField()
+    documents = serializers.SerializerMethodField()
 
+    class Meta:
+        model = Folder
+        fields = ('id', 'name', 'creation_date', 'parent', 'total_size', 'total_documents', 'total_encrypted',
+                  'children', 'documents')
+        read_only_fields = ChildrenFolderSerializer.Meta.read_only_fields
+
+    def first_page(self, queryset, serializer_class, view_name, folder):
+        size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        items, cursor = listing.keyset_page(queryset, size)
+        next_url = None
+        if cursor is not None:
+            next_url = reverse(view_name, args=[folder.id], request=self.context.get('request'))
+            next_url += '?cursor={}'.format(cursor)
+        return {'next': next_url, 'results': serializer_class(items, many=True, context=self.context).data}
+
+    def get_children(self, folder):
+        return self.first_page(folder.children.all(), ChildrenFolderSerializer, 'folder-children', folder)
+
+    def get_documents(self, folder):
+        return self.first_page(folder.documents.all(), DocumentSerializer, 'folder-documents', folder)
@@ -1,3 +1,90 @@
 from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from rest_framework.test import APIClient
+from file_handler.models import Document, Folder
+from jobs.models import Job
+from unittest import mock
 
-# Create your tests here.
+
+class FolderApiTestCase(TestCase):
+    """ Test for the folder endpoints """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('dummy', 'dummy@dummy.com', 'dummy_secret'))
+        self.folder = Folder.objects.create(name='folder')
+        for idx in range(25):
+            Document.objects.create(name='doc_{:02d}'.format(idx), folder=self.folder,
+                                    file=ContentFile(b'content', name='test_api.txt'))
+            Folder.objects.create(name='child_{:02d}'.format(idx), parent=self.folder)
+
+    def test_folder_detail(self):
+        """ Test a folder comes with the first page of its content and links to the next ones """
+        response = self.client.get('/api/folder/{}/'.format(self.folder.id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(10, len(response.data['documents']['results']))
+        self.assertEqual(10, len(response.data['children']['results']))
+        self.assertEqual((25 * len(b'content'), 25, 0), (response.data['total_size'], response.data['total_documents'],
+                                                         response.data['total_encrypted']))
+        self.assertIn('/api/folder/{}/documents/?cursor='.format(self.folder.id), response.data['documents']['next'])
+        names = [document['name'] for document in response.data['documents']['results']]
+        next_url = response.data['documents']['next']
+        while next_url:
+            response = self.client.get(next_url)
+            names += [document['name'] for document in response.data['results']]
+            next_url = response.data['next']
+        self.assertEqual(['doc_{:02d}'.format(idx) for idx in range(25)], names)
+
+    def test_root_folders(self):
+        """ Test listing root folders costs the same queries whatever the number of folders """
+        for idx in range(5):
+            Folder.objects.create(name='root_{}'.format(idx))
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/folder/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(6, response.data['count'])
+        result = next(folder for folder in response.data['results'] if folder['id'] == self.folder.id)
+        self.assertEqual(25, result['total_documents'])
+        self.assertTrue(result['children'].endswith('/api/folder/{}/children/'.format(self.folder.id)))
+        # totals supplied by the client are ignored
+        response = self.client.post('/api/folder/', {'name': 'created', 'total_size': 999, 'total_documents': 7,
+                                                     'total_encrypted': 3})
+        self.assertEqual(201, response.status_code)
+        created = Folder.objects.get(pk=response.data['id'])
+        self.assertTrue(created.is_root_node())
+        self.assertEqual((0, 0, 0), (created.total_size, created.total_documents, created.total_encrypted))
+        response = self.client.patch('/api/folder/{}/'.format(self.folder.id), {'total_documents': 0}, format='json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(25, Folder.objects.get(pk=self.folder.id).total_documents)
+
+    def test_no_file_io(self):
+        """ Test listing documents reads stored metadata and never opens their files """
+        with mock.patch('builtins.open', side_effect=AssertionError('file opened')):
+            response = self.client.get('/api/folder/{}/documents/'.format(self.folder.id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/plain', response.data['results'][0]['file_mime'])
+        self.assertEqual(len(b'content'), response.data['results'][0]['size'])
+
+    def test_folder_lists(self):
+        """ Test sort, filter and cursor validation of the folder content lists """
+        response = self.client.get('/api/folder/{}/children/'.format(self.folder.id), {'sort': '-name', 'q': 'child_1'})
+        self.assertEqual(['child_{}'.format(idx) for idx in range(19, 9, -1)],
+                         [child['name'] for child in response.data['results']])
+        self.assertIsNone(response.data['next'])
+        response = self.client.get('/api/folder/{}/documents/'.format(self.folder.id), {'encrypted': '1'})
+        self.assertEqual([], response.data['results'])
+        response = self.client.get('/api/folder/{}/documents/'.format(self.folder.id), {'cursor': 'garbage'})
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(404, self.client.get('/api/folder/0/documents/').status_code)
+
+    def test_delete(self):
+        """ Test deleting a folder answers at once with the job removing its files """
+        response = self.client.delete('/api/folder/{}/'.format(self.folder.id))
+        self.assertEqual(202, response.status_code)
+        self.assertEqual('reap_files', response.data['kind'])
+        # the files to remove stay in the job row
+        self.assertNotIn('payload', response.data)
+        self.assertEqual(25, len(Job.objects.get(pk=response.data['id']).get_payload()['files']))
+        self.assertEqual(0, Folder.objects.count())
+        self.assertEqual(0, Document.objects.count())
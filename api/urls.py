@@ -5,6 +5,8 @@ from . import views
 urlpatterns = [
     path('folder/', views.RootFolderList.as_view()),
     path('folder/<int:pk>/', views.FolderDetail.as_view()),
+    path('folder/<int:pk>/children/', views.FolderChildren.as_view(), name='folder-children'),
+    path('folder/<int:pk>/documents/', views.FolderDocuments.as_view(), name='folder-documents'),
 ]
 
 urlpatterns += format_suffix_patterns(urlpatterns)
@@ -1,13 +1,44 @@
-from rest_framework import generics
-from file_handler.models import Folder
-from .serializers import FolderSerializer
+from rest_framework import generics, status
+from rest_framework.response import Response
+from django.shortcuts import get_object_or_404
+from file_handler.models import Folder, Document
+from file_handler import listing
+from .serializers import FolderSerializer, ChildrenFolderSerializer, RootFolderSerializer, DocumentSerializer
+from .pagination import KeysetPagination
 
 
 class RootFolderList(generics.ListCreateAPIView):
-    queryset = Folder.root_folders()
-    serializer_class = FolderSerializer
+    """ root folders with their stored totals, like the children of the folder view """
+    queryset = Folder.root_folders().only('id', 'name', 'creation_date', 'total_size', 'total_documents',
+                                          'total_encrypted')
+    serializer_class = RootFolderSerializer
 
 
 class FolderDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = Folder.objects.all()
     serializer_class = FolderSerializer
+
+    def destroy(self, request, *args, **kwargs):
+        """ delete the folder subtree, answer with the job removing its files """
+        job = self.get_object().delete_subtree()
+        return Response(job.as_dict(), status=status.HTTP_202_ACCEPTED)
+
+
+class FolderChildren(generics.ListAPIView):
+    """ children of a folder, paginated by cursor, sort and q (name prefix) parameters """
+    serializer_class = ChildrenFolderSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        folder = get_object_or_404(Folder, pk=self.kwargs['pk'])
+        return listing.filter_folders(folder.children.all(), self.request.query_params)
+
+
+class FolderDocuments(generics.ListAPIView):
+    """ documents of a folder, paginated by cursor, sort, q (name prefix) and encrypted parameters """
+    serializer_class = DocumentSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        folder = get_object_or_404(Folder, pk=self.kwargs['pk'])
+        return listing.filter_documents(Document.objects.filter(folder=folder), self.request.query_params)
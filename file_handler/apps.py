@@ -6,4 +6,5 @@ class FileHandlerConfig(AppConfig):
 
     def ready(self):
         import file_handler.signals
+        import file_handler.tasks
 
@@ -0,0 +1,126 @@
+from django.conf import settings
+import bisect
+import hashlib
+import os
+import tempfile
+
+CHUNK_DIR = 'chunks'
+READ_SIZE = 1024 * 1024
+
+# gear hash table, one pseudo random 32 bit value per byte value
+GEAR = [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:4], 'big') for value in range(256)]
+
+
+def _cut_point(data, minimum, maximum, mask):
+    """ return the length of the chunk starting data, the first position past minimum where the rolling hash matches """
+    end = min(len(data), maximum)
+    if end <= minimum:
+        return end
+    fingerprint = 0
+    position = minimum
+    for value in data[minimum:end]:
+        # each shift pushes a byte out of the 32 bit window
+        fingerprint = ((fingerprint << 1) + GEAR[value]) & 0xFFFFFFFF
+        position += 1
+        if not fingerprint & mask:
+            return position
+    return end
+
+
+def iter_chunks(src, average_size):
+    """
+    yield the content of src cut in chunks at content defined boundaries (gear rolling hash),
+    an insertion only changes the chunks around it. Chunks are between a quarter and four
+    times average_size, which must be a power of two
+    """
+    minimum, maximum = average_size // 4, average_size * 4
+    bits = average_size.bit_length() - 1
+    # the high bits of the fingerprint depend on the whole window
+    mask = ((1 << bits) - 1) << (32 - bits)
+    buffer = b''
+    eof = False
+    while True:
+        while not eof and len(buffer) < maximum:
+            data = src.read(max(READ_SIZE, maximum))
+            eof = not data
+            buffer += data
+        if not buffer:
+            return
+        cut = _cut_point(buffer, minimum, maximum, mask)
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+
+
+def chunk_path(content_hash, root=None):
+    """ return complete path to a stored chunk """
+    root = settings.MEDIA_ROOT if root is None else root
+    return os.path.join(root, CHUNK_DIR, content_hash[:2], content_hash)
+
+
+def store(content_hash, data, root=None):
+    """ write data as the chunk content_hash unless already there, return True if written """
+    path = chunk_path(content_hash, root)
+    if os.path.isfile(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return True
+
+
+def remove(content_hashes, root=None):
+    """ remove stored chunks """
+    for content_hash in content_hashes:
+        path = chunk_path(content_hash, root)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+class ChunkReader:
+    """
+    file like reassembly of a chunk manifest, entries are (offset, size, content hash)
+    tuples ordered by offset. Any range can be read on its own
+    """
+
+    def __init__(self, entries, root=None):
+        self.entries = list(entries)
+        self.offsets = [offset for offset, _, _ in self.entries]
+        self.size = self.entries[-1][0] + self.entries[-1][1] if self.entries else 0
+        self.root = root
+        self.position = 0
+        self.cached = (None, b'')
+
+    def read_chunk(self, index):
+        """ return the content of the chunk at index, the last chunk read is kept for small sequential reads """
+        if self.cached[0] != index:
+            with open(chunk_path(self.entries[index][2], self.root), 'rb') as file:
+                self.cached = (index, file.read())
+        return self.cached[1]
+
+    def iter_range(self, start, stop):
+        """ yield the content between start and stop """
+        stop = min(stop, self.size)
+        if start >= stop:
+            return
+        index = bisect.bisect_right(self.offsets, start) - 1
+        while index < len(self.entries) and self.entries[index][0] < stop:
+            offset = self.entries[index][0]
+            data = self.read_chunk(index)
+            yield data[max(start - offset, 0):stop - offset]
+            index += 1
+
+    def read(self, size=-1):
+        """ read up to size bytes from the current position, chunk by chunk """
+        stop = self.size if size is None or size < 0 else self.position + size
+        data = b''.join(self.iter_range(self.position, stop))
+        self.position += len(data)
+        return data
+
+    def close(self):
+        pass
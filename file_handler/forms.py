@@ -1,5 +1,6 @@
 from django import forms
-from file_handler.models import Document, Folder
+from django.utils.text import get_valid_filename
+from file_handler.models import Document, Folder, Upload
 
 
 class DocumentForm(forms.ModelForm):
@@ -8,6 +9,27 @@ class DocumentForm(forms.ModelForm):
         fields = ('name', 'file', 'folder')
 
 
+class UploadForm(forms.ModelForm):
+    filename = forms.CharField(max_length=200)
+
+    class Meta:
+        model = Upload
+        fields = ('name', 'size')
+
+    def clean_filename(self):
+        # the name ends up in the storage path, it can't point to another directory
+        filename = self.cleaned_data['filename']
+        if '/' in filename or '\\' in filename or '..' in filename or not get_valid_filename(filename):
+            raise forms.ValidationError('Invalid file name')
+        return filename
+
+    def clean_size(self):
+        size = self.cleaned_data['size']
+        if size < 0:
+            raise forms.ValidationError("Size can't be negative")
+        return size
+
+
 class FolderForm(forms.ModelForm):
     class Meta:
         model = Folder
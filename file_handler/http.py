@@ -0,0 +1,118 @@
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_http_date_safe
+import uuid
+
+# more ranges than this are answered with the whole content
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_ranges(header, size):
+    """
+    Return a list of (start, stop) tuples of a byte range header or None if the header
+    is missing or malformed, raise ValueError if no range is satisfiable
+    """
+    if not header or size is None:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes':
+        return None
+    ranges = []
+    for part in spec.split(','):
+        first, sep, last = part.strip().partition('-')
+        if not sep or not (first or last) or not (first + last).isdigit():
+            return None
+        if first:
+            start = int(first)
+            stop = int(last) + 1 if last else size
+            if last and stop <= start:
+                return None
+        else:
+            start = max(size - int(last), 0)
+            stop = size
+        if start < size and stop > start:
+            ranges.append((start, min(stop, size)))
+    if not ranges:
+        raise ValueError('range not satisfiable')
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def if_range_matches(request, etag, last_modified):
+    """ Return True if the If-Range precondition of request holds (or is missing) """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # weak validators never match for ranges
+        return etag is not None and if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified is not None and int(last_modified) == date
+
+
+def read_file(file):
+    """ Return a function yielding blocks of file between start and stop """
+    def read(start, stop):
+        file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            block = file.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    return read
+
+
+def ranged_response(request, read, size, content_type, closing=None, etag=None, last_modified=None):
+    """
+    Return a 206 (single or multipart/byteranges) or 416 response for the Range header of
+    request, None if the whole content should be sent instead. read(start, stop) must yield
+    the content between start and stop, closing is closed once the response is consumed
+    """
+    if not if_range_matches(request, etag, last_modified):
+        return None
+    try:
+        ranges = parse_ranges(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        if closing is not None:
+            closing.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        return response
+    if ranges is None:
+        return None
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response = StreamingHttpResponse(closing_iterator(read(start, stop), closing), status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, stop - 1, size)
+        response['Content-Length'] = stop - start
+        return response
+    boundary = uuid.uuid4().hex
+    parts = []
+    for start, stop in ranges:
+        part_header = '\r\n--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format(
+            boundary, content_type, start, stop - 1, size).encode('ascii')
+        parts.append((part_header, start, stop))
+    epilogue = '\r\n--{}--\r\n'.format(boundary).encode('ascii')
+
+    def multipart():
+        for part_header, start, stop in parts:
+            yield part_header
+            yield from read(start, stop)
+        yield epilogue
+
+    response = StreamingHttpResponse(closing_iterator(multipart(), closing), status=206,
+                                     content_type='multipart/byteranges; boundary={}'.format(boundary))
+    response['Content-Length'] = sum(len(h) + stop - start for h, start, stop in parts) + len(epilogue)
+    return response
+
+
+def closing_iterator(blocks, closing):
+    """ yield from blocks, closing is closed once blocks are exhausted or the iterator is closed """
+    try:
+        yield from blocks
+    finally:
+        if closing is not None:
+            closing.close()
@@ -0,0 +1,70 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+import base64
+import datetime
+import json
+
+# sort parameter -> field, a leading '-' sorts descending, ties are broken by id.
+# Every sort is backed by a (parent, field, id) index of Folder and Document
+SORTS = {'created': 'creation_date', 'name': 'name'}
+DEFAULT_SORT = 'created'
+
+
+def encode_cursor(item, field):
+    """ return the cursor pointing right after item """
+    value = getattr(item, field)
+    if field == 'creation_date':
+        value = value.isoformat()
+    data = json.dumps([value, item.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """ return (value, id) of a cursor, raise ValueError if it is malformed """
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+        if field == 'creation_date':
+            value = parse_datetime(value)
+    except (TypeError, ValueError):
+        raise ValueError('malformed cursor')
+    if not isinstance(value, (str, datetime.datetime)) or not isinstance(pk, int):
+        raise ValueError('malformed cursor')
+    return value, pk
+
+
+def keyset_page(queryset, size, sort=DEFAULT_SORT, cursor=None):
+    """
+    return (items, next cursor) of the page of queryset following cursor, the position is
+    kept as the (sort field, id) of the last item so every page costs one indexed range
+    scan whatever its depth. Raise ValueError on unknown sort or malformed cursor
+    """
+    descending = sort.startswith('-')
+    if sort.lstrip('-') not in SORTS:
+        raise ValueError('unknown sort {}'.format(sort))
+    field = SORTS[sort.lstrip('-')]
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(prefix + field, prefix + 'id')
+    if cursor:
+        value, pk = decode_cursor(cursor, field)
+        lookup = 'lt' if descending else 'gt'
+        queryset = queryset.filter(Q(**{'{}__{}'.format(field, lookup): value}) |
+                                   Q(**{field: value, 'id__{}'.format(lookup): pk}))
+    items = list(queryset[:size + 1])
+    if len(items) > size:
+        return items[:size], encode_cursor(items[size - 1], field)
+    return items, None
+
+
+def filter_folders(queryset, params):
+    """ filter folders by name prefix (q) """
+    if params.get('q'):
+        queryset = queryset.filter(name__startswith=params['q'])
+    return queryset
+
+
+def filter_documents(queryset, params):
+    """ filter documents by name prefix (q) and encryption state (encrypted=1 or 0) """
+    queryset = filter_folders(queryset, params)
+    if params.get('encrypted') in ('0', '1'):
+        queryset = queryset.filter(scheme__isnull=params['encrypted'] == '0')
+    return queryset
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from file_handler.models import Document, Folder
+import os
+
+
+def _read_file_info(document):
+    """ pool task: return (document, (mime type, size)) or (document, None) if the file is unreadable """
+    try:
+        return document, document.read_file_info()
+    except OSError:
+        return document, None
+
+
+class Command(BaseCommand):
+    help = 'Detect and store mime type and size of documents stored before they were recorded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='documents updated per query')
+        parser.add_argument('--workers', type=int, default=None, help='threads reading files, one per CPU by default')
+
+    def handle(self, *args, **options):
+        missing = Document.objects.filter(Q(mime_type='') | Q(size__isnull=True)).exclude(file='')
+        # libmagic and file reads release the GIL, threads read while the batch is saved
+        workers = options['workers'] or os.cpu_count()
+        updated = failed = 0
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                batch = list(missing.filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                # packed documents read their chunk manifest, it's done here on the main connection
+                packed = [(document, document.read_file_info()) for document in batch if document.packed]
+                files = pool.map(_read_file_info, [document for document in batch if not document.packed])
+                documents = []
+                for document, info in packed + list(files):
+                    if info is None:
+                        failed += 1
+                        continue
+                    document.mime_type, document.size = info
+                    documents.append(document)
+                Document.objects.bulk_update(documents, ['mime_type', 'size'])
+                updated += len(documents)
+        if updated:
+            # bulk updates skip the signals keeping folder totals
+            Folder.rebuild_totals()
+        self.stdout.write('Updated {} documents, {} files unreadable'.format(updated, failed))
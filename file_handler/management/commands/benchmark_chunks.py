@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from file_handler import chunks
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+
+
+class Command(BaseCommand):
+    help = 'Measure chunk store savings and throughput on synthetic versions of a file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=32, help='size of the first version in MB')
+        parser.add_argument('--versions', type=int, default=5, help='number of versions')
+        parser.add_argument('--edits', type=int, default=8, help='random inserts, deletes or overwrites per version')
+        parser.add_argument('--edit-size', type=int, default=64, help='size of every edit in KB')
+        parser.add_argument('--average-size', default='64,256,1024', help='comma separated average chunk sizes in KB')
+
+    def versions(self, options):
+        """ return the synthetic versions, each one a few edits away from the previous one """
+        rng = random.Random(0)
+        data = os.urandom(options['size'] * 2**20)
+        versions = [data]
+        edit_size = options['edit_size'] * 1024
+        for _ in range(options['versions'] - 1):
+            for _ in range(options['edits']):
+                position = rng.randrange(len(data))
+                kind = rng.choice(('insert', 'delete', 'overwrite'))
+                if kind == 'insert':
+                    data = data[:position] + os.urandom(edit_size) + data[position:]
+                elif kind == 'delete':
+                    data = data[:position] + data[position + edit_size:]
+                else:
+                    data = data[:position] + os.urandom(edit_size) + data[position + edit_size:]
+            versions.append(data)
+        return versions
+
+    def handle(self, *args, **options):
+        versions = self.versions(options)
+        total = sum(len(version) for version in versions)
+        self.stdout.write('{} versions, {:.1f} MB in total, rates in MB/s'.format(len(versions), total / 2**20))
+        self.stdout.write('{:>10} {:>8} {:>12} {:>8} {:>10} {:>10}'.format(
+            'avg chunk', 'chunks', 'stored MB', 'saved', 'upload', 'download'))
+        for average_size in (int(value) * 1024 for value in options['average_size'].split(',')):
+            root = tempfile.mkdtemp()
+            try:
+                manifests = []
+                stored = 0
+                start = time.perf_counter()
+                for version in versions:
+                    entries = []
+                    offset = 0
+                    for data in chunks.iter_chunks(io.BytesIO(version), average_size):
+                        content_hash = hashlib.sha256(data).hexdigest()
+                        if chunks.store(content_hash, data, root):
+                            stored += len(data)
+                        entries.append((offset, len(data), content_hash))
+                        offset += len(data)
+                    manifests.append(entries)
+                upload = total / 2**20 / (time.perf_counter() - start)
+                start = time.perf_counter()
+                for version, entries in zip(versions, manifests):
+                    reader = chunks.ChunkReader(entries, root)
+                    assert b''.join(reader.iter_range(0, reader.size)) == version
+                download = total / 2**20 / (time.perf_counter() - start)
+                self.stdout.write('{:>7} KB {:>8} {:>12.1f} {:>7.1f}% {:>10.1f} {:>10.1f}'.format(
+                    average_size // 1024, sum(len(entries) for entries in manifests), stored / 2**20,
+                    100 * (1 - stored / total), upload, download))
+            finally:
+                shutil.rmtree(root)
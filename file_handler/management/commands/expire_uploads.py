@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from file_handler.models import Upload
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable uploads that expired and their partial files'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Deleted {} expired uploads'.format(Upload.delete_expired()))
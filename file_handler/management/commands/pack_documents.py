@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from file_handler.models import Document, Folder
+
+
+class Command(BaseCommand):
+    help = 'Move plaintext documents to the chunk store (or back to files with --unpack)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--folder', type=int, help='only documents of this folder subtree')
+        parser.add_argument('--unpack', action='store_true', help='store packed documents as files again')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(packed=options['unpack'])
+        if not options['unpack']:
+            documents = documents.filter(scheme__isnull=True)
+        if options['folder'] is not None:
+            folder = Folder.objects.get(pk=options['folder'])
+            documents = documents.filter(folder__in=folder.get_descendants(include_self=True))
+        count = written = 0
+        for document in documents.iterator():
+            if options['unpack']:
+                document.unpack()
+            else:
+                written += document.pack()
+            count += 1
+        if options['unpack']:
+            self.stdout.write('Unpacked {} documents'.format(count))
+        else:
+            self.stdout.write('Packed {} documents, {} new bytes stored'.format(count, written))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from file_handler.models import Folder
+
+
+class Command(BaseCommand):
+    help = 'Recompute folder size and document totals from the documents they contain'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = Folder.rebuild_totals()
+        self.stdout.write('Fixed totals of {} folders'.format(changed))
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:59
+
+from django.conf import settings
+from django.db import migrations, models
+import hashlib
+import os
+
+
+def hash_documents(apps, schema_editor):
+    """ compute content hash of existing documents """
+    Document = apps.get_model('file_handler', 'Document')
+    for document in Document.objects.exclude(file=''):
+        path = settings.MEDIA_ROOT + document.file.name
+        if not os.path.isfile(path):
+            continue
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                hasher.update(chunk)
+        Document.objects.filter(pk=document.pk).update(content_hash=hasher.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_handler', '0003_document_scheme'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(hash_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_handler', '0004_document_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('file_name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('creation_date', models.DateTimeField(blank=True, default=django.utils.timezone.now)),
+                ('folder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='file_handler.Folder')),
+            ],
+        ),
+    ]
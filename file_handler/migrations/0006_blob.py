@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:28
+
+from django.db import migrations, models
+import django.utils.timezone
+import file_handler.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_handler', '0005_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('creation_date', models.DateTimeField(blank=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(max_length=255, storage=file_handler.storage.ContentAddressedStorage(), upload_to='documents/%Y/%m/%d/'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_handler', '0007_chunk_store'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['folder', 'creation_date', 'id'], name='document_folder_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['folder', 'name', 'id'], name='document_folder_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['parent', 'creation_date', 'id'], name='folder_parent_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['parent', 'name', 'id'], name='folder_parent_name_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    """ compute the totals of existing folders, each folder sums the documents of its lft/rght range """
+    Folder = apps.get_model('file_handler', 'Folder')
+    Document = apps.get_model('file_handler', 'Document')
+    subtree = Document.objects.filter(folder__tree_id=OuterRef('tree_id'), folder__lft__gte=OuterRef('lft'),
+                                      folder__lft__lte=OuterRef('rght')).order_by().values('folder__tree_id')
+
+    def total(aggregate):
+        return Coalesce(Subquery(subtree.annotate(total=aggregate).values('total')), 0)
+
+    folders = list(Folder.objects.annotate(subtree_size=total(Sum('size')), subtree_documents=total(Count('id')),
+                                           subtree_encrypted=total(Count('scheme'))))
+    for folder in folders:
+        folder.total_size, folder.total_documents, folder.total_encrypted = (
+            folder.subtree_size, folder.subtree_documents, folder.subtree_encrypted)
+    Folder.objects.bulk_update(folders, ['total_size', 'total_documents', 'total_encrypted'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_handler', '0009_document_file_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='total_documents',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='total_encrypted',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='total_size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
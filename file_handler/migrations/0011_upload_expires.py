@@ -0,0 +1,19 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:00
+
+from django.db import migrations, models
+import file_handler.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_handler', '0010_folder_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='expires',
+            field=models.DateTimeField(db_index=True, default=file_handler.models.upload_expiry),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:11
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_creation_date(apps, schema_editor):
+    """ existing documents were last modified when created as far as we know """
+    Document = apps.get_model('file_handler', 'Document')
+    Document.objects.update(modified=F('creation_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_handler', '0011_upload_expires'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_creation_date, migrations.RunPython.noop),
+    ]
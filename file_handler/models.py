@@ -1,20 +1,47 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.conf import settings
 from mptt.models import MPTTModel, TreeForeignKey
-from shared_secret.models import ShamirSS
+from shared_secret.models import FileOperation, ShamirSS
+from jobs.models import Job
+from .storage import ContentAddressedStorage
+from . import chunks
+from collections import Counter
+from django.core.files import File
+import datetime
 import os
+import uuid
+import hashlib
 import magic
 
+# bytes of the content libmagic looks at to detect the mime type
+MIME_SNIFF_SIZE = 2048
+
 
 class Folder(MPTTModel):
     name = models.CharField(max_length=200)
     creation_date = models.DateTimeField(default=timezone.now, blank=True)
     parent = TreeForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+    # totals of the whole subtree, kept up to date by file_handler.signals (see rebuild_totals)
+    total_size = models.BigIntegerField(default=0)
+    total_documents = models.PositiveIntegerField(default=0)
+    total_encrypted = models.PositiveIntegerField(default=0)
+
+    TOTALS = ('total_size', 'total_documents', 'total_encrypted')
+    _moving = False
 
     class MPTTMeta:
         order_insertion_by = ['id']
 
+    class Meta:
+        # keyset pagination of children (see listing.py)
+        indexes = [
+            models.Index(fields=['parent', 'creation_date', 'id'], name='folder_parent_created_idx'),
+            models.Index(fields=['parent', 'name', 'id'], name='folder_parent_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -27,17 +54,199 @@ class Folder(MPTTModel):
         """ Return true if the folder is empty """
         return self.is_leaf_node() and self.documents.count() == 0
 
+    def save(self, *args, **kwargs):
+        """
+        Save the folder, totals are only written by update_totals so a stale instance never
+        overwrites them, and a subtree moved to another parent takes its totals along
+        """
+        stored = Folder.objects.filter(pk=self.pk).values('parent_id').first() if self.pk else None
+        if stored is None:
+            return super().save(*args, **kwargs)
+        # move_to has already moved the tree and the totals when it saves the node
+        moved = self._moving or stored['parent_id'] != self.parent_id
+        if kwargs.get('update_fields') is None:
+            opts = self._mptt_meta
+            skipped = set(self.TOTALS)
+            if not moved:
+                # like mptt, tree fields of a node that didn't move are left alone
+                skipped.update((opts.left_attr, opts.right_attr, opts.tree_id_attr, opts.level_attr))
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in skipped]
+        if self._moving or not moved:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            self._add_subtree_totals(-1)
+            super().save(*args, **kwargs)
+            self._add_subtree_totals(1)
+
+    def move_to(self, target, position='first-child'):
+        """ Move the folder in the tree, the totals of the subtree leave the old ancestors for the new ones """
+        with transaction.atomic():
+            self._add_subtree_totals(-1)
+            self._moving = True
+            try:
+                super().move_to(target, position)
+            finally:
+                self._moving = False
+            self._add_subtree_totals(1)
+
+    def delete_subtree(self, payload=None):
+        """
+        Delete the folder and everything below it with range deletes over its lft/rght interval
+        in one transaction, the files are removed afterwards by the returned reap_files job
+        (payload is added to the job payload)
+        """
+        with transaction.atomic():
+            node = Folder.objects.select_for_update().get(pk=self.pk)
+            self._add_subtree_totals(-1)
+            folders = Folder.objects.filter(tree_id=node.tree_id, lft__gte=node.lft, rght__lte=node.rght)
+            documents = Document.objects.filter(folder__in=folders)
+            files = list(documents.filter(packed=False).exclude(file='').values_list('file', flat=True))
+            manifests = DocumentChunk.objects.filter(document__in=documents)
+            counts = Counter(manifests.values_list('chunk_id', flat=True))
+            manifests.delete()
+            content_hashes = Chunk.release(counts, remove=False)
+            FileOperation.objects.filter(document__in=documents).update(document=None)
+            Upload.objects.filter(folder__in=folders).delete()
+            # the document signal receivers would make the collector load and delete rows one by one,
+            # what they do is done above for the whole subtree
+            documents._raw_delete(documents.db)
+            folders._raw_delete(folders.db)
+            # close the gap left in the tree like mptt does
+            width = node.rght - node.lft + 1
+            Folder.objects.filter(tree_id=node.tree_id, lft__gt=node.rght).update(lft=F('lft') - width)
+            Folder.objects.filter(tree_id=node.tree_id, rght__gt=node.rght).update(rght=F('rght') - width)
+            payload = dict(payload or {}, files=files, chunks=content_hashes)
+            return Job.enqueue('reap_files', payload)
+
+    def _add_subtree_totals(self, sign):
+        """ add (sign 1) or remove (sign -1) the stored totals of the folder to those of its current ancestors """
+        size, documents, encrypted = Folder.objects.values_list(
+            'total_size', 'total_documents', 'total_encrypted').get(pk=self.pk)
+        Folder.update_totals(self.pk, sign * size, sign * documents, sign * encrypted, include_self=False)
+
+    @staticmethod
+    def update_totals(folder_id, size=0, documents=0, encrypted=0, include_self=True):
+        """ add to the totals of a folder and of all its ancestors in one update """
+        if folder_id is None or not (size or documents or encrypted):
+            return
+        node = Folder.objects.filter(pk=folder_id).values('tree_id', 'lft', 'rght').first()
+        if node is None:
+            return
+        folders = Folder.objects.filter(tree_id=node['tree_id'], lft__lte=node['lft'], rght__gte=node['rght'])
+        if not include_self:
+            folders = folders.exclude(pk=folder_id)
+        folders.update(total_size=F('total_size') + size, total_documents=F('total_documents') + documents,
+                       total_encrypted=F('total_encrypted') + encrypted)
+
+    @staticmethod
+    def rebuild_totals():
+        """
+        recompute the totals of every folder from its documents, each folder sums the documents
+        of its lft/rght range, return the number of folders whose totals were wrong
+        """
+        subtree = Document.objects.filter(folder__tree_id=OuterRef('tree_id'), folder__lft__gte=OuterRef('lft'),
+                                          folder__lft__lte=OuterRef('rght')).order_by().values('folder__tree_id')
+
+        def total(aggregate):
+            return Coalesce(Subquery(subtree.annotate(total=aggregate).values('total')), 0)
+
+        folders = Folder.objects.annotate(subtree_size=total(Sum('size')), subtree_documents=total(Count('id')),
+                                          subtree_encrypted=total(Count('scheme')))
+        changed = []
+        for folder in folders:
+            totals = folder.subtree_size, folder.subtree_documents, folder.subtree_encrypted
+            if (folder.total_size, folder.total_documents, folder.total_encrypted) != totals:
+                folder.total_size, folder.total_documents, folder.total_encrypted = totals
+                changed.append(folder)
+        Folder.objects.bulk_update(changed, ['total_size', 'total_documents', 'total_encrypted'], batch_size=500)
+        return len(changed)
+
 
 class Document(models.Model):
     name = models.CharField(max_length=200)
-    file = models.FileField(upload_to='documents/%Y/%m/%d/')
+    file = models.FileField(upload_to='documents/%Y/%m/%d/', storage=ContentAddressedStorage(), max_length=255)
     creation_date = models.DateTimeField(default=timezone.now, blank=True)
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, null=True, related_name='documents')
     scheme = models.ForeignKey(ShamirSS, on_delete=models.CASCADE, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    # the content lives in the chunk store, file only keeps the name
+    packed = models.BooleanField(default=False)
+    # detected when the file is stored, listings never touch the file
+    mime_type = models.CharField(max_length=255, blank=True, default='')
+    size = models.BigIntegerField(null=True, blank=True)
+    # changed with the stored content (replacement, packing), downloads send it as Last-Modified
+    modified = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # keyset pagination of folder content (see listing.py)
+        indexes = [
+            models.Index(fields=['folder', 'creation_date', 'id'], name='document_folder_created_idx'),
+            models.Index(fields=['folder', 'name', 'id'], name='document_folder_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.file and not self.file._committed:
+            # the mime type comes from the first bytes of the upload
+            self.mime_type = self.sniff_mime(self.file.file)
+            self.size = self.file.size
+            # store the upload first, the storage hashes it while it streams in
+            self.file.save(self.file.name, self.file.file, save=False)
+            self.content_hash = ''
+        if self.file and not self.content_hash:
+            self.content_hash = self.compute_hash()
+        if self.file and self.size is None:
+            self.update_file_info()
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def sniff_mime(file):
+        """ Return the mime type of the first bytes of file, the position is restored """
+        file.seek(0)
+        head = file.read(MIME_SNIFF_SIZE)
+        file.seek(0)
+        return magic.from_buffer(head.encode('utf-8') if isinstance(head, str) else head, mime=True)
+
+    def read_file_info(self):
+        """ Return (mime type, size) of the stored content """
+        if self.packed:
+            reader = self.open_content()
+            return magic.from_buffer(reader.read(MIME_SNIFF_SIZE), mime=True), reader.size
+        with open(self.file_path(), 'rb') as file:
+            return self.sniff_mime(file), os.fstat(file.fileno()).st_size
+
+    def totals(self):
+        """ Return what the document adds to the totals of its folders: (size, documents, encrypted) """
+        return self.size or 0, 1, 1 if self.scheme_id is not None else 0
+
+    def update_file_info(self):
+        """ Detect mime type and size again after the stored file has been replaced """
+        self.mime_type, self.size = self.read_file_info()
+
+    def compute_hash(self):
+        """ Return sha256 hex digest of the file content """
+        content_hash = self.file.storage.content_hash(self.file.name)
+        if content_hash is not None:
+            return content_hash
+        hasher = hashlib.sha256()
+        for chunk in self.file.chunks():
+            hasher.update(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if self.file._committed:
+            self.file.close()
+        return hasher.hexdigest()
+
+    def update_content_hash(self):
+        """ Recompute the content hash after the stored file has been replaced """
+        self.content_hash = ''
+        self.content_hash = self.compute_hash()
+
+    def etag(self):
+        """ Return a strong ETag for the stored file or None if its hash is unknown """
+        return '"{}"'.format(self.content_hash) if self.content_hash else None
+
     def file_url(self):
         """ Return static path to the file """
         return settings.MEDIA_URL + self.file.name
@@ -51,5 +260,177 @@ class Document(models.Model):
         return os.path.basename(self.file.name)
 
     def file_mime(self):
-        """ Return file mime type """
-        return magic.from_file(settings.MEDIA_ROOT + self.file.name, mime=True)
+        """ Return file mime type, detected from the file for rows stored before it was recorded """
+        return self.mime_type or self.read_file_info()[0]
+
+    def open_content(self):
+        """ Return a reader over the chunks of a packed document """
+        entries = self.chunks.order_by('position').values_list('offset', 'chunk__size', 'chunk__content_hash')
+        return chunks.ChunkReader(entries)
+
+    def pack(self):
+        """
+        move the content of a plaintext document to the chunk store, only chunks not stored
+        yet are written, the file is released once committed. Return the bytes written.
+        The file is cut before locking the row (the rolling hash runs at a few MB/s), the lock
+        only covers storing the chunks and the swap
+        """
+        written = 0
+        current = Document.objects.get(pk=self.pk)
+        if current.packed or current.scheme_id is not None or not current.file:
+            return written
+        cuts = []
+        offset = 0
+        with open(current.file_path(), 'rb') as file:
+            for data in chunks.iter_chunks(file, settings.CHUNK_AVERAGE_SIZE):
+                cuts.append((hashlib.sha256(data).hexdigest(), offset, len(data)))
+                offset += len(data)
+        with transaction.atomic():
+            locked = Document.objects.select_for_update().get(pk=self.pk)
+            # file names are content addressed, the same name is the same content
+            if locked.packed or locked.scheme_id is not None or locked.file.name != current.file.name:
+                return written
+            entries = []
+            with open(locked.file_path(), 'rb') as file:
+                for position, (content_hash, offset, size) in enumerate(cuts):
+                    chunk, _ = Chunk.objects.get_or_create(content_hash=content_hash, defaults={'size': size})
+                    if not os.path.isfile(chunks.chunk_path(content_hash)):
+                        file.seek(offset)
+                        if chunks.store(content_hash, file.read(size)):
+                            written += size
+                    entries.append(DocumentChunk(document=locked, chunk=chunk, position=position, offset=offset))
+            DocumentChunk.objects.bulk_create(entries)
+            Chunk.acquire(Counter(entry.chunk_id for entry in entries))
+            locked.packed = True
+            locked.modified = timezone.now()
+            locked.save(update_fields=['packed', 'modified'])
+            name = locked.file.name
+            transaction.on_commit(lambda: locked.file.storage.delete(name))
+        self.refresh_from_db()
+        return written
+
+    def unpack(self):
+        """ store the content of a packed document as a file again """
+        with transaction.atomic():
+            locked = Document.objects.select_for_update().get(pk=self.pk)
+            if not locked.packed:
+                return
+            content = File(locked.open_content(), name=locked.filename())
+            locked.file.name = locked.file.storage.save(locked.file.name, content)
+            locked.release_chunks()
+            locked.packed = False
+            locked.modified = timezone.now()
+            locked.save(update_fields=['file', 'packed', 'modified'])
+        self.refresh_from_db()
+
+    def release_chunks(self):
+        """ drop the manifest of a packed document, chunks no longer used are removed once committed """
+        counts = Counter(self.chunks.values_list('chunk_id', flat=True))
+        self.chunks.all().delete()
+        Chunk.release(counts)
+
+
+class Blob(models.Model):
+    """ A distinct file content kept by the content addressed storage, refcount counts the files linked to it """
+    content_hash = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    creation_date = models.DateTimeField(default=timezone.now, blank=True)
+
+    def __str__(self):
+        return self.content_hash
+
+
+class Chunk(models.Model):
+    """ A piece of content in the chunk store, refcount counts the manifest entries using it """
+    content_hash = models.CharField(max_length=64, unique=True)
+    size = models.PositiveIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.content_hash
+
+    @staticmethod
+    def _group(counts):
+        """ return {count: [chunk ids]} of a chunk id -> count mapping, one update per distinct count """
+        groups = {}
+        for chunk_id, count in counts.items():
+            groups.setdefault(count, []).append(chunk_id)
+        return groups
+
+    @classmethod
+    def acquire(cls, counts):
+        """ add references to chunks, counts maps chunk id to the number of new references """
+        for count, ids in cls._group(counts).items():
+            cls.objects.filter(pk__in=ids).update(refcount=F('refcount') + count)
+
+    @classmethod
+    def release(cls, counts, remove=True):
+        """
+        drop references to chunks, the unused ones are deleted and their data removed once committed,
+        or left to the caller (remove=False). Return the content hashes of the unused chunks
+        """
+        for count, ids in cls._group(counts).items():
+            cls.objects.filter(pk__in=ids).update(refcount=F('refcount') - count)
+        unused = cls.objects.filter(pk__in=list(counts), refcount=0)
+        content_hashes = list(unused.values_list('content_hash', flat=True))
+        unused.delete()
+        if remove:
+            transaction.on_commit(lambda: chunks.remove(content_hashes))
+        return content_hashes
+
+
+class DocumentChunk(models.Model):
+    """ An entry of the chunk manifest of a packed document """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+    chunk = models.ForeignKey(Chunk, on_delete=models.PROTECT, related_name='+')
+    position = models.PositiveIntegerField()
+    offset = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('document', 'position')
+
+
+def upload_expiry():
+    """ return when an upload receiving a chunk now expires """
+    return timezone.now() + datetime.timedelta(seconds=settings.UPLOAD_EXPIRY)
+
+
+class Upload(models.Model):
+    """ A resumable upload, chunks are appended to the reserved file until the document is finalized """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=200)
+    file_name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='uploads')
+    creation_date = models.DateTimeField(default=timezone.now, blank=True)
+    # pushed back by every chunk, expired uploads are deleted by delete_expired
+    expires = models.DateTimeField(default=upload_expiry, db_index=True)
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def active():
+        """ Return the uploads that didn't expire """
+        return Upload.objects.filter(expires__gt=timezone.now())
+
+    @staticmethod
+    def delete_expired():
+        """ Delete expired uploads, their partial files go with them, return how many were deleted """
+        return Upload.objects.filter(expires__lte=timezone.now()).delete()[1].get(Upload._meta.label, 0)
+
+    def file_path(self):
+        """ Return complete path to the partial file """
+        return settings.MEDIA_ROOT + self.file_name
+
+    @staticmethod
+    def reserve_file(filename):
+        """ Create the empty file where a document named filename will be stored, return its name """
+        field = Document._meta.get_field('file')
+        return field.storage.reserve(field.generate_filename(None, filename), max_length=field.max_length)
+
+    def is_complete(self):
+        """ Return true if every byte has been received """
+        return self.offset == self.size
@@ -1,11 +1,63 @@
-from django.db.models.signals import post_delete
-from .models import Document
+from django.db.models.signals import post_delete, pre_delete, post_save, pre_save
+from .models import Document, Folder, Upload
 from django.dispatch import receiver
 import os
 
 
 @receiver(post_delete, sender=Document)
 def delete_file(instance, **kwargs):
-    """ delete file physically after removal from db """
-    file_name = instance.file_path()
-    os.remove(file_name)
+    """ drop the file reference of a document after removal from db, shared content is kept for the others """
+    if instance.file and not instance.packed:
+        instance.file.storage.delete(instance.file.name)
+
+
+@receiver(pre_delete, sender=Document)
+def release_chunks(instance, **kwargs):
+    """ drop the chunk references of a packed document before its manifest goes away """
+    if instance.packed:
+        instance.release_chunks()
+
+
+@receiver(post_delete, sender=Upload)
+def delete_partial_file(instance, **kwargs):
+    """ delete the partial file of an abandoned upload """
+    if Document.objects.filter(file=instance.file_name).exists():
+        return
+    if os.path.isfile(instance.file_path()):
+        os.remove(instance.file_path())
+
+
+@receiver(pre_save, sender=Document)
+def remember_totals(instance, update_fields=None, **kwargs):
+    """ remember what the stored row adds to the folder totals, compared once saved """
+    instance._stored_totals = None
+    if instance.pk is None or (update_fields is not None and
+                               not {'folder', 'size', 'scheme'}.intersection(update_fields)):
+        instance._stored_totals = instance.folder_id, instance.totals()
+        return
+    row = Document.objects.filter(pk=instance.pk).values('folder_id', 'size', 'scheme_id').first()
+    if row is not None:
+        stored = Document(folder_id=row['folder_id'], size=row['size'], scheme_id=row['scheme_id'])
+        instance._stored_totals = row['folder_id'], stored.totals()
+
+
+@receiver(post_save, sender=Document)
+def update_totals(instance, created, **kwargs):
+    """ move what the document adds to the folder totals from its old state to the new one """
+    current = instance.folder_id, instance.totals()
+    stored = None if created else getattr(instance, '_stored_totals', None)
+    if stored == current:
+        return
+    if stored is not None:
+        folder_id, (size, documents, encrypted) = stored
+        Folder.update_totals(folder_id, -size, -documents, -encrypted)
+    folder_id, (size, documents, encrypted) = current
+    Folder.update_totals(folder_id, size, documents, encrypted)
+
+
+@receiver(pre_delete, sender=Document)
+def remove_from_totals(instance, **kwargs):
+    """ remove a deleted document from the totals of its folders """
+    size, documents, encrypted = instance.totals()
+    Folder.update_totals(instance.folder_id, -size, -documents, -encrypted)
+
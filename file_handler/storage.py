@@ -0,0 +1,137 @@
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+import hashlib
+import os
+import re
+import tempfile
+
+CAS_DIR = 'cas'
+READ_SIZE = 64 * 2**10
+MAX_NAME_LENGTH = 255
+_REFERENCE = re.compile(r'^{}/[0-9a-f]{{2}}/([0-9a-f]{{64}})/[^/]+$'.format(CAS_DIR))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage keeping a single copy of every distinct content. Uploads are hashed
+    while they stream in, the data is stored once as cas/<h[:2]>/<h>.blob and every saved file is a
+    hard link to it named cas/<h[:2]>/<h>/<filename>. Blob rows count the links, deleting a
+    file drops one reference and the data goes away with the last one. Files not created
+    by this storage (older documents, encrypted outputs) are handled as plain files
+    """
+
+    def blob_path(self, content_hash):
+        """ Return complete path to the data of a blob """
+        return self.path('{}/{}/{}.blob'.format(CAS_DIR, content_hash[:2], content_hash))
+
+    def content_hash(self, name):
+        """ Return the content hash of the blob name links to or None if name is not a reference """
+        match = _REFERENCE.match(name or '')
+        if match is None:
+            return None
+        try:
+            if os.path.samefile(self.path(name), self.blob_path(match.group(1))):
+                return match.group(1)
+        except OSError:
+            pass
+        return None
+
+    def _save(self, name, content):
+        directory = self.path(os.path.join(CAS_DIR, 'tmp'))
+        os.makedirs(directory, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    chunk = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                    hasher.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+            return self._add_reference(hasher.hexdigest(), size, temp_path, os.path.basename(name))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def ingest(self, name):
+        """ Move a file written outside of the storage into its blob, return the new name """
+        path = self.path(name)
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(READ_SIZE), b''):
+                hasher.update(chunk)
+        new_name = self._add_reference(hasher.hexdigest(), os.path.getsize(path), path, os.path.basename(name))
+        if os.path.exists(path):
+            os.remove(path)
+        return new_name
+
+    def _add_reference(self, content_hash, size, data_path, filename):
+        """ store data_path as the blob of content_hash unless already there, link a new name to it """
+        from .models import Blob
+        blob_path = self.blob_path(content_hash)
+        with transaction.atomic():
+            blob, _ = Blob.objects.select_for_update().get_or_create(
+                content_hash=content_hash, defaults={'size': size})
+            if not os.path.isfile(blob_path):
+                # first copy of this content, the temporary file becomes the blob
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(data_path, blob_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(blob_path, self.file_permissions_mode)
+            name = self._link(blob_path, '{}/{}/{}/{}'.format(CAS_DIR, content_hash[:2], content_hash, filename))
+            Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+        return name
+
+    def reserve(self, name, max_length=MAX_NAME_LENGTH):
+        """ Create an empty file at the first available variant of name, return it. The name is ours until deleted """
+        while True:
+            name = self.get_available_name(name, max_length=max_length)
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                open(path, 'xb').close()
+                return name
+            except FileExistsError:
+                # another writer took the name in the meantime
+                continue
+
+    def _link(self, blob_path, name):
+        """ hard link blob_path to the first available variant of name, return it """
+        while True:
+            name = self.get_available_name(name, max_length=MAX_NAME_LENGTH)
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(blob_path, path)
+                return name
+            except FileExistsError:
+                # another save took the name in the meantime
+                continue
+
+    def delete(self, name):
+        """ Drop the reference held by name, the blob data is removed with its last reference """
+        from .models import Blob
+        match = _REFERENCE.match(name or '')
+        if match is None:
+            return super().delete(name)
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(content_hash=match.group(1)).first()
+            if blob is None or self.content_hash(name) is None:
+                return super().delete(name)
+            super().delete(name)
+            if blob.refcount > 1:
+                Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            blob_path = self.blob_path(blob.content_hash)
+            if os.path.isfile(blob_path):
+                os.remove(blob_path)
+        try:
+            os.rmdir(os.path.dirname(self.path(name)))
+        except OSError:
+            # other files still live next to it
+            pass
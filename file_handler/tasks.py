@@ -0,0 +1,35 @@
+from jobs.registry import register, on_startup
+from .models import Chunk, Document, Upload
+from . import chunks
+
+
+@on_startup
+def expire_uploads():
+    """ delete resumable uploads abandoned for UPLOAD_EXPIRY seconds and their partial files """
+    deleted = Upload.delete_expired()
+    if deleted:
+        return 'Deleted {} expired uploads'.format(deleted)
+
+
+@register('pack')
+def pack(job):
+    """ move the content of a document to the chunk store """
+    payload = job.get_payload()
+    document = Document.objects.get(pk=payload['document'])
+    return {'document': document.id, 'written': document.pack()}
+
+
+@register('reap_files')
+def reap_files(job):
+    """ remove the files of documents deleted by Folder.delete_subtree, running it again is harmless """
+    payload = job.get_payload()
+    storage = Document._meta.get_field('file').storage
+    total = len(payload['files'])
+    for done, name in enumerate(payload['files'], 1):
+        # content shared with other documents only loses a reference
+        storage.delete(name)
+        job.set_progress(done, total)
+    # chunks stored again since the deletion are in use
+    stored = set(Chunk.objects.filter(content_hash__in=payload['chunks']).values_list('content_hash', flat=True))
+    chunks.remove([content_hash for content_hash in payload['chunks'] if content_hash not in stored])
+    return {'files': total, 'chunks': len(payload['chunks'])}
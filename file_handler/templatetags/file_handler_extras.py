@@ -4,6 +4,8 @@ register = template.Library()
 
 
 @register.inclusion_tag('breadcrumb.html')
-def breadcrumb(folder):
-    ancestors = folder.get_ancestors(include_self=True) if folder is not None else []
+def breadcrumb(folder, ancestors=None):
+    """ path from the root to folder, ancestors (including folder) can be given when already fetched """
+    if ancestors is None:
+        ancestors = folder.get_ancestors(include_self=True) if folder is not None else []
     return {'ancestors': ancestors}
@@ -0,0 +1,117 @@
+from django.test import TestCase, SimpleTestCase
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from file_handler.models import Chunk, Document, DocumentChunk, Folder
+from file_handler import chunks
+from jobs.models import Job
+from unittest import mock
+import io
+import random
+
+
+def random_bytes(size, seed=0):
+    """ return reproducible random bytes, chunk boundaries don't change between runs """
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'big')
+
+
+class ChunkingTestCase(SimpleTestCase):
+    """ Test for content defined chunking """
+
+    AVERAGE_SIZE = 4096
+
+    def chunk(self, data):
+        return list(chunks.iter_chunks(io.BytesIO(data), self.AVERAGE_SIZE))
+
+    def test_boundaries(self):
+        """ Test chunks cover the content and respect the size bounds """
+        self.assertEqual([], self.chunk(b''))
+        data = random_bytes(self.AVERAGE_SIZE * 64)
+        pieces = self.chunk(data)
+        self.assertEqual(data, b''.join(pieces))
+        for piece in pieces[:-1]:
+            self.assertGreaterEqual(len(piece), self.AVERAGE_SIZE // 4)
+            self.assertLessEqual(len(piece), self.AVERAGE_SIZE * 4)
+        # content without boundaries is cut at the maximum size
+        self.assertEqual([self.AVERAGE_SIZE * 4] * 2, [len(piece) for piece in self.chunk(bytes(self.AVERAGE_SIZE * 8))])
+
+    def test_insertion(self):
+        """ Test an insertion only changes the chunks around it """
+        data = random_bytes(self.AVERAGE_SIZE * 64)
+        edited = data[:len(data) // 2] + b'inserted' + data[len(data) // 2:]
+        before, after = self.chunk(data), self.chunk(edited)
+        self.assertLessEqual(len(set(after) - set(before)), 2)
+
+
+class PackedDocumentTestCase(TestCase):
+    """ Test for documents stored in the chunk store """
+
+    def setUp(self):
+        self.folder = Folder.objects.create(name='test_folder')
+        self.data = random_bytes(256 * 1024)
+
+    def create(self, name, data):
+        return Document.objects.create(name=name, folder=self.folder, file=ContentFile(data, name=name))
+
+    def test_pack(self):
+        """ Test a new version only stores the chunks that changed and the content reads back """
+        # content of its own, chunks of other tests stay on disk until their transaction commits
+        self.data = random_bytes(256 * 1024, seed=1)
+        with self.settings(CHUNK_AVERAGE_SIZE=8192):
+            first = self.create('version_1.bin', self.data)
+            written = first.pack()
+            second = self.create('version_2.bin', self.data[:1000] + b'changed' + self.data[1000:])
+            written_again = second.pack()
+        self.assertTrue(first.packed)
+        self.assertEqual(len(self.data), written)
+        self.assertLess(written_again, len(self.data) // 4)
+        self.assertEqual(0, first.pack())
+        self.assertEqual(self.data, first.open_content().read())
+        self.assertEqual(self.data[5000:70000], b''.join(first.open_content().iter_range(5000, 70000)))
+        self.assertEqual('application/octet-stream', first.file_mime())
+        shared = Chunk.objects.filter(refcount=2).count()
+        self.assertGreater(shared, 0)
+        # deleting a version only drops its references
+        second.delete()
+        self.assertEqual(0, Chunk.objects.filter(refcount=2).count())
+        self.assertEqual(first.chunks.count(), Chunk.objects.count())
+        first.unpack()
+        self.assertFalse(first.packed)
+        self.assertEqual(0, Chunk.objects.count())
+        self.assertEqual(0, DocumentChunk.objects.count())
+        with open(first.file_path(), 'rb') as file:
+            self.assertEqual(self.data, file.read())
+        first.delete()
+
+    def test_pack_replaced(self):
+        """ Test a document whose file is replaced while it is cut is left alone """
+        document = self.create('replaced.bin', self.data)
+        iter_chunks = chunks.iter_chunks
+
+        def replace_while_cutting(*args):
+            Document.objects.filter(pk=document.pk).update(file='cas/other/replaced.bin')
+            return iter_chunks(*args)
+
+        with mock.patch.object(chunks, 'iter_chunks', side_effect=replace_while_cutting):
+            self.assertEqual(0, document.pack())
+        self.assertFalse(Document.objects.get(pk=document.pk).packed)
+        self.assertEqual(0, DocumentChunk.objects.count())
+        Document.objects.filter(pk=document.pk).update(file=document.file.name)
+        document.delete()
+
+    def test_download(self):
+        """ Test packed documents are downloaded by ranges and packing is queued on upload """
+        User.objects.create_user('dummy', 'dummy@dummy.com', 'dummy_secret')
+        self.client.login(username='dummy', password='dummy_secret')
+        document = self.create('packed.bin', self.data)
+        document.pack()
+        response = self.client.get('/download/{}/'.format(document.id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.data, b''.join(response.streaming_content))
+        response = self.client.get('/download/{}/'.format(document.id), HTTP_RANGE='bytes=100-199')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(self.data[100:200], b''.join(response.streaming_content))
+        with self.settings(CHUNK_STORE=True):
+            self.client.post('/upload/{}/'.format(self.folder.id), {
+                'name': 'queued', 'folder': self.folder.id, 'file': ContentFile(b'queued', name='queued.txt')})
+        self.assertTrue(Job.objects.filter(kind='pack').exists())
+        document.delete()
@@ -1,8 +1,14 @@
 from django.test import TestCase
 from file_handler.models import Document, Folder
 from django.core.files import File
+from django.core.files.base import ContentFile
 from django.conf import settings
-from django.utils import timezone
+from django.core.management import call_command
+from django.apps import apps
+from shared_secret.models import ShamirSS
+import hashlib
+import importlib
+import io
 import os
 
 
@@ -43,6 +49,71 @@ class FolderTestCases(TestCase):
         self.assertEqual(parent.name, str(parent))
 
 
+class FolderTotalsTestCase(TestCase):
+    """ Test for the size and document totals of folders """
+
+    def setUp(self):
+        self.root = Folder.objects.create(name='root')
+        self.child = Folder.objects.create(name='child', parent=self.root)
+        self.other = Folder.objects.create(name='other')
+
+    def totals(self, folder):
+        folder.refresh_from_db()
+        return folder.total_size, folder.total_documents, folder.total_encrypted
+
+    def test_incremental(self):
+        """ Test uploads, encryption, moves and deletions update the totals of every ancestor """
+        document = Document.objects.create(name='document', folder=self.child,
+                                           file=ContentFile(b'x' * 100, name='totals.txt'))
+        Document.objects.create(name='empty', folder=self.root)
+        self.assertEqual((100, 1, 0), self.totals(self.child))
+        self.assertEqual((100, 2, 0), self.totals(self.root))
+        scheme = ShamirSS(name='test', mers_exp=107, k=2, n=3)
+        shares = scheme.get_shares()
+        scheme.save()
+        self.assertTrue(scheme.encrypt_document(document, shares[:2]))
+        size = document.size
+        self.assertEqual((size, 2, 1), self.totals(self.root))
+        # moving a subtree moves its totals
+        self.child.move_to(self.other)
+        self.assertEqual((0, 1, 0), self.totals(self.root))
+        self.assertEqual((size, 1, 1), self.totals(self.other))
+        self.child.parent = self.root
+        self.child.save()
+        self.assertEqual((size, 2, 1), self.totals(self.root))
+        self.assertEqual((0, 0, 0), self.totals(self.other))
+        document.folder = self.root
+        document.save()
+        self.assertEqual((0, 0, 0), self.totals(self.child))
+        self.assertEqual((size, 2, 1), self.totals(self.root))
+        self.assertEqual(0, Folder.rebuild_totals())
+        document.delete()
+        self.assertEqual((0, 1, 0), self.totals(self.root))
+
+    def test_reconcile(self):
+        """ Test the reconcile command fixes totals from the documents of each subtree """
+        Document.objects.create(name='document', folder=self.child, file=ContentFile(b'x' * 10, name='totals.txt'))
+        Folder.objects.update(total_size=0, total_documents=5, total_encrypted=0)
+        out = io.StringIO()
+        call_command('reconcile_folders', stdout=out)
+        self.assertIn('Fixed totals of 3 folders', out.getvalue())
+        self.assertEqual((10, 1, 0), self.totals(self.root))
+        self.assertEqual((10, 1, 0), self.totals(self.child))
+        self.assertEqual((0, 0, 0), self.totals(self.other))
+
+    def test_migration(self):
+        """ Test the migration adding the totals fills them in, existing documents can then be deleted """
+        document = Document.objects.create(name='document', folder=self.child,
+                                           file=ContentFile(b'x' * 10, name='totals.txt'))
+        Folder.objects.update(total_size=0, total_documents=0, total_encrypted=0)
+        migration = importlib.import_module('file_handler.migrations.0010_folder_totals')
+        migration.fill_totals(apps, None)
+        self.assertEqual((10, 1, 0), self.totals(self.root))
+        self.assertEqual((0, 0, 0), self.totals(self.other))
+        document.delete()
+        self.assertEqual((0, 0, 0), self.totals(self.root))
+
+
 class DocumentTestCases(TestCase):
     """ Test for Document model """
 
@@ -59,9 +130,11 @@ class DocumentTestCases(TestCase):
 
     def test_file_save(self):
         """ Test successful file save """
-        path = settings.MEDIA_ROOT + 'documents/%Y/%m/%d/'
-        file_path = timezone.now().strftime(path + self.TEST_FILE_NAME)
+        document = Document.objects.get(name='Test File')
+        file_path = settings.MEDIA_ROOT + 'cas/{}/{}/{}'.format(
+            document.content_hash[:2], document.content_hash, self.TEST_FILE_NAME)
         self.assertTrue(os.path.isfile(file_path))
+        self.assertEqual(file_path, document.file_path())
 
     def test_document_name(self):
         """ Test string representation of a document """
@@ -82,6 +155,25 @@ class DocumentTestCases(TestCase):
         """ Test correct file mime type """
         document = Document.objects.get(name='Test File')
         self.assertEqual(self.TEST_FILE_MIME_TYPE, document.file_mime())
+        self.assertEqual(self.TEST_FILE_MIME_TYPE, document.mime_type)
+        self.assertEqual(os.path.getsize(document.file_path()), document.size)
+
+    def test_backfill_file_info(self):
+        """ Test mime type and size of older rows are detected by the backfill command """
+        Document.objects.update(mime_type='', size=None)
+        out = io.StringIO()
+        call_command('backfill_file_info', batch_size=1, workers=2, stdout=out)
+        self.assertIn('Updated 1 documents', out.getvalue())
+        document = Document.objects.get(name='Test File')
+        self.assertEqual(self.TEST_FILE_MIME_TYPE, document.mime_type)
+        self.assertEqual(os.path.getsize(document.file_path()), document.size)
+
+    def test_content_hash(self):
+        """ Test content hash of the stored file """
+        document = Document.objects.get(name='Test File')
+        with open(document.file_path(), 'rb') as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), document.content_hash)
+        self.assertEqual('"{}"'.format(document.content_hash), document.etag())
 
     @classmethod
     def tearDownClass(cls):
@@ -0,0 +1,86 @@
+from django.test import TestCase, TransactionTestCase
+from django.core.files.base import ContentFile
+from file_handler.models import Blob, Document, Folder
+from shared_secret.models import ShamirSS
+import os
+
+
+class ContentAddressedStorageTestCase(TestCase):
+    """ Test for the deduplicating document storage """
+
+    def setUp(self):
+        self.folder = Folder.objects.create(name='test_folder')
+        self.storage = Document._meta.get_field('file').storage
+
+    def create(self, name, data):
+        return Document.objects.create(name=name, folder=self.folder, file=ContentFile(data, name=name))
+
+    def test_deduplication(self):
+        """ Test identical uploads share one blob and the data lives until the last document is deleted """
+        first = self.create('first.bin', b'same content')
+        second = self.create('second.bin', b'same content')
+        third = self.create('first.bin', b'same content')
+        other = self.create('other.bin', b'other content')
+        blob = Blob.objects.get(content_hash=first.content_hash)
+        self.assertEqual(3, blob.refcount)
+        self.assertEqual(len(b'same content'), blob.size)
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertNotEqual(first.file.name, third.file.name)
+        self.assertEqual('first.bin', first.filename())
+        self.assertEqual('second.bin', second.filename())
+        self.assertTrue(os.path.samefile(first.file_path(), second.file_path()))
+        self.assertEqual(first.content_hash, self.storage.content_hash(third.file.name))
+        self.assertEqual(2, Blob.objects.count())
+        blob_path = self.storage.blob_path(first.content_hash)
+        first.delete()
+        self.assertFalse(os.path.exists(first.file_path()))
+        self.assertEqual(2, Blob.objects.get(pk=blob.pk).refcount)
+        with open(second.file_path(), 'rb') as file:
+            self.assertEqual(b'same content', file.read())
+        second.delete()
+        third.delete()
+        self.assertFalse(Blob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(os.path.exists(blob_path))
+        other.delete()
+        self.assertEqual(0, Blob.objects.count())
+
+    def test_plain_files(self):
+        """ Test files written outside of the storage are deleted as plain files and can be ingested """
+        name = 'documents/test_storage_plain.txt'
+        os.makedirs(os.path.dirname(self.storage.path(name)), exist_ok=True)
+        with open(self.storage.path(name), 'wb') as file:
+            file.write(b'plain content')
+        self.assertIsNone(self.storage.content_hash(name))
+        reference = self.storage.ingest(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertIsNotNone(self.storage.content_hash(reference))
+        self.assertEqual(1, Blob.objects.get(content_hash=self.storage.content_hash(reference)).refcount)
+        with open(self.storage.path(name), 'wb') as file:
+            file.write(b'plain content')
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.storage.delete(reference)
+        self.assertEqual(0, Blob.objects.count())
+
+
+class EncryptedDocumentStorageTestCase(TransactionTestCase):
+    """ Test encryption outputs never take names owned by the content addressed storage """
+
+    def test_decrypt_next_to_duplicate(self):
+        """ Test decrypting a document whose content was uploaded again keeps both files apart """
+        folder = Folder.objects.create(name='test_folder')
+        scheme = ShamirSS(name='test', mers_exp=107, k=2, n=3)
+        shares = scheme.get_shares()
+        scheme.save()
+        first = Document.objects.create(name='first', folder=folder, file=ContentFile(b'installer', name='setup.exe'))
+        self.assertTrue(scheme.encrypt_document(first, shares[:2]))
+        self.assertFalse(first.file.name.startswith('cas/'))
+        second = Document.objects.create(name='second', folder=folder, file=ContentFile(b'installer', name='setup.exe'))
+        self.assertTrue(scheme.decrypt_document(first, shares[:2]))
+        self.assertNotEqual(first.file.name, second.file.name)
+        self.assertEqual(1, Blob.objects.get(content_hash=second.content_hash).refcount)
+        first.delete()
+        with open(second.file_path(), 'rb') as file:
+            self.assertEqual(b'installer', file.read())
+        second.delete()
+        self.assertEqual(0, Blob.objects.count())
@@ -2,11 +2,20 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from django.test import Client
 from file_handler.models import Folder
-from file_handler.models import Document
+from file_handler.models import Document, Upload
 from random import randint
 from django.core.files import File
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from shared_secret.models import ShamirSS
+from jobs.models import Job
+from jobs import worker
+import datetime
+import hashlib
+import base64
 import os
 
 
@@ -59,6 +68,79 @@ class TestFileHandlerViews(TestCase):
         uploaded_document = Document.objects.get(name=self.files[1][0])
         self.remove_file(uploaded_document.file.name)
 
+    def test_resumable_upload(self):
+        """ Test for the resumable upload protocol """
+        content = b'first chunk|second chunk'
+        response = self.client.post('/upload/init/' + str(self.root.id) + '/',
+                                    {'name': 'resumable', 'filename': 'resumable.txt', 'size': len(content)})
+        self.assertEqual(response.status_code, 201)
+        upload = response.json()
+        self.assertEqual(upload['offset'], 0)
+        upload_object = Upload.objects.get(pk=upload['id'])
+        self.assertTrue(os.path.isfile(upload_object.file_path()))
+        # check chunk with a wrong checksum is rejected
+        response = self.client.put(upload['url'], content[:12], content_type='application/offset+octet-stream',
+                                   HTTP_UPLOAD_OFFSET='0', HTTP_UPLOAD_CHECKSUM='sha256 ' + self.checksum(b'other'))
+        self.assertEqual(response.status_code, 460)
+        # check successful chunk
+        response = self.client.put(upload['url'], content[:12], content_type='application/offset+octet-stream',
+                                   HTTP_UPLOAD_OFFSET='0', HTTP_UPLOAD_CHECKSUM='sha256 ' + self.checksum(content[:12]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], '12')
+        # check chunk at a wrong offset
+        response = self.client.put(upload['url'], content[5:], content_type='application/offset+octet-stream',
+                                   HTTP_UPLOAD_OFFSET='5')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '12')
+        # check offset is reported for resuming
+        response = self.client.get(upload['url'])
+        self.assertEqual(response.json()['offset'], 12)
+        # check incomplete uploads can't be finalized
+        response = self.client.post(upload['finalize_url'])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Document.objects.filter(name='resumable').exists())
+        response = self.client.put(upload['url'], content[12:], content_type='application/offset+octet-stream',
+                                   HTTP_UPLOAD_OFFSET='12')
+        self.assertEqual(response.status_code, 204)
+        response = self.client.post(upload['finalize_url'])
+        self.assertEqual(response.status_code, 201)
+        document = Document.objects.get(pk=response.json()['id'])
+        self.assertEqual(document.folder, self.root)
+        self.assertEqual(document.filename(), 'resumable.txt')
+        self.assertEqual(document.content_hash, hashlib.sha256(content).hexdigest())
+        with open(document.file_path(), 'rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertFalse(Upload.objects.filter(pk=upload['id']).exists())
+        # remove file from filesystem
+        self.remove_file(document.file.name)
+
+    def test_upload_file_name(self):
+        """ Test resumable uploads reject file names leaving their directory """
+        for filename in ('../../../../etc/x', 'dir/x', 'dir\\x', '..'):
+            response = self.client.post('/upload/init/' + str(self.root.id) + '/',
+                                        {'name': 'escape', 'filename': filename, 'size': 10})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('filename', response.json()['errors'])
+        self.assertFalse(Upload.objects.exists())
+
+    def test_upload_expiry(self):
+        """ Test chunks push the expiry back and expired uploads are deleted with their partial file """
+        response = self.client.post('/upload/init/' + str(self.root.id) + '/',
+                                    {'name': 'abandoned', 'filename': 'abandoned.txt', 'size': 10})
+        upload = Upload.objects.get(pk=response.json()['id'])
+        expires = upload.expires
+        self.client.put('/upload/chunk/{}/'.format(upload.id), b'01234', content_type='application/offset+octet-stream',
+                        HTTP_UPLOAD_OFFSET='0')
+        upload.refresh_from_db()
+        self.assertGreater(upload.expires, expires)
+        self.assertEqual(0, Upload.delete_expired())
+        Upload.objects.filter(pk=upload.pk).update(expires=timezone.now())
+        self.assertEqual(404, self.client.get('/upload/chunk/{}/'.format(upload.id)).status_code)
+        self.assertEqual(404, self.client.post('/upload/finalize/{}/'.format(upload.id)).status_code)
+        self.assertEqual(['Deleted 1 expired uploads'], [message for message in worker.run_startup_hooks() if message])
+        self.assertFalse(Upload.objects.filter(pk=upload.pk).exists())
+        self.assertFalse(os.path.isfile(upload.file_path()))
+
     def test_folder(self):
         """ Test for folder view """
         response_1 = self.client.get('/folder/' + str(self.root.id) + '/')
@@ -73,6 +155,58 @@ class TestFileHandlerViews(TestCase):
         # remove file from filesystem
         self.remove_file(document.file.name)
 
+    def test_folder_queries(self):
+        """ Test the folder view runs a constant number of queries and paginates its content """
+        scheme = ShamirSS.objects.create(name='test', mers_exp=107, k=2, n=3)
+        parent = Folder.objects.create(name='parent', parent=self.root)
+        folder = Folder.objects.create(name='folder', parent=parent)
+        Document.objects.create(name='plain', folder=folder)
+        Folder.objects.create(name='child', parent=folder)
+        url = '/folder/{}/'.format(folder.id)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for idx in range(30):
+            Folder.objects.create(name='child_{}'.format(idx), parent=folder)
+            Document.objects.create(name='doc_{}'.format(idx), folder=folder, scheme=scheme if idx % 2 else None)
+        with self.settings(FOLDER_PAGE_SIZE=10):
+            with self.assertNumQueries(len(queries)):
+                response = self.client.get(url)
+            self.assertEqual(10, len(response.context['children']))
+            self.assertEqual(parent, response.context['parent'])
+            with self.assertNumQueries(len(queries)):
+                response = self.client.get(url + response.context['documents_next'])
+        self.assertEqual(['doc_{}'.format(idx) for idx in range(9, 19)],
+                         [document.name for document in response.context['documents']])
+        self.assertContains(response, 'doc_9')
+        self.assertNotContains(response, 'doc_20')
+
+    def test_folder_listing(self):
+        """ Test keyset pagination, sort and filter of the folder view """
+        folder = Folder.objects.create(name='folder', parent=self.root)
+        for name in ('b', 'a', 'c', 'ab'):
+            Document.objects.create(name=name, folder=folder)
+        url = '/folder/{}/'.format(folder.id)
+        names = []
+        next_url = '?sort=-name'
+        with self.settings(FOLDER_PAGE_SIZE=3):
+            while next_url:
+                response = self.client.get(url + next_url)
+                names += [document.name for document in response.context['documents']]
+                next_url = response.context['documents_next']
+            self.assertEqual(['c', 'b', 'ab', 'a'], names)
+            response = self.client.get(url + '?sort=name&q=a')
+            self.assertEqual(['a', 'ab'], [document.name for document in response.context['documents']])
+        with self.settings(FOLDER_PAGE_SIZE=1):
+            response = self.client.get(url + '?sort=name&q=a&encrypted=0')
+            response = self.client.get(url + response.context['documents_next'])
+        # sort links keep the filters and restart from the first page
+        self.assertEqual(['ab'], [document.name for document in response.context['documents']])
+        self.assertEqual('?q=a&encrypted=0&sort=-name', response.context['sort_by_name'])
+        self.assertEqual('?q=a&encrypted=0&sort=-created', response.context['sort_by_created'])
+        self.assertContains(response, 'href="?q=a&amp;encrypted=0&amp;sort=-name"')
+        self.assertEqual(400, self.client.get(url + '?sort=size').status_code)
+        self.assertEqual(400, self.client.get(url + '?after=garbage').status_code)
+
     def test_download(self):
         """ Test for download view """
         document = Document.objects.create(name=self.files[2][0], folder=self.root, file=File(self.files[2][1]))
@@ -80,6 +214,61 @@ class TestFileHandlerViews(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEquals(response.get('Content-Disposition'),
                           "attachment; filename=" + self.files[2][0])
+        self.assertEqual(b''.join(response.streaming_content), b'something to fill this up\n')
+        # check download offloaded to nginx
+        with self.settings(DOWNLOAD_ACCEL_REDIRECT=True):
+            response = self.client.get('/download/' + str(document.id) + '/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response.get('X-Accel-Redirect'), '/protected/' + document.file.name)
+        # remove file from filesystem
+        self.remove_file(document.file.name)
+
+    def test_download_conditional(self):
+        """ Test ETag, Last-Modified, conditional and range requests on download view """
+        document = Document.objects.create(name=self.files[2][0], folder=self.root, file=File(self.files[2][1]))
+        download_url = '/download/' + str(document.id) + '/'
+        content = b'something to fill this up\n'
+        response = self.client.get(download_url)
+        etag = response['ETag']
+        self.assertEqual(etag, '"{}"'.format(hashlib.sha256(content).hexdigest()))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        # check not modified responses
+        response = self.client.get(download_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(download_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        # check single range
+        response = self.client.get(download_url, HTTP_RANGE='bytes=0-8')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 0-8/26')
+        self.assertEqual(b''.join(response.streaming_content), content[:9])
+        response = self.client.get(download_url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), content[-3:])
+        # check multiple ranges
+        response = self.client.get(download_url, HTTP_RANGE='bytes=0-3,10-13')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(b'Content-Range: bytes 0-3/26\r\n\r\nsome\r\n', body)
+        self.assertIn(b'Content-Range: bytes 10-13/26\r\n\r\nto f\r\n', body)
+        # check unsatisfiable range
+        response = self.client.get(download_url, HTTP_RANGE='bytes=26-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */26')
+        # check range ignored when If-Range doesn't match
+        response = self.client.get(download_url, HTTP_RANGE='bytes=0-8', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), content)
+        # check Last-Modified follows the stored content, not the creation of the document
+        Document.objects.filter(pk=document.pk).update(modified=timezone.now() - datetime.timedelta(hours=1))
+        last_modified = self.client.get(download_url)['Last-Modified']
+        document.pack()
+        response = self.client.get(download_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], last_modified)
+        self.assertEqual(b''.join(response.streaming_content), content)
         # remove file from filesystem
         self.remove_file(document.file.name)
 
@@ -115,20 +304,33 @@ class TestFileHandlerViews(TestCase):
         parent_doc = Document.objects.create(name=self.files[4][0], folder=parent_folder, file=File(self.files[4][1]))
         child_folder = Folder.objects.create(name="child", parent=parent_folder)
         child_doc = Document.objects.create(name=self.files[5][0], folder=child_folder, file=File(self.files[5][1]))
+        Folder.objects.create(name="grandchild", parent=child_folder)
+        sibling = Folder.objects.create(name="sibling", parent=parent_folder)
         delete_url = '/delete/' + str(child_folder.id) + "/"
-        expected_url = '/folder/' + str(parent_folder.id) + '/'
-        response_1 = self.client.post(delete_url, follow=True)
-        self.assertRedirects(response_1, expected_url=expected_url, status_code=302, target_status_code=200)
+        response_1 = self.client.post(delete_url)
+        job = Job.objects.get(kind='reap_files')
+        self.assertRedirects(response_1, expected_url='/jobs/{}/'.format(job.id), status_code=302,
+                             target_status_code=200)
+        self.assertEqual('/folder/{}/'.format(parent_folder.id), job.get_payload()['next'])
         self.assertRaises(ObjectDoesNotExist, lambda: Folder.objects.get(pk=child_folder.id))
-        self.assertFalse(os.path.isfile(child_doc.file_path()))
         self.assertRaises(ObjectDoesNotExist, lambda: Document.objects.get(pk=child_doc.id))
+        self.assertEqual(['parent', 'sibling'], [folder.name for folder in Folder.objects.filter(
+            tree_id=parent_folder.tree_id).order_by('lft')])
+        parent_folder.refresh_from_db()
+        sibling.refresh_from_db()
+        self.assertEqual((1, 4, 2, 3), (parent_folder.lft, parent_folder.rght, sibling.lft, sibling.rght))
+        self.assertEqual((parent_doc.size, 1), (parent_folder.total_size, parent_folder.total_documents))
+        # the files are left to the job
+        self.assertTrue(os.path.isfile(child_doc.file_path()))
+        self.assertEqual(1, worker.run_pending())
+        self.assertFalse(os.path.isfile(child_doc.file_path()))
         delete_url = '/delete/' + str(parent_folder.id) + "/"
-        expected_url = '/'
-        response_2 = self.client.post(delete_url, follow=True)
-        self.assertRedirects(response_2, expected_url=expected_url, status_code=302, target_status_code=200)
+        self.client.post(delete_url)
+        self.assertEqual('/', Job.objects.filter(kind='reap_files').latest('id').get_payload()['next'])
         self.assertRaises(ObjectDoesNotExist, lambda: Folder.objects.get(pk=parent_folder.id))
-        self.assertFalse(os.path.isfile(parent_doc.file_path()))
         self.assertRaises(ObjectDoesNotExist, lambda: Document.objects.get(pk=parent_doc.id))
+        self.assertEqual(1, worker.run_pending())
+        self.assertFalse(os.path.isfile(parent_doc.file_path()))
 
     @classmethod
     def tearDownClass(cls):
@@ -138,6 +340,11 @@ class TestFileHandlerViews(TestCase):
             os.remove(file[0])
         super().tearDownClass()
 
+    @staticmethod
+    def checksum(data):
+        """ helper to build the Upload-Checksum value of data """
+        return base64.b64encode(hashlib.sha256(data).digest()).decode()
+
     @classmethod
     def remove_file(cls, path):
         """ helper to remove a file from media folder given its path """
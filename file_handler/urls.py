@@ -7,6 +7,9 @@ urlpatterns = [
     path('folder/<int:folder_id>/', views.folder, name='folder'),
     path('upload', views.upload, name='upload'),
     path('upload/<int:folder_id>/', views.upload, name='upload'),
+    path('upload/init/<int:folder_id>/', views.upload_init, name='upload_init'),
+    path('upload/chunk/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('upload/finalize/<uuid:upload_id>/', views.upload_finalize, name='upload_finalize'),
     path('create/<int:folder_id>/', views.create, name='create'),
     path('create', views.create, name='create'),
     path('download/<int:file_id>/', views.download, name='download'),
@@ -14,3 +14,4 @@ def get_earliest_objects_or_none(klass, *args, **kwargs):
         return queryset.filter(*args, *kwargs).earliest('id')
     except queryset.model.DoesNotExist:
         return None
+
@@ -1,11 +1,27 @@
 from django.shortcuts import render, redirect, get_object_or_404, HttpResponse
 from django.utils.encoding import smart_str
-from file_handler.forms import DocumentForm, FolderForm, DeleteDocumentForm, DeleteFolderForm
-from .models import Folder, Document
+from file_handler.forms import DocumentForm, FolderForm, DeleteDocumentForm, DeleteFolderForm, UploadForm
+from .models import Folder, Document, Upload, upload_expiry
 from shared_secret.models import ShamirSS
+from shared_secret import crypto, access
+from jobs.models import Job
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseNotAllowed
+from django.http import (HttpResponseNotAllowed, HttpResponseForbidden, HttpResponseBadRequest, StreamingHttpResponse,
+                         FileResponse, JsonResponse)
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.conf import settings
 from .utils import get_earliest_objects_or_none
+from .http import ranged_response, read_file, closing_iterator
+from . import listing
+from urllib.parse import quote
+import mimetypes
+import hashlib
+import base64
+import os
+
+UPLOAD_BLOCK_SIZE = 64 * 1024
 
 
 @login_required
@@ -26,7 +42,9 @@ def upload(request, folder_id):
     if request.method == 'POST':
         form = DocumentForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
+            document = form.save()
+            if settings.CHUNK_STORE:
+                Job.enqueue('pack', {'document': document.id})
             return redirect('folder', folder_id=folder_id)
     else:
         form = DocumentForm(initial={'folder': folder})
@@ -36,19 +54,162 @@ def upload(request, folder_id):
     })
 
 
+def upload_status(upload):
+    """ return json serializable state of a resumable upload """
+    return {
+        'id': str(upload.id),
+        'name': upload.name,
+        'size': upload.size,
+        'offset': upload.offset,
+        'expires': upload.expires.isoformat(),
+        'url': '/upload/chunk/{}/'.format(upload.id),
+        'finalize_url': '/upload/finalize/{}/'.format(upload.id)
+    }
+
+
+@login_required
+def upload_init(request, folder_id):
+    """ start a resumable upload on the specified folder reserving the final file """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    folder = get_object_or_404(Folder, pk=folder_id)
+    form = UploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    upload = form.save(commit=False)
+    upload.folder = folder
+    upload.file_name = Upload.reserve_file(form.cleaned_data['filename'])
+    upload.save()
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@login_required
+def upload_chunk(request, upload_id):
+    """ return the offset of a resumable upload (GET/HEAD) or append a chunk to it (PUT/PATCH) """
+    upload = get_object_or_404(Upload.active(), pk=upload_id)
+    if request.method in ('GET', 'HEAD'):
+        response = JsonResponse(upload_status(upload))
+        response['Upload-Offset'] = upload.offset
+        return response
+    if request.method not in ('PUT', 'PATCH'):
+        return HttpResponseNotAllowed(['GET', 'HEAD', 'PUT', 'PATCH'])
+    try:
+        offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset header is required'}, status=400)
+    hasher = None
+    checksum = request.META.get('HTTP_UPLOAD_CHECKSUM')
+    if checksum:
+        algorithm, _, digest = checksum.partition(' ')
+        if algorithm not in ('sha256', 'sha1', 'md5'):
+            return JsonResponse({'error': 'unsupported checksum algorithm'}, status=400)
+        hasher = hashlib.new(algorithm)
+    with transaction.atomic():
+        # lock the upload, concurrent chunks for the same upload are serialized
+        upload = get_object_or_404(Upload.active().select_for_update(), pk=upload.pk)
+        if offset != upload.offset:
+            response = JsonResponse(upload_status(upload), status=409)
+            response['Upload-Offset'] = upload.offset
+            return response
+        if offset + length > upload.size:
+            return JsonResponse({'error': 'chunk exceeds upload size'}, status=413)
+        with open(upload.file_path(), 'r+b') as f:
+            # drop whatever an interrupted chunk left after the offset
+            f.seek(offset)
+            f.truncate()
+            received = 0
+            while received < length:
+                block = request.read(min(UPLOAD_BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                if hasher is not None:
+                    hasher.update(block)
+                f.write(block)
+                received += len(block)
+            if received != length or (hasher is not None and base64.b64encode(hasher.digest()).decode() != digest):
+                f.truncate(offset)
+                status = 460 if received == length else 400
+                return JsonResponse({'error': 'chunk rejected', 'offset': offset}, status=status)
+            f.flush()
+            os.fsync(f.fileno())
+        upload.offset = offset + received
+        upload.expires = upload_expiry()
+        upload.save(update_fields=['offset', 'expires'])
+    response = HttpResponse(status=204)
+    response['Upload-Offset'] = upload.offset
+    return response
+
+
+@login_required
+def upload_finalize(request, upload_id):
+    """ create the document of a completed resumable upload """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    with transaction.atomic():
+        upload = get_object_or_404(Upload.active().select_for_update(), pk=upload_id)
+        if not upload.is_complete():
+            return JsonResponse(upload_status(upload), status=409)
+        document = Document(name=upload.name, folder=upload.folder)
+        # the completed file joins the blob store, a duplicate only costs a link
+        document.file.name = document.file.storage.ingest(upload.file_name)
+        document.save()
+        upload.delete()
+        if settings.CHUNK_STORE:
+            Job.enqueue('pack', {'document': document.id})
+    return JsonResponse({'id': document.id, 'url': '/folder/{}/'.format(document.folder_id)}, status=201)
+
+
+def page_url(request, **params):
+    """ return the query string of the current page with params replaced (None removes them) """
+    query = request.GET.copy()
+    for name, value in params.items():
+        query.pop(name, None)
+        if value is not None:
+            query[name] = value
+    return '?' + query.urlencode()
+
+
 @login_required
 def folder(request, folder_id):
-    """ Show content of a particular folder """
+    """
+    Show content of a particular folder, children and documents are paginated by cursor
+    (folders_after and after) sorted by sort and filtered by name prefix q
+    """
     root = get_object_or_404(Folder, pk=folder_id)
-    children = Folder.objects.filter(parent=folder_id)
-    documents = Document.objects.filter(folder=folder_id)
+    # one query for the breadcrumb and the parent link
+    ancestors = list(root.get_ancestors(include_self=True))
+    parent = ancestors[-2] if len(ancestors) > 1 else None
+    sort = request.GET.get('sort', listing.DEFAULT_SORT)
+    children = listing.filter_folders(Folder.objects.filter(parent=folder_id), request.GET)
+    documents = listing.filter_documents(Document.objects.filter(folder=folder_id), request.GET)
+    page_size = settings.FOLDER_PAGE_SIZE
+    try:
+        children, children_next = listing.keyset_page(
+            children.only('id', 'name', 'creation_date', 'total_size', 'total_documents'), page_size, sort,
+            request.GET.get('folders_after'))
+        documents, documents_next = listing.keyset_page(
+            documents.only('id', 'name', 'file', 'creation_date', 'scheme', 'size'), page_size, sort,
+            request.GET.get('after'))
+    except ValueError:
+        return HttpResponseBadRequest()
     scheme = get_earliest_objects_or_none(ShamirSS)
     dd_form = DeleteDocumentForm()
     df_form = DeleteFolderForm()
     return render(request, 'file_handler/folder.html', {
         'root': root,
+        'ancestors': ancestors,
+        'parent': parent,
         'children': children,
         'documents': documents,
+        'children_next': children_next and page_url(request, folders_after=children_next, after=None),
+        'documents_next': documents_next and page_url(request, after=documents_next, folders_after=None),
+        'first_page': page_url(request, after=None, folders_after=None),
+        'sort': sort,
+        # changing the sort keeps the filters (q, encrypted) and restarts from the first page
+        'sort_by_name': page_url(request, sort='-name' if sort == 'name' else 'name', after=None, folders_after=None),
+        'sort_by_created': page_url(request, sort='created' if sort == '-created' else '-created', after=None,
+                                    folders_after=None),
         'dd_form': dd_form,
         'df_form': df_form,
         'scheme': scheme
@@ -59,9 +220,85 @@ def folder(request, folder_id):
 def download(request, file_id):
     """ download a specified file """
     document = get_object_or_404(Document, pk=file_id)
-    response = HttpResponse(document.file, content_type=document.file_mime)
+    token = request.GET.get('token')
+    key = None
+    etag = document.etag()
+    if document.scheme_id is not None and token is not None:
+        key = access.read_token(request.session, token, document)
+        if key is None:
+            return HttpResponseForbidden()
+        if etag is not None:
+            etag = '"{}-plain"'.format(document.content_hash)
+    last_modified = int(document.modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if key is not None:
+            response = download_plaintext(request, document, key, etag, last_modified)
+        else:
+            response = download_file(request, document, etag, last_modified)
+    if response.status_code in (200, 206, 304):
+        response['Last-Modified'] = http_date(last_modified)
+        if etag is not None:
+            response['ETag'] = etag
+    return response
+
+
+def download_file(request, document, etag, last_modified):
+    """ send the stored file, ranges are served from disk """
+    content_type = document.file_mime()
+    if document.packed:
+        return download_chunks(request, document, content_type, etag, last_modified)
+    if settings.DOWNLOAD_ACCEL_REDIRECT:
+        # let nginx send the file (and handle ranges) from its internal location and release the worker
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(settings.DOWNLOAD_ACCEL_PREFIX + document.file.name)
+    else:
+        file = open(document.file_path(), 'rb')
+        size = os.fstat(file.fileno()).st_size
+        response = ranged_response(request, read_file(file), size, content_type, file, etag, last_modified)
+        if response is None:
+            # FileResponse streams the file in blocks, through sendfile when the server supports it
+            response = FileResponse(file, content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
     response['Content-Disposition'] = 'attachment; filename=%s' % smart_str(document.filename())
-    response['X-Sendfile'] = smart_str(document.filename())
+    return response
+
+
+def download_chunks(request, document, content_type, etag, last_modified):
+    """ stream a packed document reassembling only the chunks of the requested ranges """
+    reader = document.open_content()
+    response = ranged_response(request, reader.iter_range, reader.size, content_type, None, etag, last_modified)
+    if response is None:
+        response = StreamingHttpResponse(reader.iter_range(0, reader.size), content_type=content_type)
+        response['Content-Length'] = reader.size
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = 'attachment; filename=%s' % smart_str(document.filename())
+    return response
+
+
+def download_plaintext(request, document, key, etag, last_modified):
+    """ stream the plaintext of an encrypted document decrypting only the requested ranges """
+    file = open(document.file_path(), 'rb')
+    try:
+        reader = crypto.open_reader(file, key)
+    except crypto.DecryptionError:
+        file.close()
+        return HttpResponseForbidden()
+    filename = document.filename()
+    if filename.endswith('.enc'):
+        filename = filename[:-4]
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = None
+    if reader.size is not None:
+        response = ranged_response(request, reader.iter_range, reader.size, content_type, file, etag, last_modified)
+    if response is None:
+        stop = reader.size if reader.size is not None else float('inf')
+        response = StreamingHttpResponse(closing_iterator(reader.iter_range(0, stop), file), content_type=content_type)
+        if reader.size is not None:
+            response['Content-Length'] = reader.size
+    if reader.size is not None:
+        response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = 'inline; filename=%s' % smart_str(filename)
     return response
 
 
@@ -105,7 +342,9 @@ def delete(request, folder_id):
         parent = folder.parent
         form = DeleteFolderForm(request.POST, instance=folder)
         if form.is_valid():
-            folder.delete()
+            # rows are gone at once, the files are removed by the job
+            job = folder.delete_subtree({'next': '/' if parent is None else '/folder/{}/'.format(parent.id)})
+            return redirect('/jobs/{}/'.format(job.id))
         if parent is None:
             return redirect('/')
         return redirect('folder', folder_id=parent.id)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connections
+from jobs import worker
+import multiprocessing
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs with a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOBS_WORKERS,
+                            help='number of worker processes')
+        parser.add_argument('--once', action='store_true',
+                            help='run pending jobs in this process and exit')
+
+    def handle(self, *args, **options):
+        for message in worker.run_startup_hooks():
+            if message:
+                self.stdout.write(message)
+        requeued = worker.requeue_interrupted()
+        if requeued:
+            self.stdout.write('Requeued {} interrupted jobs'.format(requeued))
+        if options['once']:
+            count = worker.run_pending()
+            self.stdout.write('Ran {} jobs'.format(count))
+            return
+        connections.close_all()
+        # workers are not daemonic so jobs can use process pools of their own
+        processes = [multiprocessing.Process(target=worker.work, args=(settings.JOBS_POLL_INTERVAL,))
+                     for _ in range(options['workers'])]
+        for process in processes:
+            process.start()
+        self.stdout.write('Started {} workers'.format(len(processes)))
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,81 @@
+from django.db import models
+from django.utils import timezone
+import json
+
+
+class Job(models.Model):
+    """ A background operation run by the runjobs worker pool """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)
+    payload = models.TextField(default='{}')
+    # sealed sensitive data (e.g. shares), wiped as soon as the job ends
+    secret = models.TextField(blank=True, default='')
+    result = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    creation_date = models.DateTimeField(default=timezone.now, blank=True)
+    start_date = models.DateTimeField(null=True, blank=True)
+    end_date = models.DateTimeField(null=True, blank=True)
+    # worker process running the job (see jobs.process) and its last sign of life
+    owner = models.CharField(max_length=100, blank=True, default='')
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return "{} #{} ({})".format(self.kind, self.id, self.status)
+
+    @staticmethod
+    def enqueue(kind, payload=None, secret=''):
+        """ Create a pending job of the given kind """
+        return Job.objects.create(kind=kind, payload=json.dumps(payload or {}), secret=secret)
+
+    def get_payload(self):
+        """ Return decoded job payload """
+        return json.loads(self.payload)
+
+    def get_result(self):
+        """ Return decoded job result or None if the job didn't complete """
+        return json.loads(self.result) if self.result else None
+
+    def is_finished(self):
+        """ Return true if the job is done or failed """
+        return self.status in (self.DONE, self.FAILED)
+
+    def set_progress(self, done, total):
+        """ Store job progress as a percentage, the row is updated only when the percentage changes """
+        progress = min(100, 100 * done // total) if total else 100
+        if progress != self.progress:
+            self.progress = progress
+            Job.objects.filter(pk=self.pk).update(progress=progress)
+
+    def as_dict(self):
+        """
+        Return job state as a json serializable dict. The payload stays in the row (it can list
+        every file of a deleted subtree), only the page shown once the job is done is exposed
+        """
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'next': self.get_payload().get('next'),
+            'result': self.get_result(),
+            'error': self.error
+        }
@@ -0,0 +1,41 @@
+import os
+import socket
+
+
+def current_owner():
+    """ return the name identifying this process across hosts, host:pid """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def _local_pid(owner):
+    """ return the pid of owner if it names a process of this host, None otherwise """
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    return int(pid)
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # alive, owned by another user
+        return True
+    return True
+
+
+def is_dead(owner):
+    """
+    return True if owner names a process of this host which is gone, processes
+    of other hosts (or unnamed owners) are never known to be dead
+    """
+    pid = _local_pid(owner)
+    return pid is not None and not _running(pid)
+
+
+def is_alive(owner):
+    """ return True if owner names a process of this host which is still running """
+    pid = _local_pid(owner)
+    return pid is not None and _running(pid)
@@ -0,0 +1,21 @@
+# job kind -> handler, a handler gets the running Job and returns a json serializable result
+handlers = {}
+
+
+def register(kind):
+    """ decorator registering a handler for jobs of the given kind """
+    def decorator(func):
+        handlers[kind] = func
+        return func
+    return decorator
+
+
+# functions run once when a worker pool starts, before interrupted jobs are requeued,
+# apps use them to clean up after workers that died mid job
+startup_hooks = []
+
+
+def on_startup(func):
+    """ decorator registering a function run when the worker pool starts """
+    startup_hooks.append(func)
+    return func
@@ -0,0 +1,96 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from jobs.models import Job
+from jobs.registry import register
+from jobs import worker
+from django.utils import timezone
+import datetime
+import socket
+import subprocess
+import sys
+
+
+@register('test_sum')
+def sum_job(job):
+    """ test handler summing payload values """
+    values = job.get_payload()['values']
+    for i in range(len(values)):
+        job.set_progress(i + 1, len(values))
+    return {'sum': sum(values)}
+
+
+@register('test_fail')
+def fail_job(job):
+    """ test handler always failing """
+    raise ValueError('something went wrong')
+
+
+class JobWorkerTestCase(TestCase):
+    """ Test for the job queue and worker """
+
+    def test_run(self):
+        """ Test successful job execution """
+        job = Job.enqueue('test_sum', {'values': [1, 2, 3]}, secret='sealed')
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertEqual(worker.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.get_result(), {'sum': 6})
+        self.assertEqual(job.secret, '')
+        self.assertIsNotNone(job.end_date)
+        # check done jobs are not run again
+        self.assertEqual(worker.run_pending(), 0)
+
+    def test_failure(self):
+        """ Test failed jobs store their error """
+        job = Job.enqueue('test_fail', secret='sealed')
+        unknown = Job.enqueue('unknown_kind')
+        self.assertEqual(worker.run_pending(), 2)
+        job.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.error, 'something went wrong')
+        self.assertEqual(job.secret, '')
+        self.assertEqual(unknown.status, Job.FAILED)
+
+    def test_claim(self):
+        """ Test jobs are claimed once and in order """
+        first = Job.enqueue('test_sum', {'values': []})
+        second = Job.enqueue('test_sum', {'values': []})
+        self.assertEqual(worker.claim().id, first.id)
+        self.assertEqual(worker.claim().id, second.id)
+        self.assertIsNone(worker.claim())
+        # jobs of a live worker are left alone, interrupted ones are put back in the queue
+        self.assertEqual(worker.requeue_interrupted(), 0)
+        Job.objects.filter(pk=first.pk).update(owner='{}:{}'.format(socket.gethostname(), self.dead_pid()))
+        Job.objects.filter(pk=second.pk).update(owner='elsewhere:1',
+                                                heartbeat=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(worker.requeue_interrupted(), 2)
+        self.assertEqual(worker.claim().id, first.id)
+        self.assertEqual(worker.claim().id, second.id)
+        Job.objects.filter(pk=second.pk).update(owner='elsewhere:1')
+        self.assertEqual(worker.requeue_interrupted(), 0)
+
+    @staticmethod
+    def dead_pid():
+        """ return the pid of a process which exited """
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    def test_status_view(self):
+        """ Test job status poll endpoint """
+        User.objects.create_user('dummy', 'dummy@dummy.com', 'dummy_secret')
+        client = Client()
+        client.login(username='dummy', password='dummy_secret')
+        job = Job.enqueue('test_sum', {'values': [4, 5]})
+        response = client.get('/jobs/{}/status/'.format(job.id))
+        self.assertEqual(response.json()['status'], Job.PENDING)
+        worker.run_pending()
+        response = client.get('/jobs/{}/status/'.format(job.id))
+        self.assertEqual(response.json()['status'], Job.DONE)
+        self.assertEqual(response.json()['result'], {'sum': 9})
+        self.assertNotIn('payload', response.json())
+        response = client.get('/jobs/{}/'.format(job.id))
+        self.assertEqual(response.status_code, 200)
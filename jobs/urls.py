@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('<int:job_id>/', views.detail, name='job_detail'),
+    path('<int:job_id>/status/', views.status, name='job_status'),
+]
@@ -0,0 +1,20 @@
+from django.shortcuts import render, get_object_or_404
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from .models import Job
+
+
+@login_required
+def detail(request, job_id):
+    """ show job progress """
+    job = get_object_or_404(Job, pk=job_id)
+    return render(request, 'jobs/detail.html', {
+        'job': job
+    })
+
+
+@login_required
+def status(request, job_id):
+    """ poll endpoint returning job state """
+    job = get_object_or_404(Job, pk=job_id)
+    return JsonResponse(job.as_dict())
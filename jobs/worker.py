@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.db import connection, connections
+from django.utils import timezone
+from .models import Job
+from .process import current_owner, is_dead
+from .registry import handlers, startup_hooks
+import datetime
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def claim():
+    """ mark the oldest pending job as running and return it, None if the queue is empty """
+    pending = Job.objects.filter(status=Job.PENDING).order_by('id').values_list('id', flat=True)
+    for job_id in pending[:10]:
+        # compare and swap on status, only one worker wins the job
+        now = timezone.now()
+        if Job.objects.filter(pk=job_id, status=Job.PENDING).update(status=Job.RUNNING, start_date=now,
+                                                                    owner=current_owner(), heartbeat=now):
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+class Heartbeat(threading.Thread):
+    """ thread refreshing the heartbeat of a running job every interval seconds until stopped """
+
+    def __init__(self, job_id, interval):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                Job.objects.filter(pk=self.job_id, status=Job.RUNNING).update(heartbeat=timezone.now())
+        finally:
+            # the thread has a connection of its own
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run(job):
+    """ run a claimed job storing its result or error, the job secret is always wiped """
+    heartbeat = Heartbeat(job.pk, settings.JOBS_HEARTBEAT_INTERVAL)
+    heartbeat.start()
+    try:
+        handler = handlers.get(job.kind)
+        if handler is None:
+            raise LookupError('Unknown job kind {}'.format(job.kind))
+        result = handler(job)
+        job.status = Job.DONE
+        job.progress = 100
+        job.result = json.dumps(result)
+    except Exception as e:
+        logger.exception('job %s failed', job.id)
+        job.status = Job.FAILED
+        job.error = str(e) or e.__class__.__name__
+    finally:
+        heartbeat.stop()
+    job.secret = ''
+    job.end_date = timezone.now()
+    Job.objects.filter(pk=job.pk).update(status=job.status, progress=job.progress, result=job.result,
+                                         error=job.error, secret='', end_date=job.end_date)
+    return job
+
+
+def run_pending():
+    """ run pending jobs in this process until the queue is empty, return the number of jobs run """
+    count = 0
+    job = claim()
+    while job is not None:
+        run(job)
+        count += 1
+        job = claim()
+    return count
+
+
+def run_startup_hooks():
+    """ run the cleanup functions registered by apps, return their results """
+    return [hook() for hook in startup_hooks]
+
+
+def requeue_interrupted():
+    """
+    put back in the queue jobs left running by dead workers, return their number. A job is
+    interrupted when its owner process is gone or its heartbeat is stale, jobs other worker
+    pools are running are left alone
+    """
+    stale = timezone.now() - datetime.timedelta(seconds=settings.JOBS_STALE_AFTER)
+    running = Job.objects.filter(status=Job.RUNNING).values_list('id', 'owner', 'heartbeat')
+    interrupted = [job_id for job_id, owner, heartbeat in running
+                   if is_dead(owner) or heartbeat is None or heartbeat < stale]
+    return Job.objects.filter(pk__in=interrupted, status=Job.RUNNING).update(
+        status=Job.PENDING, start_date=None, owner='', heartbeat=None)
+
+
+def work(poll_interval):
+    """ worker process main loop """
+    # connections inherited from the parent process can't be shared
+    connections.close_all()
+    while True:
+        if run_pending() == 0:
+            time.sleep(poll_interval)
@@ -13,6 +13,60 @@ class Common(Configuration):
     MEDIA_URL = '/media/'
     MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+    # Size in bytes of the independently authenticated segments of encrypted files
+    CRYPTO_SEGMENT_SIZE = 64 * 1024
+
+    # Threads encrypting or decrypting the segments of a single file, segments are
+    # written in order so larger segments (e.g. 1 MB) make better use of many cores
+    CRYPTO_WORKERS = 1
+
+    # Compress documents before encryption, 'zlib', 'zstd' (needs the zstandard package,
+    # zlib is used without it) or None. Only mime types listed here (or starting with an
+    # entry ending in '/') are compressed, compressed files lose ranged plaintext downloads
+    COMPRESSION_CODEC = None
+    COMPRESSION_TYPES = ['text/', 'application/json', 'application/xml', 'application/csv',
+                         'application/javascript', 'application/x-ndjson', 'application/sql', 'image/svg+xml']
+
+    # Lifetime in seconds of the tokens granting plaintext access to encrypted documents
+    ACCESS_TOKEN_TTL = 60 * 60
+
+    # Offload downloads to nginx through X-Accel-Redirect, the prefix must match an
+    # internal location aliased to MEDIA_ROOT (see docker/nginx/django.conf)
+    DOWNLOAD_ACCEL_REDIRECT = False
+    DOWNLOAD_ACCEL_PREFIX = '/protected/'
+
+    # Move uploaded documents to the chunk store (see Document.pack), re-uploads of a
+    # changed file only store the chunks that differ. Chunk size is a power of two.
+    # Cutting a file runs at about 8 MB/s, the pack job does it before locking the document
+    CHUNK_STORE = False
+    CHUNK_AVERAGE_SIZE = 256 * 1024
+
+    # Resumable uploads not receiving a chunk for UPLOAD_EXPIRY seconds are deleted with their
+    # partial file, by runjobs when it starts or by the expire_uploads command
+    UPLOAD_EXPIRY = 24 * 60 * 60
+
+    # Children and documents shown per page of a folder
+    FOLDER_PAGE_SIZE = 100
+
+    # Background jobs worker pool (see runjobs command)
+    JOBS_WORKERS = 2
+    JOBS_POLL_INTERVAL = 1
+    # running jobs refresh their heartbeat every JOBS_HEARTBEAT_INTERVAL seconds, a job whose
+    # owner died or whose heartbeat is older than JOBS_STALE_AFTER seconds is run again
+    JOBS_HEARTBEAT_INTERVAL = 30
+    JOBS_STALE_AFTER = 300
+
+    # Interrupted encryptions of other hosts are recovered by runjobs once FILE_OPERATION_GRACE
+    # seconds old, those of this host as soon as their process is gone
+    FILE_OPERATION_GRACE = 24 * 60 * 60
+
+    # Processes encrypting/decrypting folders in bulk, None means one per CPU core
+    BULK_CRYPTO_WORKERS = None
+
+    # Verified share sets and their file key are cached in memory for KEY_CACHE_TTL seconds
+    KEY_CACHE_SIZE = 128
+    KEY_CACHE_TTL = 30
+
     # Application definition
 
     INSTALLED_APPS = [
@@ -24,6 +78,7 @@ class Common(Configuration):
         'django.contrib.staticfiles',
         'file_handler.apps.FileHandlerConfig',
         'shared_secret.apps.SharedSecretConfig',
+        'jobs.apps.JobsConfig',
         'crispy_forms',
         'rest_framework',
         'oauth2_provider',
@@ -146,4 +201,5 @@ class Dev(Common):
     }
     SECRET_KEY = 'yup'
     ALLOWED_HOSTS = ['web']
+    DOWNLOAD_ACCEL_REDIRECT = True
 
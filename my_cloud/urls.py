@@ -24,6 +24,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('file_handler.urls')),
     path('s/', include('shared_secret.urls')),
+    path('jobs/', include('jobs.urls')),
     path('o/', include('oauth2_provider.urls', namespace='oauth2_provider')),
     path('login/', auth_views.LoginView.as_view(template_name='auth/login.html')),
     path('logout/', auth_views.LogoutView.as_view()),
@@ -0,0 +1,67 @@
+import base64
+import hashlib
+import secrets
+import time
+from django.conf import settings
+from cryptography.fernet import Fernet, InvalidToken
+from .crypto import FileKey
+
+
+def _fernet():
+    """ return a fernet instance keyed on the project secret key """
+    digest = hashlib.sha256(b'my_cloud.access' + settings.SECRET_KEY.encode('utf-8')).digest()
+    return Fernet(base64.urlsafe_b64encode(digest))
+
+
+def seal(data):
+    """ encrypt and authenticate data with the project secret key, return a text token """
+    return _fernet().encrypt(data).decode('utf-8')
+
+
+def unseal(token, ttl=None):
+    """ return data sealed in token or None if token is forged or older than ttl seconds """
+    try:
+        return _fernet().decrypt(token.encode('utf-8'), ttl=ttl)
+    except (InvalidToken, UnicodeError):
+        return None
+
+
+# session key of the access tokens granted to the user
+SESSION_KEY = 'access_tokens'
+
+
+def _live_tokens(session):
+    """ return the unexpired access tokens of a session, expired ones are dropped from it """
+    now = time.time()
+    tokens = session.get(SESSION_KEY, {})
+    live = {token: entry for token, entry in tokens.items() if entry[3] > now}
+    if len(live) != len(tokens):
+        session[SESSION_KEY] = live
+    return live
+
+
+def make_token(session, document, key):
+    """
+    grant short lived plaintext access to an encrypted document, key is the FileKey of its file
+    (see crypto.file_key) so the token opens no other file. The sealed key stays in the session,
+    the returned token is a random id naming it: a logged download url gives nothing away
+    """
+    tokens = _live_tokens(session)
+    token = secrets.token_urlsafe(16)
+    tokens[token] = [document.id, document.file.name, seal(bytes(key)), time.time() + settings.ACCESS_TOKEN_TTL]
+    session[SESSION_KEY] = tokens
+    return token
+
+
+def read_token(session, token, document):
+    """ return the FileKey of token or None if token is unknown, expired or doesn't match the document """
+    entry = _live_tokens(session).get(token)
+    if entry is None:
+        return None
+    document_id, file_name, sealed, _ = entry
+    if document_id != document.id or file_name != document.file.name:
+        return None
+    key = unseal(sealed, settings.ACCESS_TOKEN_TTL)
+    if key is None:
+        return None
+    return FileKey(key)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SharedSecretConfig(AppConfig):
     name = 'shared_secret'
+
+    def ready(self):
+        import shared_secret.tasks
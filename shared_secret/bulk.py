@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from file_handler.models import Document
+from .models import FileOperation
+from . import crypto
+import os
+import time
+
+
+def _encrypt(source, output, key, segment_size, codec):
+    """ pool task: encrypt file at source path into output path, return (output path, bytes processed) """
+    crypto.encrypt_path(source, output, key, segment_size, codec=codec, reserved=True)
+    return output, os.path.getsize(source)
+
+
+def _decrypt(source, output, key):
+    """ pool task: decrypt file at source path into output path, return (output path, bytes processed) """
+    crypto.decrypt_path(source, output, key, reserved=True)
+    return output, os.path.getsize(source)
+
+
+def folder_documents(folder, scheme, encrypt=True):
+    """ return documents of the folder subtree an encrypt (or decrypt) operation applies to """
+    documents = Document.objects.filter(folder__in=folder.get_descendants(include_self=True))
+    if encrypt:
+        return documents.filter(scheme__isnull=True)
+    return documents.filter(scheme=scheme)
+
+
+def process_folder(folder, scheme, shares, encrypt=True, workers=None, progress=None):
+    """
+    encrypt (or decrypt) every document in the folder subtree across a pool of processes,
+    the secret is recovered once and the pool only works on files, documents are updated
+    here as soon as their file is ready. Every replacement is journaled before the pool
+    writes its output. Return a report with per-file results and throughput
+    """
+    key = scheme.get_file_key(shares)
+    documents = list(folder_documents(folder, scheme, encrypt))
+    workers = workers or settings.BULK_CRYPTO_WORKERS or os.cpu_count()
+    task = _encrypt if encrypt else _decrypt
+    results = []
+    processed = 0
+    start = time.perf_counter()
+    # pool processes only work on files, they never touch the inherited database connection
+    operations = {}
+    codecs = {}
+    for document in documents:
+        if encrypt:
+            document.unpack()
+            codecs[document.id] = scheme.codec_for(document)
+        target = scheme.target_name(document, encrypt)
+        operations[document.id] = FileOperation.objects.create(document=document, source=document.file.name,
+                                                               target=target)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for document in documents:
+            args = (document.file_path(), settings.MEDIA_ROOT + operations[document.id].target, key)
+            if encrypt:
+                # segment size and codec only matter when writing an encrypted file
+                args += (settings.CRYPTO_SEGMENT_SIZE, codecs[document.id])
+            futures[pool.submit(task, *args)] = document
+        for future in as_completed(futures):
+            document = futures[future]
+            operation = operations[document.id]
+            result = {'document': document.id, 'name': document.name}
+            try:
+                _, size = future.result()
+                result['ok'] = scheme.replace_file(document, document.file.name, operation.target,
+                                                   scheme if encrypt else None, operation)
+                result['bytes'] = size
+                processed += size
+            except Exception as e:
+                operation.recover()
+                result['ok'] = False
+                result['error'] = str(e) or e.__class__.__name__
+            results.append(result)
+            if progress is not None:
+                progress(len(results), len(documents))
+    seconds = time.perf_counter() - start
+    return {
+        'operation': 'encrypt' if encrypt else 'decrypt',
+        'workers': workers,
+        'documents': len(documents),
+        'succeeded': sum(1 for result in results if result['ok']),
+        'failed': sum(1 for result in results if not result['ok']),
+        'bytes': processed,
+        'seconds': round(seconds, 3),
+        'mb_per_second': round(processed / seconds / 2**20, 2) if seconds else 0,
+        'results': results
+    }
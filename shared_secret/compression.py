@@ -0,0 +1,101 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    # zstd is optional, files are compressed with zlib without it
+    zstandard = None
+
+# codec ids stored in the header of encrypted files
+NONE = 0
+ZLIB = 1
+ZSTD = 2
+CODECS = {'zlib': ZLIB, 'zstd': ZSTD}
+ZLIB_LEVEL = 1
+ZSTD_LEVEL = 3
+BLOCK_SIZE = 64 * 1024
+
+
+def available(codec):
+    """ return True if codec can be used here """
+    return codec in (NONE, ZLIB) or (codec == ZSTD and zstandard is not None)
+
+
+def codec_for(mime, name, types):
+    """
+    return the codec compressing files of the given mime type, name is the configured codec
+    ('zlib', 'zstd' or None to disable compression), types are the mime types (or prefixes
+    ending with '/') worth compressing. zstd falls back to zlib when unavailable
+    """
+    if not name or not mime or not any(mime == kind or (kind.endswith('/') and mime.startswith(kind))
+                                       for kind in types):
+        return NONE
+    codec = CODECS[name]
+    return codec if available(codec) else ZLIB
+
+
+class CompressingReader:
+    """ file like object reading the compressed content of src, consumed counts the bytes read from src """
+
+    def __init__(self, src, codec):
+        if codec == ZSTD:
+            self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            self.compressor = zlib.compressobj(ZLIB_LEVEL)
+        self.src = src
+        self.buffer = b''
+        self.consumed = 0
+        self.finished = False
+
+    def read(self, size):
+        while len(self.buffer) < size and not self.finished:
+            data = self.src.read(BLOCK_SIZE)
+            self.consumed += len(data)
+            if data:
+                self.buffer += self.compressor.compress(data)
+            else:
+                self.buffer += self.compressor.flush()
+                self.finished = True
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def decompress(blocks, codec):
+    """ yield the decompressed content of compressed blocks, raise ValueError on malformed content """
+    try:
+        yield from _decompress(blocks, codec)
+    except zlib.error as e:
+        raise ValueError(str(e)) from e
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise ValueError(str(e)) from e
+        raise
+
+
+def _decompress(blocks, codec):
+    """ yield the decompressed content in pieces of bounded size """
+    if codec == NONE:
+        yield from blocks
+        return
+    if not available(codec):
+        raise ValueError('zstandard is required to read this file')
+    if codec == ZSTD:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        for block in blocks:
+            for start in range(0, len(block), BLOCK_SIZE):
+                data = decompressor.decompress(block[start:start + BLOCK_SIZE])
+                if data:
+                    yield data
+        return
+    decompressor = zlib.decompressobj()
+    for block in blocks:
+        while block:
+            data = decompressor.decompress(block, BLOCK_SIZE)
+            block = decompressor.unconsumed_tail
+            if data:
+                yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+    if not decompressor.eof:
+        raise ValueError('truncated compressed stream')
@@ -0,0 +1,482 @@
+import os
+import errno
+import base64
+import struct
+import hmac
+import hashlib
+import collections
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives import padding, hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.backends import default_backend
+from cryptography.exceptions import InvalidTag
+from . import compression
+
+# Segmented file format
+#
+#   header:  MAGIC (4) | version (1) | segment size (4) | nonce prefix (7) | salt (16) | codec (1)
+#   body:    AES-GCM(segment) || tag (16) for every segment of the (compressed) plaintext
+#
+# every segment is encrypted with nonce = prefix | segment index (4) | last flag (1)
+# and authenticated together with the header, segments can't be reordered, dropped
+# or truncated without failing decryption.
+#
+# Keys: the key handed to this module is the master secret recovered from the shares,
+# version 2 and 3 files are encrypted with HKDF(master, salt) so every file has its own subkey.
+# Version 1 files (no salt) and legacy fernet tokens use legacy_key(master)
+#
+# Compression: version 3 files name the codec the plaintext was compressed with before being
+# cut in segments (see compression.py), compressed files are only read sequentially.
+# Version 2 files are version 3 files without the codec byte
+
+MAGIC = b'MCSE'
+VERSION = 3
+HEADER_FORMAT = '>4sBI7s16sB'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+V2_HEADER_FORMAT = '>4sBI7s16s'
+V2_HEADER_SIZE = struct.calcsize(V2_HEADER_FORMAT)
+V1_HEADER_FORMAT = '>4sBI7s'
+V1_HEADER_SIZE = struct.calcsize(V1_HEADER_FORMAT)
+NONCE_PREFIX_SIZE = 7
+SALT_SIZE = 16
+KDF_INFO = b'my_cloud.file.v2'
+TAG_SIZE = 16
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+MAX_SEGMENT_SIZE = 16 * 1024 * 1024
+PART_SUFFIX = '.part'
+
+# Legacy Fernet token layout, see https://github.com/fernet/spec/blob/master/Spec.md
+FERNET_VERSION = 0x80
+FERNET_HEADER_SIZE = 1 + 8 + 16
+FERNET_HMAC_SIZE = 32
+# base64 is decoded 4 chars at a time, keep the read size a multiple of 4
+FERNET_READ_SIZE = 64 * 1024
+
+
+class DecryptionError(Exception):
+    """ raised when a file can't be authenticated or decrypted """
+    pass
+
+
+def derive_key(master, salt):
+    """ return the 32 bytes AES key of a version 2 file given its salt """
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=KDF_INFO, backend=default_backend())
+    return hkdf.derive(master)
+
+
+class FileKey(bytes):
+    """
+    AES key of a single version 2+ file (derive_key of its salt), accepted in place of the
+    master key to read that file only
+    """
+    pass
+
+
+def file_key(src, master):
+    """
+    return the FileKey opening file object src and nothing else, None for version 1 and fernet
+    files which only open with the scheme wide legacy key
+    """
+    position = src.tell()
+    try:
+        if not _is_segmented(src):
+            return None
+        header = _read_exactly(src, HEADER_SIZE)
+        if len(header) < len(MAGIC) + 1 or header[len(MAGIC)] not in (2, VERSION):
+            return None
+        header_format = HEADER_FORMAT if header[len(MAGIC)] == VERSION else V2_HEADER_FORMAT
+        header = header[:struct.calcsize(header_format)]
+        if len(header) != struct.calcsize(header_format):
+            raise DecryptionError('truncated header')
+        return FileKey(derive_key(master, struct.unpack(header_format, header)[4]))
+    finally:
+        src.seek(position)
+
+
+def legacy_key(master):
+    """
+    return the key of version 1 and fernet files: the secret as a decimal string
+    zero padded or truncated to 32 chars
+    """
+    return str(int.from_bytes(master, 'big')).ljust(32, '0')[:32].encode('ascii')
+
+
+def _nonce(prefix, index, last):
+    return prefix + struct.pack('>IB', index, 1 if last else 0)
+
+
+def _read_exactly(f, size):
+    """ read size bytes unless EOF is reached first """
+    chunks = []
+    while size > 0:
+        chunk = f.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def encrypt_stream(src, dst, key, segment_size=DEFAULT_SEGMENT_SIZE, progress=None, workers=1,
+                   codec=compression.NONE):
+    """
+    encrypt file object src into file object dst using the segmented format, key is the master secret,
+    progress is called with the number of bytes processed so far after every segment.
+    Segments are independent, with workers > 1 they are sealed by a thread pool and written in order.
+    With a codec the plaintext is compressed as it is read, before being cut in segments
+    """
+    if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+        raise ValueError('invalid segment size {}'.format(segment_size))
+    if not compression.available(codec):
+        raise ValueError('codec {} unavailable'.format(codec))
+    prefix = os.urandom(NONCE_PREFIX_SIZE)
+    salt = os.urandom(SALT_SIZE)
+    aead = AESGCM(derive_key(key, salt))
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, segment_size, prefix, salt, codec)
+    dst.write(header)
+    if codec != compression.NONE:
+        src = compression.CompressingReader(src, codec)
+
+    def seal(segment):
+        index, data, last = segment
+        return len(data), aead.encrypt(_nonce(prefix, index, last), data, header)
+
+    done = 0
+    for size, block in _ordered_map(seal, _segments(src, segment_size), workers):
+        dst.write(block)
+        done = src.consumed if codec != compression.NONE else done + size
+        if progress is not None:
+            progress(done)
+
+
+def decrypt_stream(src, dst, key, progress=None, workers=1):
+    """
+    decrypt file object src into file object dst, both segmented and legacy fernet formats are accepted,
+    progress is called with the number of encrypted bytes consumed so far
+    """
+    start = src.tell()
+    for block in iter_plaintext(src, key, workers):
+        dst.write(block)
+        if progress is not None:
+            progress(src.tell() - start)
+
+
+def _segments(src, size):
+    """ yield (index, data, last) for consecutive blocks of size bytes read from src """
+    index = 0
+    current = _read_exactly(src, size)
+    while True:
+        following = _read_exactly(src, size)
+        last = len(following) == 0
+        yield index, current, last
+        if last:
+            break
+        current = following
+        index += 1
+
+
+def _ordered_map(func, items, workers):
+    """
+    yield func(item) for items in order, with workers > 1 items are processed by a thread pool
+    (the cipher releases the GIL) keeping at most 2 * workers of them in memory
+    """
+    if workers is None or workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def encrypt_path(src_path, dst_path, key, segment_size=DEFAULT_SEGMENT_SIZE, progress=None, workers=1,
+                 codec=compression.NONE, reserved=False):
+    """
+    encrypt file at src_path into dst_path, progress is called with (bytes done, total bytes),
+    dst_path only appears once completely written (see atomic_output for reserved)
+    """
+    with open(src_path, 'rb') as src, atomic_output(dst_path, reserved) as dst:
+        encrypt_stream(src, dst, key, segment_size, _total_progress(src, progress), workers, codec)
+
+
+def decrypt_path(src_path, dst_path, key, progress=None, workers=1, reserved=False):
+    """
+    decrypt file at src_path into dst_path, nothing is left at dst_path if decryption fails
+    (see atomic_output for reserved)
+    """
+    with open(src_path, 'rb') as src, atomic_output(dst_path, reserved) as dst:
+        decrypt_stream(src, dst, key, _total_progress(src, progress), workers)
+
+
+def partial_path(path):
+    """ return the temporary path a file is written to before being renamed to path """
+    return path + PART_SUFFIX
+
+
+@contextlib.contextmanager
+def atomic_output(path, reserved=False):
+    """
+    yield a file object writing to a temporary file next to path, on success the file
+    is flushed to disk and moved to path, on error it is removed. A file already at path
+    is never replaced (FileExistsError) unless it is the empty file the caller reserved
+    the name with (reserved=True)
+    """
+    if os.path.exists(path) and not (reserved and os.path.getsize(path) == 0):
+        raise FileExistsError(errno.EEXIST, 'Output file already exists', path)
+    part = partial_path(path)
+    try:
+        with open(part, 'wb') as dst:
+            yield dst
+            dst.flush()
+            os.fsync(dst.fileno())
+        if reserved:
+            os.replace(part, path)
+        else:
+            # unlike a rename, a link fails if the name was taken in the meantime
+            os.link(part, path)
+            os.remove(part)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    _fsync_directory(os.path.dirname(path))
+
+
+def _fsync_directory(path):
+    """ persist a rename, not every platform can open a directory """
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _total_progress(src, progress):
+    """ adapt a (done, total) progress callback to the stream one """
+    if progress is None:
+        return None
+    total = os.fstat(src.fileno()).st_size
+    return lambda done: progress(done, total)
+
+
+def iter_plaintext(src, key, workers=1):
+    """ yield decrypted blocks of file object src, segments are decrypted by workers threads """
+    if _is_segmented(src):
+        return _iter_segmented(src, key, workers)
+    if isinstance(key, FileKey):
+        raise DecryptionError('file has no key of its own')
+    return _iter_fernet(src, key)
+
+
+def open_reader(src, key):
+    """ return a reader giving random access to the plaintext of file object src """
+    if _is_segmented(src):
+        reader = SegmentedReader(src, key)
+        if reader.codec == compression.NONE:
+            return reader
+    return SequentialReader(src, key)
+
+
+def _is_segmented(src):
+    magic = _read_exactly(src, len(MAGIC))
+    src.seek(-len(magic), os.SEEK_CUR)
+    return magic == MAGIC
+
+
+def _read_header(src, key):
+    """ parse segmented header, return (header bytes, segment size, nonce prefix, cipher, codec) """
+    header = _read_exactly(src, len(MAGIC) + 1)
+    version = header[-1] if len(header) == len(MAGIC) + 1 else None
+    if version == VERSION:
+        header_format, header_size = HEADER_FORMAT, HEADER_SIZE
+    elif version == 2:
+        header_format, header_size = V2_HEADER_FORMAT, V2_HEADER_SIZE
+    elif version == 1:
+        header_format, header_size = V1_HEADER_FORMAT, V1_HEADER_SIZE
+    else:
+        raise DecryptionError('unsupported file format')
+    header += _read_exactly(src, header_size - len(header))
+    if len(header) != header_size:
+        raise DecryptionError('truncated header')
+    fields = struct.unpack(header_format, header)
+    magic, version, segment_size, prefix = fields[:4]
+    codec = fields[5] if version == VERSION else compression.NONE
+    if magic != MAGIC:
+        raise DecryptionError('unsupported file format')
+    if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+        raise DecryptionError('invalid segment size')
+    if not compression.available(codec):
+        raise DecryptionError('unsupported codec {}'.format(codec))
+    if isinstance(key, FileKey):
+        if version < 2:
+            raise DecryptionError('file has no key of its own')
+        aead = AESGCM(bytes(key))
+    elif version >= 2:
+        aead = AESGCM(derive_key(key, fields[4]))
+    else:
+        aead = AESGCM(legacy_key(key))
+    return header, segment_size, prefix, aead, codec
+
+
+def _open_segment(aead, header, prefix, index, last, data):
+    try:
+        return aead.decrypt(_nonce(prefix, index, last), data, header)
+    except InvalidTag:
+        raise DecryptionError('segment {} failed authentication'.format(index))
+
+
+def _iter_segmented(src, key, workers=1):
+    header, segment_size, prefix, aead, codec = _read_header(src, key)
+
+    def open_segment(segment):
+        index, data, last = segment
+        return _open_segment(aead, header, prefix, index, last, data)
+
+    segments = _ordered_map(open_segment, _segments(src, segment_size + TAG_SIZE), workers)
+    if codec == compression.NONE:
+        return segments
+    return _decompress(segments, codec)
+
+
+def _decompress(segments, codec):
+    """ yield the decompressed content of authenticated segments """
+    try:
+        yield from compression.decompress(segments, codec)
+    except ValueError as e:
+        raise DecryptionError('malformed compressed content') from e
+
+
+class SegmentedReader:
+    """
+    random access to a segmented file, segments have a fixed size so the position
+    of every segment is computed from its index and only the segments covering the
+    requested range are read and authenticated
+    """
+
+    def __init__(self, src, key):
+        self.src = src
+        self.src.seek(0)
+        self.header, self.segment_size, self.prefix, self.aead, self.codec = _read_header(src, key)
+        self.src.seek(0, os.SEEK_END)
+        body_size = self.src.tell() - len(self.header)
+        block_size = self.segment_size + TAG_SIZE
+        self.segments = max(1, -(-body_size // block_size))
+        self.size = body_size - self.segments * TAG_SIZE
+        if self.size < 0:
+            raise DecryptionError('truncated file')
+
+    def read_segment(self, index):
+        """ return the decrypted segment at index """
+        block_size = self.segment_size + TAG_SIZE
+        self.src.seek(len(self.header) + index * block_size)
+        data = _read_exactly(self.src, block_size)
+        return _open_segment(self.aead, self.header, self.prefix, index, index == self.segments - 1, data)
+
+    def iter_range(self, start, stop):
+        """ yield plaintext bytes in range [start, stop) """
+        stop = min(stop, self.size)
+        position = start
+        while position < stop:
+            index, offset = divmod(position, self.segment_size)
+            segment = self.read_segment(index)
+            chunk = segment[offset:offset + stop - position]
+            position += len(chunk)
+            yield chunk
+
+
+class SequentialReader:
+    """ reader for formats without random access, ranges are served decrypting from the beginning """
+
+    size = None
+
+    def __init__(self, src, key):
+        self.src = src
+        self.key = key
+
+    def iter_range(self, start, stop):
+        """ yield plaintext bytes in range [start, stop) """
+        self.src.seek(0)
+        position = 0
+        for block in iter_plaintext(self.src, self.key):
+            if position >= stop:
+                break
+            chunk = block[max(start - position, 0):stop - position]
+            position += len(block)
+            if chunk:
+                yield chunk
+
+
+def _iter_fernet_token(src):
+    """ yield raw bytes of a base64url fernet token read from src """
+    pending = b''
+    while True:
+        data = src.read(FERNET_READ_SIZE)
+        if not data:
+            break
+        data = pending + data.strip()
+        usable = len(data) - len(data) % 4
+        pending = data[usable:]
+        if usable:
+            yield base64.urlsafe_b64decode(data[:usable])
+    if pending:
+        raise DecryptionError('malformed fernet token')
+
+
+def _iter_fernet(src, key):
+    """
+    decrypt a legacy fernet token in bounded memory, the first pass verifies the HMAC
+    so no plaintext is released before the whole token is authenticated
+    """
+    key = legacy_key(key)
+    signing_key, encryption_key = key[:16], key[16:]
+    start = src.tell()
+    try:
+        # first pass: authenticate
+        mac = hmac.new(signing_key, digestmod=hashlib.sha256)
+        tail = b''
+        length = 0
+        for block in _iter_fernet_token(src):
+            block = tail + block
+            tail = block[-FERNET_HMAC_SIZE:]
+            mac.update(block[:-FERNET_HMAC_SIZE])
+            length += len(block) - len(tail)
+        if length < FERNET_HEADER_SIZE or len(tail) != FERNET_HMAC_SIZE:
+            raise DecryptionError('truncated fernet token')
+        if not hmac.compare_digest(mac.digest(), tail):
+            raise DecryptionError('fernet token failed authentication')
+        # second pass: decrypt
+        src.seek(start)
+        decryptor = None
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        remaining = length
+        buffered = b''
+        for block in _iter_fernet_token(src):
+            if decryptor is None:
+                buffered += block
+                if len(buffered) < FERNET_HEADER_SIZE:
+                    continue
+                if buffered[0] != FERNET_VERSION:
+                    raise DecryptionError('unsupported fernet version')
+                iv = buffered[9:FERNET_HEADER_SIZE]
+                decryptor = Cipher(algorithms.AES(encryption_key), modes.CBC(iv)).decryptor()
+                block = buffered[FERNET_HEADER_SIZE:]
+                remaining -= FERNET_HEADER_SIZE
+            block = block[:max(remaining, 0)]
+            remaining -= len(block)
+            yield unpadder.update(decryptor.update(block))
+        yield unpadder.update(decryptor.finalize()) + unpadder.finalize()
+    except ValueError as e:
+        raise DecryptionError('malformed fernet token') from e
@@ -1,6 +1,7 @@
 from django import forms
 from shared_secret.models import ShamirSS
-import os
+from shared_secret.tasks import seal_shares
+from jobs.models import Job
 
 
 class EncryptDecryptForm(forms.Form):
@@ -36,39 +37,50 @@ class EncryptDecryptForm(forms.Form):
             raise forms.ValidationError("Wrong shares values")
 
     def encrypt(self, document):
-        """ encrypt the document file and update its model, return True if everything goes smooth """
+        """ queue the encryption of the document file, return the job or None if it can't be encrypted """
         if document.scheme is not None:
             self.add_error(None, 'Document already encrypted')
-            return False
+            return None
         scheme, shares = self.get_shares()
-        enc_file_path = scheme.encrypt_file(document.file_path(), shares)
-        if enc_file_path is None:
-            self.add_error(None, 'Encryption error')
-            return False
-        os.remove(document.file_path())
-        document.file.name = enc_file_path
-        document.scheme = scheme
-        document.save()
-        return True
+        return self._enqueue('encrypt', document, scheme, shares)
 
     def decrypt(self, document):
-        """ decrypt the document file and update its model, return True if everything goes smooth """
+        """ queue the decryption of the document file, return the job """
         scheme, shares = self.get_shares()
-        dec_file_path = scheme.decrypt_file(document.file_path(), shares)
-        if dec_file_path is None:
-            return False
-        os.remove(document.file_path())
-        document.file.name = dec_file_path
-        document.scheme = None
-        document.save()
-        return True
+        return self._enqueue('decrypt', document, scheme, shares)
+
+    def bulk(self, folder, encrypt=True):
+        """ queue the encryption (or decryption) of every document in the folder subtree, return the job """
+        scheme, shares = self.get_shares()
+        payload = {
+            'folder': folder.id,
+            'scheme': scheme.id
+        }
+        job = Job.enqueue('bulk_encrypt' if encrypt else 'bulk_decrypt', payload, seal_shares(shares))
+        # the key is recovered again by the worker, drop the one cached while validating
+        scheme.forget_shares(shares)
+        return job
+
+    def _enqueue(self, kind, document, scheme, shares):
+        payload = {
+            'document': document.id,
+            'scheme': scheme.id,
+            'next': '/folder/{}/'.format(document.folder_id)
+        }
+        job = Job.enqueue(kind, payload, seal_shares(shares))
+        # the key is recovered again by the worker, drop the one cached while validating
+        scheme.forget_shares(shares)
+        return job
 
 
 class SSForm(forms.ModelForm):
 
+    verifier = forms.ChoiceField(choices=ShamirSS.VERIFIER_CHOICES, required=False, initial=ShamirSS.VERIFIER_BLAKE2,
+                                 label='Secret verifier')
+
     class Meta:
         model = ShamirSS
-        fields = ('name', 'mers_exp', 'k', 'n')
+        fields = ('name', 'mers_exp', 'k', 'n', 'verifier')
         labels = {
             'name': 'Scheme name',
             'mers_exp': 'Field size exponent (Mersenne prime notation)',
@@ -76,6 +88,9 @@ class SSForm(forms.ModelForm):
             'n': 'Total shares to generate (n)'
         }
 
+    def clean_verifier(self):
+        return self.cleaned_data.get('verifier') or ShamirSS.VERIFIER_BLAKE2
+
     def clean(self):
         cleaned_data = super().clean()
         n = cleaned_data.get('n')
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from django.conf import settings
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+
+class KeyCache:
+    """
+    Bounded in-memory cache of verified share sets and the file key they recover.
+    Entries expire after a few seconds, shares are never stored (entries are looked up
+    by a keyed digest of them) and keys are kept in bytearrays zeroed on eviction
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # per process key, digests are useless outside this process
+        self._digest_key = os.urandom(32)
+
+    def _settings(self):
+        max_size = self.max_size if self.max_size is not None else settings.KEY_CACHE_SIZE
+        ttl = self.ttl if self.ttl is not None else settings.KEY_CACHE_TTL
+        return max_size, ttl
+
+    def _digest(self, scheme, shares):
+        mac = hmac.new(self._digest_key, digestmod=hashlib.sha256)
+        mac.update('{}:{}'.format(scheme.pk, scheme.secret).encode('utf-8'))
+        for index, share in sorted((int(index), str(share)) for index, share in shares):
+            mac.update('|{}:{}'.format(index, share).encode('utf-8'))
+        return mac.digest()
+
+    @staticmethod
+    def _wipe(key):
+        for i in range(len(key)):
+            key[i] = 0
+
+    def get(self, scheme, shares):
+        """ return the cached key of a verified share set or None """
+        digest = self._digest(scheme, shares)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            expires, key = entry
+            if expires < time.monotonic():
+                del self._entries[digest]
+                self._wipe(key)
+                return None
+            return bytes(key)
+
+    def put(self, scheme, shares, key):
+        """ cache the key recovered by a verified share set """
+        max_size, ttl = self._settings()
+        if max_size <= 0 or ttl <= 0:
+            return
+        digest = self._digest(scheme, shares)
+        with self._lock:
+            self.pop(digest)
+            self._entries[digest] = (time.monotonic() + ttl, bytearray(key))
+            while len(self._entries) > max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._wipe(evicted)
+
+    def pop(self, digest):
+        """ remove and wipe an entry given its digest, the lock must be held """
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            self._wipe(entry[1])
+
+    def forget(self, scheme, shares):
+        """ wipe the entry of a share set once the caller is done with it """
+        digest = self._digest(scheme, shares)
+        with self._lock:
+            self.pop(digest)
+
+    def clear(self):
+        """ wipe every entry """
+        with self._lock:
+            for digest in list(self._entries):
+                self.pop(digest)
+
+
+key_cache = KeyCache()
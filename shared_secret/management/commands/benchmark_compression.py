@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from shared_secret import compression, crypto
+import io
+import os
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Report compression ratio and encryption throughput of every codec on synthetic documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=32, help='size of every sample in MB')
+
+    def samples(self, size):
+        """ return (name, data) of synthetic text, csv, log and random samples """
+        rng = random.Random(0)
+        words = ['cloud', 'share', 'secret', 'folder', 'document', 'upload', 'the', 'of', 'and', 'key']
+        text = ' '.join(rng.choice(words) for _ in range(size // 5)).encode('ascii')
+        csv = ''.join('{},{},{:.3f},{}\n'.format(i, rng.choice(words), rng.random() * 1000, rng.randrange(10**6))
+                      for i in range(size // 30)).encode('ascii')
+        log = ''.join('2026-10-18 12:{:02d}:{:02d} INFO worker {} job {} done in {} ms\n'.format(
+            i // 60 % 60, i % 60, rng.randrange(8), i, rng.randrange(5000)) for i in range(size // 50)).encode('ascii')
+        return [('text', text[:size]), ('csv', csv[:size]), ('log', log[:size]), ('random', os.urandom(size))]
+
+    def handle(self, *args, **options):
+        size = options['size'] * 2**20
+        key = os.urandom(32)
+        codecs = [('none', compression.NONE), ('zlib', compression.ZLIB)]
+        if compression.available(compression.ZSTD):
+            codecs.append(('zstd', compression.ZSTD))
+        else:
+            self.stdout.write('zstandard not installed, zstd skipped')
+        self.stdout.write('{:>8} {:>6} {:>8} {:>10} {:>10}'.format('sample', 'codec', 'ratio', 'encrypt', 'decrypt'))
+        for name, data in self.samples(size):
+            for codec_name, codec in codecs:
+                encrypted = io.BytesIO()
+                start = time.perf_counter()
+                crypto.encrypt_stream(io.BytesIO(data), encrypted, key, codec=codec)
+                encrypt = len(data) / 2**20 / (time.perf_counter() - start)
+                encrypted.seek(0)
+                decrypted = io.BytesIO()
+                start = time.perf_counter()
+                crypto.decrypt_stream(encrypted, decrypted, key)
+                decrypt = len(data) / 2**20 / (time.perf_counter() - start)
+                assert decrypted.getvalue() == data
+                self.stdout.write('{:>8} {:>6} {:>8.2f} {:>10.1f} {:>10.1f}'.format(
+                    name, codec_name, len(data) / len(encrypted.getvalue()), encrypt, decrypt))
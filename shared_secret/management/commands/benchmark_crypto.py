@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from shared_secret import crypto
+from cryptography.fernet import Fernet
+import base64
+import io
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compare file encryption throughput of fernet and of the segmented format across thread counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=128, help='plaintext size in MB')
+        parser.add_argument('--segment-size', default='64,1024,4096', help='comma separated segment sizes in KB')
+        parser.add_argument('--workers', default='1,2,4,8,16', help='comma separated thread counts')
+
+    def rate(self, size, func):
+        """ return MB/s of func processing size bytes """
+        start = time.perf_counter()
+        func()
+        return size / 2**20 / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        size = options['size'] * 2**20
+        data = os.urandom(size)
+        key = os.urandom(32)
+        self.stdout.write('{} MB in memory, {} cpus, rates in MB/s'.format(options['size'], os.cpu_count()))
+        self.stdout.write('{:>24} {:>8} {:>10} {:>10}'.format('mode', 'workers', 'encrypt', 'decrypt'))
+        fernet = Fernet(base64.urlsafe_b64encode(crypto.legacy_key(key)))
+        token = []
+        encrypt = self.rate(size, lambda: token.append(fernet.encrypt(data)))
+        decrypt = self.rate(size, lambda: fernet.decrypt(token.pop()))
+        self.stdout.write('{:>24} {:>8} {:>10.1f} {:>10.1f}'.format('fernet', 1, encrypt, decrypt))
+        for segment_size in (int(value) * 1024 for value in options['segment_size'].split(',')):
+            for workers in (int(value) for value in options['workers'].split(',')):
+                encrypted = io.BytesIO()
+                encrypt = self.rate(size, lambda: crypto.encrypt_stream(io.BytesIO(data), encrypted, key,
+                                                                          segment_size, workers=workers))
+                encrypted.seek(0)
+                decrypted = io.BytesIO()
+                decrypt = self.rate(size, lambda: crypto.decrypt_stream(encrypted, decrypted, key, workers=workers))
+                assert decrypted.getvalue() == data
+                self.stdout.write('{:>24} {:>8} {:>10.1f} {:>10.1f}'.format(
+                    'segmented {} KB'.format(segment_size // 1024), workers, encrypt, decrypt))
@@ -0,0 +1,108 @@
+from django.core.management.base import BaseCommand
+from shared_secret.models import ShamirSS
+from shared_secret import polynomial
+import random
+import timeit
+
+
+def legacy_extended_gcd(a, b):
+    """ extended Euclidean algorithm, as used by the original interpolation """
+    x = 0
+    last_x = 1
+    y = 1
+    last_y = 0
+    while b != 0:
+        quot = a // b
+        a, b = b, a % b
+        x, last_x = last_x - quot * x, x
+        y, last_y = last_y - quot * y, y
+    return last_x, last_y
+
+
+def legacy_divmod(num, den, p):
+    inv, _ = legacy_extended_gcd(den, p)
+    return num * inv
+
+
+def legacy_interpolate(x, x_s, y_s, p):
+    """ original interpolation: unreduced products and one extended gcd per term """
+    k = len(x_s)
+
+    def PI(vals):
+        accum = 1
+        for v in vals:
+            accum *= v
+        return accum
+
+    nums = []
+    dens = []
+    for i in range(k):
+        others = list(x_s)
+        cur = others.pop(i)
+        nums.append(PI(x - o for o in others))
+        dens.append(PI(cur - o for o in others))
+    den = PI(dens)
+    num = sum([legacy_divmod(nums[i] * den * y_s[i] % p, dens[i], p) for i in range(k)])
+    return (legacy_divmod(num, den, p) + p) % p
+
+
+def legacy_generate(poly, n, p):
+    """ original share generation: Horner's rule at every x, O(n * k) """
+    points = []
+    for x in range(1, n + 1):
+        accum = 0
+        for coeff in reversed(poly):
+            accum = (accum * x + coeff) % p
+        points.append((x, accum))
+    return points
+
+
+class Command(BaseCommand):
+    help = 'Compare share generation and secret recovery timings of the legacy and current implementations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', default='2,5,10,20,50,100,200,500,1000,2000',
+                            help='comma separated numbers of shares to interpolate')
+        parser.add_argument('--n-factor', type=int, default=2, help='shares generated are n = k * n-factor')
+        parser.add_argument('--mers-exp', type=int, default=127, help='Mersenne prime exponent of the field')
+        parser.add_argument('--repeat', type=int, default=5, help='runs per measure')
+        parser.add_argument('--legacy-max', type=int, default=200,
+                            help='skip the legacy implementation above this k (it is quadratic in big numbers)')
+
+    def time(self, func, repeat):
+        """ return best time of func in milliseconds """
+        return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+    def handle(self, *args, **options):
+        prime = 2 ** options['mers_exp'] - 1
+        repeat = options['repeat']
+        scheme = ShamirSS(mers_exp=options['mers_exp'])
+        self.stdout.write('field 2^{}-1, best of {} runs, times in ms'.format(options['mers_exp'], repeat))
+        self.stdout.write('{:>6} {:>6} | {:>10} {:>10} | {:>10} {:>10} {:>10}'.format(
+            'k', 'n', 'gen legacy', 'gen', 'rec legacy', 'rec cold', 'rec cached'))
+        for k in (int(value) for value in options['k'].split(',')):
+            n = k * options['n_factor']
+            points = scheme._generate_shares(k, n, prime)
+            secret = points.pop()
+            # interpolate on a spread out subset, the slowest case
+            points = random.sample(points, k)
+            x_s, y_s = zip(*points)
+            assert polynomial.interpolate_at_zero(points, prime) == secret
+            legacy = k <= options['legacy_max']
+            if legacy:
+                assert legacy_interpolate(0, x_s, y_s, prime) == secret
+
+            def cold():
+                polynomial.basis_at_zero.cache_clear()
+                polynomial.interpolate_at_zero(points, prime)
+
+            poly = [random.randrange(prime) for i in range(k)]
+            row = [
+                self.time(lambda: legacy_generate(poly, n, prime), repeat) if legacy else None,
+                self.time(lambda: polynomial.evaluate_newton(poly, n, prime), repeat),
+                self.time(lambda: legacy_interpolate(0, x_s, y_s, prime), repeat) if legacy else None,
+                self.time(cold, repeat),
+                self.time(lambda: polynomial.interpolate_at_zero(points, prime), repeat)
+            ]
+            self.stdout.write('{:>6} {:>6} | {:>10} {:>10} | {:>10} {:>10} {:>10}'.format(
+                k, n, *('-' if value is None else '{:.2f}'.format(value) for value in row)))
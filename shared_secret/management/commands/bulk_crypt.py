@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from file_handler.models import Folder
+from shared_secret.models import ShamirSS
+from shared_secret.bulk import process_folder
+
+
+class Command(BaseCommand):
+    help = 'Encrypt or decrypt every document of a folder subtree across a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('folder', type=int, help='folder id')
+        parser.add_argument('scheme', type=int, help='scheme id')
+        parser.add_argument('--share', action='append', default=[], metavar='INDEX:SHARE',
+                            help='share and its index, repeat for at least k shares')
+        parser.add_argument('--decrypt', action='store_true', help='decrypt instead of encrypt')
+        parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+
+    def handle(self, *args, **options):
+        try:
+            folder = Folder.objects.get(pk=options['folder'])
+            scheme = ShamirSS.objects.get(pk=options['scheme'])
+        except (Folder.DoesNotExist, ShamirSS.DoesNotExist) as e:
+            raise CommandError(e)
+        shares = []
+        for share in options['share']:
+            index, _, value = share.partition(':')
+            if not index.isdigit() or not value:
+                raise CommandError('Malformed share {}'.format(share))
+            shares.append((int(index), value))
+        if len(shares) < scheme.k or not scheme.validate_shares(shares):
+            raise CommandError('Wrong shares values')
+        # shares are validated once, process_folder reuses the cached key
+        report = process_folder(folder, scheme, shares, not options['decrypt'], options['workers'])
+        scheme.forget_shares(shares)
+        for result in report['results']:
+            status = 'ok' if result['ok'] else 'FAILED {}'.format(result.get('error', ''))
+            self.stdout.write('{:>8} {:>14} {} {}'.format(result['document'], result.get('bytes', '-'),
+                                                        result['name'], status))
+        self.stdout.write('{operation}ed {succeeded}/{documents} documents ({failed} failed), '
+                          '{bytes} bytes in {seconds}s: {mb_per_second} MB/s with {workers} workers'.format(**report))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from shared_secret.models import ShamirSS
+import json
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Validate many share subsets of a scheme at once and report corrupted shares'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scheme', type=int, help='scheme id')
+        parser.add_argument('file', nargs='?', default='-',
+                            help='JSON list of share subsets, each a list of [index, share] (default stdin)')
+
+    def handle(self, *args, **options):
+        try:
+            scheme = ShamirSS.objects.get(pk=options['scheme'])
+        except ShamirSS.DoesNotExist as e:
+            raise CommandError(e)
+        try:
+            if options['file'] == '-':
+                data = json.load(sys.stdin)
+            else:
+                with open(options['file']) as file:
+                    data = json.load(file)
+            share_sets = [[(int(index), share) for index, share in shares] for shares in data]
+        except (OSError, ValueError, TypeError) as e:
+            raise CommandError('Malformed share subsets: {}'.format(e))
+        report = scheme.validate_share_sets(share_sets)
+        for i, (shares, valid) in enumerate(zip(share_sets, report['valid'])):
+            self.stdout.write('{:>4} {:>7} indexes {}'.format(i, 'valid' if valid else 'INVALID',
+                                                             ','.join(str(index) for index, _ in shares)))
+        self.stdout.write('good shares: {}'.format(','.join(str(index) for index, _ in report['good']) or '-'))
+        for name in ('bad', 'malformed', 'unverifiable'):
+            self.stdout.write('{} shares: {}'.format(name, ','.join(str(index) for index, _ in report[name]) or '-'))
@@ -0,0 +1,40 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from shared_secret.models import ShamirSS
+import json
+import time
+
+
+class Command(BaseCommand):
+    help = 'Create many schemes at once and write their shares as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='number of schemes to create')
+        parser.add_argument('--name', default='scheme', help='name prefix, schemes are named <name>-<number>')
+        parser.add_argument('--k', type=int, required=True, help='minimum number of shares to decrypt')
+        parser.add_argument('--n', type=int, required=True, help='total shares to generate')
+        parser.add_argument('--mers-exp', type=int, default=127, help='Mersenne prime exponent of the field')
+        parser.add_argument('--verifier', default=ShamirSS.VERIFIER_BLAKE2,
+                            choices=[value for value, _ in ShamirSS.VERIFIER_CHOICES])
+        parser.add_argument('--batch-size', type=int, default=500, help='rows per insert query')
+        parser.add_argument('--output', default=None, help='write shares to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        schemes = [ShamirSS(name='{}-{}'.format(options['name'], i + 1), k=options['k'], n=options['n'],
+                            mers_exp=options['mers_exp'], verifier=options['verifier'])
+                   for i in range(options['count'])]
+        start = time.perf_counter()
+        try:
+            created = ShamirSS.provision(schemes, options['batch_size'])
+        except (ValidationError, ValueError) as e:
+            raise CommandError(e)
+        seconds = time.perf_counter() - start
+        data = json.dumps([{'id': scheme.id, 'name': scheme.name, 'shares': shares}
+                           for scheme, shares in created])
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(data)
+        else:
+            self.stdout.write(data)
+        self.stderr.write('created {} schemes in {:.3f}s ({:.1f} schemes/s)'.format(
+            len(created), seconds, len(created) / seconds if seconds else 0))
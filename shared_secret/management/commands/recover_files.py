@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from shared_secret.models import FileOperation
+
+
+class Command(BaseCommand):
+    help = 'Finish or roll back document encryptions and decryptions interrupted by a crash'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=0,
+                            help='only recover operations of other hosts started at least this many seconds ago, '
+                                 'those of this host are recovered once their process is gone')
+
+    def handle(self, *args, **options):
+        finished, rolled_back = FileOperation.recover_all(options['older_than'])
+        self.stdout.write('{} operations finished, {} rolled back'.format(finished, rolled_back))
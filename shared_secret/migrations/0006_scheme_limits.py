@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:15
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_secret', '0005_auto_20190307_1211'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shamirss',
+            name='k',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(2), django.core.validators.MaxValueValidator(4096)]),
+        ),
+        migrations.AlterField(
+            model_name='shamirss',
+            name='mers_exp',
+            field=models.IntegerField(choices=[(89, '89'), (107, '107'), (127, '127'), (521, '521'), (607, '607'), (1279, '1279')]),
+        ),
+        migrations.AlterField(
+            model_name='shamirss',
+            name='n',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(2), django.core.validators.MaxValueValidator(4096)]),
+        ),
+    ]
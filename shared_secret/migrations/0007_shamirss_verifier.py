@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_secret', '0006_scheme_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shamirss',
+            name='verifier',
+            field=models.CharField(choices=[('blake2', 'Keyed BLAKE2b commitment (fast)'), ('password', 'Django password hasher (slow)')], default='blake2', max_length=16),
+        ),
+    ]
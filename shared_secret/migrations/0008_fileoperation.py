@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_handler', '0005_upload'),
+        ('shared_secret', '0007_shamirss_verifier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileOperation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('target', models.CharField(max_length=255)),
+                ('creation_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('document', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='file_handler.Document')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:55
+
+from django.db import migrations, models
+import jobs.process
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_secret', '0008_fileoperation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileoperation',
+            name='owner',
+            field=models.CharField(blank=True, default=jobs.process.current_owner, max_length=100),
+        ),
+    ]
@@ -1,37 +1,58 @@
+import os
+import datetime
 import random
 import functools
 import base64
-from django.db import models
+import hashlib
+import hmac
+import struct
+import zlib
+import uuid
+from django.db import models, transaction
+from django.utils import timezone
 from django.conf import settings
+from django.core.validators import MinValueValidator, MaxValueValidator
 import django.contrib.auth.hashers as hashers
-from cryptography.fernet import Fernet
 from pathlib import Path
+from . import compression, crypto, polynomial
+from .keycache import key_cache
+from jobs.process import current_owner, is_alive, is_dead
 
 
 class ShamirSS(models.Model):
 
-    MAX_N = 20
+    MAX_N = 4096
 
     MERSENNE_EXP_VALUES = (
         # see https://oeis.org/A000043 mersenne prime sequence
         (89, '89'),
         (107, '107'),
         (127, '127'),
+        (521, '521'),
+        (607, '607'),
+        (1279, '1279'),
     )
 
-    K_CHOICES = (
-        zip(range(2, MAX_N + 1), range(2,  MAX_N + 1))
-    )
+    VERIFIER_BLAKE2 = 'blake2'
+    VERIFIER_PASSWORD = 'password'
 
-    N_CHOICES = (
-        zip(range(2,  MAX_N + 1), range(2,  MAX_N + 1))
+    VERIFIER_CHOICES = (
+        (VERIFIER_BLAKE2, 'Keyed BLAKE2b commitment (fast)'),
+        (VERIFIER_PASSWORD, 'Django password hasher (slow)'),
     )
 
+    BLAKE2_PERSON = b'my_cloud.shamir'
+
+    SHARE_PREFIX = 'v2.'
+    SHARE_VERSION = 2
+    SHARE_HEADER_FORMAT = '>BIH'
+
     name = models.CharField(max_length=200)
     mers_exp = models.IntegerField(choices=MERSENNE_EXP_VALUES)
-    k = models.IntegerField(choices=K_CHOICES)
-    n = models.IntegerField(choices=N_CHOICES)
+    k = models.IntegerField(validators=[MinValueValidator(2), MaxValueValidator(MAX_N)])
+    n = models.IntegerField(validators=[MinValueValidator(2), MaxValueValidator(MAX_N)])
     secret = models.CharField(max_length=128)
+    verifier = models.CharField(max_length=16, choices=VERIFIER_CHOICES, default=VERIFIER_BLAKE2)
 
     def __str__(self):
         return "{} ({}, {})".format(self.name, self.k, self.n)
@@ -43,22 +64,155 @@ class ShamirSS(models.Model):
         """ generate n shares and store hashed secret """
         prime = (2**self.mers_exp) - 1
         shares = self._generate_shares(self.k, self.n, prime)
-        secret = str(shares[-1])
+        secret = shares[-1]
         del shares[-1]
-        hashed_secret = hashers.make_password(secret)
-        self.secret = hashed_secret
+        self.secret = self.make_verifier(secret)
         return self.encode_shares(shares)
 
+    @classmethod
+    def provision(cls, schemes, batch_size=None):
+        """
+        create many unsaved schemes at once, return [(scheme, encoded shares), ...] in input order.
+        Polynomials of the schemes sharing (k, n, mers_exp) are evaluated together and rows are
+        inserted with bulk_create
+        """
+        groups = {}
+        for scheme in schemes:
+            scheme.full_clean(exclude=['secret'])
+            if scheme.k > scheme.n:
+                raise ValueError('pool secret would be irrecoverable')
+            groups.setdefault((scheme.k, scheme.n, scheme.mers_exp), []).append(scheme)
+        points = {}
+        for (k, n, mers_exp), group in groups.items():
+            prime = (2**mers_exp) - 1
+            polys = [cls._random_polynomial(k, prime) for scheme in group]
+            for scheme, poly, values in zip(group, polys, polynomial.evaluate_newton_many(polys, n, prime)):
+                scheme.secret = scheme.make_verifier(poly[0])
+                points[id(scheme)] = list(zip(range(1, n + 1), values))
+        created = cls.objects.bulk_create(schemes, batch_size=batch_size)
+        if any(scheme.pk is None for scheme in created):
+            # backends not returning ids on bulk insert, verifiers are unique per scheme
+            ids = {}
+            for start in range(0, len(created), 500):
+                secrets = [scheme.secret for scheme in created[start:start + 500]]
+                ids.update(cls.objects.filter(secret__in=secrets).values_list('secret', 'id'))
+            for scheme in created:
+                scheme.pk = ids[scheme.secret]
+        # shares carry the scheme id, encode them once rows are inserted
+        return [(scheme, scheme.encode_shares(points[id(scheme)])) for scheme in created]
+
+    def make_verifier(self, secret):
+        """ return the value stored to check the secret, in the format of the scheme verifier """
+        if self.verifier == self.VERIFIER_PASSWORD:
+            return hashers.make_password(str(secret))
+        salt = os.urandom(16)
+        return '{}${}${}'.format(self.VERIFIER_BLAKE2, salt.hex(), self._blake2(secret, salt))
+
+    def _blake2(self, secret, salt):
+        return hashlib.blake2b(self.master_key(secret), digest_size=32, key=salt, person=self.BLAKE2_PERSON).hexdigest()
+
+    def check_secret(self, secret):
+        """
+        return true if secret matches the stored verifier, a verifier in another format than the
+        scheme one (e.g. rows created before verifier modes) is replaced after a successful check
+        """
+        algorithm, _, rest = self.secret.partition('$')
+        if algorithm == self.VERIFIER_BLAKE2:
+            salt, _, digest = rest.partition('$')
+            try:
+                valid = hmac.compare_digest(self._blake2(secret, bytes.fromhex(salt)), digest)
+            except ValueError:
+                return False
+            stored = self.VERIFIER_BLAKE2
+        else:
+            valid = hashers.check_password(str(secret), self.secret)
+            stored = self.VERIFIER_PASSWORD
+        if valid and stored != self.verifier:
+            self.secret = self.make_verifier(secret)
+            if self.pk is not None:
+                ShamirSS.objects.filter(pk=self.pk).update(secret=self.secret)
+        return valid
+
     def validate_shares(self, shares):
-        """ return true if shares match with secret """
+        """ return true if shares match with secret, verified share sets are cached for a short time """
         if not isinstance(shares, list):
             raise ValueError('unrecognized data')
+        if key_cache.get(self, shares) is not None:
+            return True
         try:
-            shares = self.decode_shares(shares)
-            secret = self.get_secret(shares)
-            return hashers.check_password(str(secret), self.secret)
+            secret = self.get_secret(self.decode_shares(shares))
+            if not self.check_secret(secret):
+                return False
         except:
             return False
+        key_cache.put(self, shares, self.master_key(secret))
+        return True
+
+    def validate_share_sets(self, share_sets):
+        """
+        validate many encoded share subsets in one pass, return a report with a boolean per subset
+        and the shares found good, bad, malformed (they can't be decoded) or unverifiable (there
+        are not k - 1 other good shares to check them with), each as supplied by the caller.
+        Lagrange bases are cached per index set and the secret verifier is checked once per
+        distinct recovered secret. Once the secret is known every other share is checked alone:
+        interpolated with k - 1 good shares it must give the same secret
+        """
+        prime = (2**self.mers_exp) - 1
+        recovered = []
+        malformed = []
+        # decoded share -> share as supplied, legacy shares are reported in the legacy format
+        supplied = {}
+        for shares in share_sets:
+            decoded, secret = [], None
+            for share in shares:
+                try:
+                    point = self.decode_shares([share])[0]
+                except (ValueError, TypeError, IndexError):
+                    if share not in malformed:
+                        malformed.append(share)
+                    continue
+                supplied.setdefault(point, share)
+                decoded.append(point)
+            if len(decoded) == len(shares):
+                try:
+                    secret = self.get_secret(decoded)
+                except (ValueError, TypeError):
+                    pass
+            recovered.append((decoded, secret))
+        verified = {}
+        for _, secret in recovered:
+            if secret is not None and secret not in verified:
+                verified[secret] = self.check_secret(secret)
+        valid = [secret is not None and verified[secret] for _, secret in recovered]
+        good = set()
+        for (decoded, _), is_valid in zip(recovered, valid):
+            if is_valid:
+                good.update(decoded)
+        bad = set()
+        unverifiable = set(supplied) - good
+        if good:
+            secret = next(secret for (_, secret), is_valid in zip(recovered, valid) if is_valid)
+            by_index = {}
+            for share in good:
+                by_index.setdefault(share[0], share)
+            for share in sorted(unverifiable):
+                others = [other for index, other in sorted(by_index.items()) if index != share[0]][:self.k - 1]
+                if len(others) < self.k - 1:
+                    continue
+                unverifiable.discard(share)
+                if self._recover_secret(others + [share], prime) == secret:
+                    good.add(share)
+                else:
+                    bad.add(share)
+        report = lambda shares: [supplied[share] for share in sorted(shares)]
+        return {
+            'valid': valid,
+            'good': report(good),
+            'bad': report(bad),
+            'unverifiable': report(unverifiable),
+            'malformed': malformed,
+            'secrets_checked': len(verified)
+        }
 
     def get_secret(self, shares):
         """ recover the secret given at least k shares """
@@ -68,148 +222,209 @@ class ShamirSS(models.Model):
         return self._recover_secret(shares, prime)
 
     def get_key(self, secret):
-        """ return a base64 encoded 32 bytes string of the secret """
-        str_secret = str(secret)
-        while len(str_secret) != 32:
-            if len(str_secret) < 32:
-                # insert 0 padding
-                str_secret += '0'
-            elif len(str_secret) > 32:
-                # truncate if too long
-                str_secret = str_secret[:32]
-        byte_secret = bytes(str_secret, 'utf-8')
-        return base64.b64encode(byte_secret)
+        """ return the base64 encoded legacy key (32 decimal digits of the secret) """
+        return base64.b64encode(crypto.legacy_key(self.master_key(secret)))
+
+    def master_key(self, secret):
+        """ return the secret as fixed size big endian bytes, file keys are derived from it """
+        return secret.to_bytes((self.mers_exp + 7) // 8, 'big')
+
+    def get_file_key(self, shares):
+        """ return the master key used to derive file keys given encoded shares """
+        key = key_cache.get(self, shares)
+        if key is not None:
+            return key
+        return self.master_key(self.get_secret(self.decode_shares(shares)))
+
+    def forget_shares(self, shares):
+        """ wipe the cached key of a share set """
+        key_cache.forget(self, shares)
 
     def encode_shares(self, shares):
-        """ encode shares as base 64 bytes string """
+        """
+        encode shares as 'v2.' + base64url of version (1) | scheme id (4) | index (2) |
+        fixed width big endian value | crc32 (4), a scheme id of 0 means the scheme was not saved yet
+        """
+        width = (self.mers_exp + 7) // 8
         ret_list = []
-        for share in shares:
-            b_share = bytes(str(share[1]), 'utf-8')
-            b_encoded = base64.b64encode(b_share)
-            ret_list.append((share[0], b_encoded.decode('utf-8')))
+        for index, value in shares:
+            data = struct.pack(self.SHARE_HEADER_FORMAT, self.SHARE_VERSION, self.pk or 0, index)
+            data += value.to_bytes(width, 'big')
+            data += struct.pack('>I', zlib.crc32(data))
+            ret_list.append((index, self.SHARE_PREFIX + base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')))
         return ret_list
 
     def decode_shares(self, shares):
-        """ decode shares as integers """
+        """ decode shares as integers, both binary and legacy (base64 of the decimal value) shares are accepted """
         ret_list = []
         for share in shares:
-            b_share = base64.b64decode(bytes(share[1], 'utf-8'))
-            ret_list.append((share[0], int(b_share.decode('utf-8'))))
+            if share[1].startswith(self.SHARE_PREFIX):
+                index, value = self._decode_share(share[1][len(self.SHARE_PREFIX):])
+                if index != int(share[0]):
+                    raise ValueError('share index mismatch')
+                ret_list.append((share[0], value))
+            else:
+                b_share = base64.b64decode(bytes(share[1], 'utf-8'))
+                ret_list.append((share[0], int(b_share.decode('utf-8'))))
         return ret_list
 
-    def encrypt_file(self, file_path, shares):
-        """ encrypt a file using secret as key, return encrypted file path or None if file doesn't exists """
+    def _decode_share(self, encoded):
+        """ return (index, value) of a binary share, raise ValueError if it's corrupted or belongs to another scheme """
+        data = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+        header_size = struct.calcsize(self.SHARE_HEADER_FORMAT)
+        if len(data) != header_size + (self.mers_exp + 7) // 8 + 4:
+            raise ValueError('wrong share size')
+        if struct.unpack('>I', data[-4:])[0] != zlib.crc32(data[:-4]):
+            raise ValueError('share checksum mismatch')
+        version, scheme_id, index = struct.unpack(self.SHARE_HEADER_FORMAT, data[:header_size])
+        if version != self.SHARE_VERSION:
+            raise ValueError('unsupported share version')
+        if scheme_id and self.pk and scheme_id != self.pk:
+            raise ValueError('share belongs to another scheme')
+        return index, int.from_bytes(data[header_size:-4], 'big')
+
+    def encrypt_file(self, file_path, shares, progress=None, codec=compression.NONE, output_file=None):
+        """
+        encrypt a file using secret as key, return encrypted file path or None if file doesn't exists,
+        progress is called with (bytes done, total bytes) while encrypting, the content is
+        compressed first with codec. The output goes to output_file, a name reserved by the caller,
+        or to file_path + '.enc' which must be free
+        """
         check_file = Path(file_path)
         if check_file.is_file():
-            output_file = file_path + '.enc'
-            secret = self.get_secret(self.decode_shares(shares))
-            key = self.get_key(secret)
-            with open(file_path, 'rb') as f:
-                data = f.read()
-            fernet = Fernet(key)
-            encrypted = fernet.encrypt(data)
-            with open(output_file, 'wb') as f:
-                f.write(encrypted)
+            reserved = output_file is not None
+            output_file = output_file or file_path + '.enc'
+            key = self.get_file_key(shares)
+            crypto.encrypt_path(file_path, output_file, key, settings.CRYPTO_SEGMENT_SIZE, progress,
+                                settings.CRYPTO_WORKERS, codec, reserved)
             # return relative path to MEDIA path
             remove_len = len(settings.MEDIA_ROOT)
             return output_file[remove_len:]
         return None
 
-    def decrypt_file(self, file_path, shares):
-        """ decrypt a file using secret as key, return decrypted file path or None if file doesn't exists """
+    def decrypt_file(self, file_path, shares, progress=None, output_file=None):
+        """
+        decrypt a file using secret as key, return decrypted file path or None if file doesn't exists,
+        progress is called with (bytes done, total bytes) while decrypting. The output goes to
+        output_file, a name reserved by the caller, or to file_path without the '.enc' extension
+        which must be free
+        """
         check_file = Path(file_path)
         if check_file.is_file():
-            output_file = file_path[:-4]
-            secret = self.get_secret(self.decode_shares(shares))
-            key = self.get_key(secret)
-            with open(file_path, 'rb') as f:
-                data = f.read()
-            fernet = Fernet(key)
-            encrypted = fernet.decrypt(data)
-            with open(output_file, 'wb') as f:
-                f.write(encrypted)
+            reserved = output_file is not None
+            output_file = output_file or file_path[:-4]
+            key = self.get_file_key(shares)
+            crypto.decrypt_path(file_path, output_file, key, progress, settings.CRYPTO_WORKERS, reserved)
             # return relative path to MEDIA path
             remove_len = len(settings.MEDIA_ROOT)
             return output_file[remove_len:]
         return None
 
-    # https://en.wikipedia.org/wiki/Shamir%27s_Secret_Sharing#Python_example
+    def encrypt_document(self, document, shares, progress=None):
+        """ encrypt the file of a document and link it to the scheme, return True if everything goes smooth """
+        if document.scheme_id is not None:
+            return False
+        # encryption works on files, packed content is stored as a file again first
+        document.unpack()
+        codec = self.codec_for(document)
+        target = self.target_name(document, encrypt=True)
+        return self._replace_document_file(document, target, self, lambda: self.encrypt_file(
+            document.file_path(), shares, progress, codec, settings.MEDIA_ROOT + target))
+
+    @staticmethod
+    def target_name(document, encrypt=True):
+        """
+        reserve a free name for the encrypted (or decrypted) file of document, return it. It is
+        taken next to the uploads in a directory of its own so the file name is kept, names in
+        the content addressed tree belong to the storage and may be shared with other documents
+        """
+        field = document._meta.get_field('file')
+        filename = document.filename()
+        if encrypt:
+            filename += '.enc'
+        elif filename.endswith('.enc'):
+            filename = filename[:-4]
+        name = field.generate_filename(None, '{}/{}'.format(uuid.uuid4().hex, filename))
+        return field.storage.reserve(name, max_length=field.max_length)
+
+    @staticmethod
+    def codec_for(document):
+        """ return the codec compressing the file of a document before encryption, chosen by mime type """
+        return compression.codec_for(document.file_mime(), settings.COMPRESSION_CODEC, settings.COMPRESSION_TYPES)
+
+    def decrypt_document(self, document, shares, progress=None):
+        """ decrypt the file of a document and unlink it from the scheme, return True if everything goes smooth """
+        if document.scheme_id != self.id:
+            return False
+        target = self.target_name(document, encrypt=False)
+        return self._replace_document_file(document, target, None, lambda: self.decrypt_file(
+            document.file_path(), shares, progress, settings.MEDIA_ROOT + target))
+
+    def _replace_document_file(self, document, target, scheme, write):
+        """ journal the replacement, write the new file then point the document to it """
+        source = document.file.name
+        operation = FileOperation.objects.create(document=document, source=source, target=target)
+        try:
+            written = write()
+        except BaseException:
+            operation.recover()
+            raise
+        if written is None:
+            operation.recover()
+            return False
+        return self.replace_file(document, source, target, scheme, operation)
+
+    def replace_file(self, document, source, target, scheme, operation=None):
+        """
+        atomically point document to target file, the source file is removed once committed,
+        operation is the journal entry of the replacement, cleared once the source is gone
+        """
+        with transaction.atomic():
+            locked = type(document).objects.select_for_update().get(pk=document.pk)
+            if locked.file.name != source or locked.scheme_id != document.scheme_id:
+                # document changed in the meantime, drop our output
+                os.remove(settings.MEDIA_ROOT + target)
+                if operation is not None:
+                    operation.delete()
+                return False
+            locked.file.name = target
+            locked.update_content_hash()
+            locked.update_file_info()
+            locked.scheme = scheme
+            locked.modified = timezone.now()
+            locked.save()
+            transaction.on_commit(lambda: self._remove_source(locked.file.storage, source, operation))
+        document.refresh_from_db()
+        return True
+
+    @staticmethod
+    def _remove_source(storage, source, operation):
+        # the storage drops the reference, content shared with other documents stays
+        with transaction.atomic():
+            storage.delete(source)
+            if operation is not None:
+                operation.delete()
 
-    def _eval_at(self, poly, x, prime):
-        """evaluates polynomial (coefficient tuple) at x, used to generate a
-        shamir pool in make_random_shares below. """
-        accum = 0
-        for coeff in reversed(poly):
-            accum *= x
-            accum += coeff
-            accum %= prime
-        return accum
+    # https://en.wikipedia.org/wiki/Shamir%27s_Secret_Sharing#Python_example
 
     def _generate_shares(self, minimum, shares, prime):
         """ Generates a random shamir pool, returns the secret and the share
-        points as a list where the last item is the secret."""
-        _RINT = functools.partial(random.SystemRandom().randint, 0)
+        points as a list where the last item is the secret.
+        The random polynomial is drawn in the binomial basis f(x) = sum(c_j * C(x, j)),
+        a uniform choice of c_j is a uniform polynomial of degree < minimum with
+        f(0) = c_0, and the shares at 1..shares are evaluated all at once."""
         if minimum > shares:
             raise ValueError("pool secret would be irrecoverable")
-        poly = [_RINT(prime) for i in range(minimum)]
-        points = [(i, self._eval_at(poly, i, prime))
-                  for i in range(1, shares + 1)]
+        poly = self._random_polynomial(minimum, prime)
+        points = list(zip(range(1, shares + 1), polynomial.evaluate_newton(poly, shares, prime)))
         points.append(poly[0])
         return points
 
-    def _extended_gcd(self, a, b):
-        """
-        division in integers modulus p means finding the inverse of the
-        denominator modulo p and then multiplying the numerator by this
-        inverse (Note: inverse of A is B such that A*B % p == 1) this can
-        be computed via extended Euclidean algorithm
-        http://en.wikipedia.org/wiki/Modular_multiplicative_inverse#Computation
-        """
-        x = 0
-        last_x = 1
-        y = 1
-        last_y = 0
-        while b != 0:
-            quot = a // b
-            a, b = b, a % b
-            x, last_x = last_x - quot * x, x
-            y, last_y = last_y - quot * y, y
-        return last_x, last_y
-
-    def _divmod(self, num, den, p):
-        """compute num / den modulo prime p
-
-        To explain what this means, the return value will be such that
-        the following is true: den * _divmod(num, den, p) % p == num
-        """
-        inv, _ = self._extended_gcd(den, p)
-        return num * inv
-
-    def _lagrange_interpolate(self, x, x_s, y_s, p):
-        """
-        Find the y-value for the given x, given n (x, y) points;
-        k points will define a polynomial of up to kth order
-        """
-        k = len(x_s)
-        assert k == len(set(x_s)), "points must be distinct"
-
-        def PI(vals):  # upper-case PI -- product of inputs
-            accum = 1
-            for v in vals:
-                accum *= v
-            return accum
-
-        nums = []  # avoid inexact division
-        dens = []
-        for i in range(k):
-            others = list(x_s)
-            cur = others.pop(i)
-            nums.append(PI(x - o for o in others))
-            dens.append(PI(cur - o for o in others))
-        den = PI(dens)
-        num = sum([self._divmod(nums[i] * den * y_s[i] % p, dens[i], p)
-                   for i in range(k)])
-        return (self._divmod(num, den, p) + p) % p
+    @staticmethod
+    def _random_polynomial(minimum, prime):
+        """ return minimum random coefficients in [0, prime) """
+        _RINT = functools.partial(random.SystemRandom().randint, 0, prime - 1)
+        return [_RINT() for i in range(minimum)]
 
     def _recover_secret(self, shares, prime):
         """
@@ -218,5 +433,65 @@ class ShamirSS(models.Model):
         """
         if len(shares) < 2:
             raise ValueError("need at least two shares")
-        x_s, y_s = zip(*shares)
-        return self._lagrange_interpolate(0, x_s, y_s, prime)
+        return polynomial.interpolate_at_zero(shares, prime)
+
+
+class FileOperation(models.Model):
+    """
+    Journal of a document file replacement (encryption or decryption). The row is committed
+    before the new file is written and deleted once the old file is gone, rows left behind
+    by a crash are resolved by recover() looking at the file the document points to
+    """
+    document = models.ForeignKey('file_handler.Document', on_delete=models.SET_NULL, null=True)
+    source = models.CharField(max_length=255)
+    target = models.CharField(max_length=255)
+    creation_date = models.DateTimeField(default=timezone.now)
+    # process running the replacement, see jobs.process
+    owner = models.CharField(max_length=100, blank=True, default=current_owner)
+
+    def __str__(self):
+        return '{} -> {}'.format(self.source, self.target)
+
+    def recover(self):
+        """
+        finish the operation if the document points to the new file (remove the old one),
+        roll it back otherwise (remove the new file and its partial copy), return True if finished
+        """
+        self.refresh_from_db()
+        document = self.document
+        committed = document is not None and document.file.name == self.target
+        if committed:
+            leftovers = [self.source]
+        elif document is None:
+            leftovers = [self.source, self.target]
+        else:
+            leftovers = [self.target]
+        Document = self._meta.get_field('document').related_model
+        storage = Document._meta.get_field('file').storage
+        for name in leftovers:
+            if storage.exists(name) and not Document.objects.filter(file=name).exists():
+                storage.delete(name)
+        part = crypto.partial_path(settings.MEDIA_ROOT + self.target)
+        if os.path.isfile(part):
+            os.remove(part)
+        self.delete()
+        return committed
+
+    @classmethod
+    def recover_all(cls, older_than=0):
+        """
+        resolve operations left behind by dead processes, return (finished, rolled back) counts.
+        Operations of a process of this host are resolved once it is gone and never while it
+        runs, the others (other hosts) once started more than older_than seconds ago
+        """
+        finished = rolled_back = 0
+        limit = timezone.now() - datetime.timedelta(seconds=older_than)
+        for operation in cls.objects.order_by('id'):
+            if is_alive(operation.owner) or not (is_dead(operation.owner) or operation.creation_date <= limit):
+                continue
+            if operation.recover():
+                finished += 1
+            else:
+                rolled_back += 1
+        return finished, rolled_back
+
@@ -0,0 +1,189 @@
+"""
+Modular arithmetic for Shamir's secret sharing over GF(p), every intermediate value
+is reduced modulo p so operands never grow beyond the field size
+"""
+import decimal
+import functools
+import operator
+import sys
+
+# small integer factors are multiplied exactly in groups of this size
+# before reducing modulo p (share indexes are a few bits long)
+PRODUCT_CHUNK = 64
+# polynomial products above this many bits are computed with decimal arithmetic
+DECIMAL_PRODUCT_BITS = 64 * 1024
+# up to this many k * n terms shares are evaluated against a cached table of binomials
+BINOMIAL_BASIS_SIZE = 32 * 1024
+# cached Lagrange and binomial bases, one can weigh close to a megabyte (thousands of
+# indexes of a 1279 bit prime) and the cache lives as long as the process
+BASIS_CACHE_SIZE = 8
+
+if sys.version_info >= (3, 8):
+    def inverse(value, p):
+        """ return the inverse of value modulo prime p """
+        return pow(value, -1, p)
+else:
+    def inverse(value, p):
+        """ return the inverse of value modulo prime p (Fermat's little theorem) """
+        if value % p == 0:
+            raise ValueError('0 has no inverse')
+        return pow(value, p - 2, p)
+
+
+def batch_inverse(values, p):
+    """
+    return the inverses of values modulo p with a single modular inversion
+    (Montgomery's trick: invert the product of all values then unwind the prefix products)
+    """
+    prefix = []
+    accum = 1
+    for value in values:
+        prefix.append(accum)
+        accum = accum * value % p
+    accum_inv = inverse(accum, p)
+    inverses = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        inverses[i] = prefix[i] * accum_inv % p
+        accum_inv = accum_inv * values[i] % p
+    return inverses
+
+
+def product(values, p):
+    """ return the product of values modulo p, values are multiplied exactly chunk by chunk """
+    accum = 1
+    for start in range(0, len(values), PRODUCT_CHUNK):
+        accum = accum * functools.reduce(operator.mul, values[start:start + PRODUCT_CHUNK], 1) % p
+    return accum
+
+
+def factorials(n, p):
+    """ return lists of i! and 1/i! modulo p for i in 0..n """
+    fact = [1] * (n + 1)
+    for i in range(1, n + 1):
+        fact[i] = fact[i - 1] * i % p
+    inv_fact = [1] * (n + 1)
+    inv_fact[n] = inverse(fact[n], p)
+    for i in range(n, 0, -1):
+        inv_fact[i - 1] = inv_fact[i] * i % p
+    return fact, inv_fact
+
+
+@functools.lru_cache(maxsize=BASIS_CACHE_SIZE)
+def basis_at_zero(x_s, p):
+    """
+    return the Lagrange basis coefficients at x = 0 for the share indexes x_s (a tuple),
+    f(0) = sum(c_i * y_i) where c_i = prod(x_j / (x_j - x_i)) for j != i.
+    Results are cached, the same index set is interpolated on every validation
+    """
+    if len(set(x % p for x in x_s)) != len(x_s):
+        raise ValueError('points must be distinct')
+    k = len(x_s)
+    # numerators: product of all indexes but x_i, from prefix and suffix products
+    prefix = [1] * (k + 1)
+    for i, x in enumerate(x_s):
+        prefix[i + 1] = prefix[i] * x % p
+    suffix = 1
+    nums = [0] * k
+    for i in range(k - 1, -1, -1):
+        nums[i] = prefix[i] * suffix % p
+        suffix = suffix * x_s[i] % p
+    top = max(x_s)
+    if min(x_s) > 0 and top < p and top - k < k:
+        # indexes cover most of 1..top: prod(x_j - x_i) over the whole range is
+        # (-1)^(x_i - 1) * (x_i - 1)! * (top - x_i)!, divide out the missing indexes
+        fact, inv_fact = factorials(top, p)
+        present = set(x_s)
+        missing = [t for t in range(1, top + 1) if t not in present]
+        coefficients = []
+        for x_i, num in zip(x_s, nums):
+            c = num * product([t - x_i for t in missing], p) % p * inv_fact[x_i - 1] % p * inv_fact[top - x_i] % p
+            coefficients.append(c if x_i % 2 else -c % p)
+        return tuple(coefficients)
+    dens = [product([x_j - x_i for x_j in x_s if x_j != x_i], p) for x_i in x_s]
+    return tuple(num * inv % p for num, inv in zip(nums, batch_inverse(dens, p)))
+
+
+def interpolate_at_zero(points, p):
+    """ return f(0) of the polynomial through points [(x, y), ...] """
+    x_s, y_s = zip(*points)
+    coefficients = basis_at_zero(tuple(x_s), p)
+    return sum(c * y for c, y in zip(coefficients, y_s)) % p
+
+
+def multiply(a, b, p):
+    """
+    return the product of polynomials a and b (coefficient lists) modulo p. Coefficients are
+    packed into two big numbers (Kronecker substitution) and multiplied once: small operands
+    as binary integers, large ones as decimals since libmpdec switches to a number theoretic
+    transform where int multiplication stays Karatsuba
+    """
+    if not a or not b:
+        return []
+    if min(len(a), len(b)) * p.bit_length() < DECIMAL_PRODUCT_BITS:
+        return _multiply_binary(a, b, p)
+    return _multiply_decimal(a, b, p)
+
+
+def _multiply_binary(a, b, p):
+    size = (2 * p.bit_length() + min(len(a), len(b)).bit_length() + 7) // 8
+    pack = lambda poly: int.from_bytes(b''.join(c.to_bytes(size, 'little') for c in poly), 'little')
+    count = len(a) + len(b) - 1
+    data = (pack(a) * pack(b)).to_bytes(size * count, 'little')
+    return [int.from_bytes(data[i * size:(i + 1) * size], 'little') % p for i in range(count)]
+
+
+def _multiply_decimal(a, b, p):
+    width = len(str(p * p * min(len(a), len(b))))
+    context = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+    pack = lambda poly: context.create_decimal(''.join(str(c).zfill(width) for c in reversed(poly)))
+    count = len(a) + len(b) - 1
+    digits = format(context.multiply(pack(a), pack(b)), 'f').zfill(width * count)
+    end = len(digits)
+    return [int(digits[end - (i + 1) * width:end - i * width]) % p for i in range(count)]
+
+
+def evaluate_newton(coefficients, n, p):
+    """
+    return [f(1), ..., f(n)] for f(x) = sum(c_j * binomial(x, j)), n < p.
+    In this basis f(i) / i! = sum((c_j / j!) * (1 / (i - j)!)) is a convolution,
+    all the n points are evaluated with a single polynomial product
+    """
+    return evaluate_newton_many([coefficients], n, p)[0]
+
+
+def evaluate_newton_many(polynomials, n, p):
+    """
+    evaluate_newton for a list of coefficient lists at once: the scaled coefficients of every
+    polynomial are laid side by side, far enough apart that their convolutions don't overlap,
+    so a single product evaluates all polynomials at all points. Small pools are evaluated
+    against a cached binomial table instead
+    """
+    k = max((len(coefficients) for coefficients in polynomials), default=0)
+    if k * n <= BINOMIAL_BASIS_SIZE:
+        # small pools: every polynomial against the same cached table, one reduction per value
+        basis = binomial_basis(k, n, p)
+        return [[sum(map(operator.mul, coefficients, row)) % p for row in basis] for coefficients in polynomials]
+    fact, inv_fact = factorials(n, p)
+    stride = k + n
+    packed = []
+    for coefficients in polynomials:
+        scaled = [c * inv_fact[j] % p for j, c in enumerate(coefficients[:n + 1])]
+        packed.extend(scaled + [0] * (stride - len(scaled)))
+    conv = multiply(packed, inv_fact, p)
+    return [[fact[i] * conv[start + i] % p for i in range(1, n + 1)]
+            for start in range(0, len(packed), stride)]
+
+
+@functools.lru_cache(maxsize=BASIS_CACHE_SIZE)
+def binomial_basis(k, n, p):
+    """
+    return the rows (C(i, 0), ..., C(i, k - 1)) modulo p for i in 1..n, f(i) is the dot product
+    of a row with the coefficients of f. Cached, pools of a shape share the same table
+    """
+    rows = []
+    row = [1] + [0] * (k - 1)
+    for i in range(1, n + 1):
+        # Pascal's rule: C(i, j) = C(i - 1, j) + C(i - 1, j - 1)
+        row = [1] + [(row[j] + row[j - 1]) % p for j in range(1, k)]
+        rows.append(tuple(row))
+    return tuple(rows)
@@ -0,0 +1,75 @@
+from django.conf import settings
+from jobs.registry import register, on_startup
+from file_handler.models import Document, Folder
+from .models import ShamirSS, FileOperation
+from .bulk import process_folder
+from .access import seal, unseal
+from .crypto import DecryptionError
+import json
+
+
+def seal_shares(shares):
+    """ return shares sealed to be stored in a job """
+    return seal(json.dumps(shares).encode('utf-8'))
+
+
+def unseal_shares(token):
+    """ return shares sealed with seal_shares """
+    data = unseal(token)
+    if data is None:
+        raise ValueError('Shares unavailable')
+    return [tuple(share) for share in json.loads(data.decode('utf-8'))]
+
+
+@on_startup
+def recover_file_operations():
+    """ finish or roll back document file replacements interrupted by a crash """
+    finished, rolled_back = FileOperation.recover_all(settings.FILE_OPERATION_GRACE)
+    if finished or rolled_back:
+        return 'Recovered file operations: {} finished, {} rolled back'.format(finished, rolled_back)
+
+
+@register('encrypt')
+def encrypt(job):
+    """ encrypt a document with the shares sealed in the job """
+    payload = job.get_payload()
+    document = Document.objects.get(pk=payload['document'])
+    scheme = ShamirSS.objects.get(pk=payload['scheme'])
+    if not scheme.encrypt_document(document, unseal_shares(job.secret), job.set_progress):
+        raise ValueError('Encryption error')
+    return {'document': document.id}
+
+
+@register('decrypt')
+def decrypt(job):
+    """ decrypt a document with the shares sealed in the job """
+    payload = job.get_payload()
+    document = Document.objects.get(pk=payload['document'])
+    scheme = ShamirSS.objects.get(pk=payload['scheme'])
+    try:
+        decrypted = scheme.decrypt_document(document, unseal_shares(job.secret), job.set_progress)
+    except DecryptionError:
+        decrypted = False
+    if not decrypted:
+        raise ValueError('Decryption error')
+    return {'document': document.id}
+
+
+def bulk(job, encrypt):
+    """ encrypt or decrypt a folder subtree with the shares sealed in the job """
+    payload = job.get_payload()
+    folder = Folder.objects.get(pk=payload['folder'])
+    scheme = ShamirSS.objects.get(pk=payload['scheme'])
+    return process_folder(folder, scheme, unseal_shares(job.secret), encrypt, payload.get('workers'), job.set_progress)
+
+
+@register('bulk_encrypt')
+def bulk_encrypt(job):
+    """ encrypt every plaintext document of a folder subtree """
+    return bulk(job, True)
+
+
+@register('bulk_decrypt')
+def bulk_decrypt(job):
+    """ decrypt every document of a folder subtree encrypted with the job scheme """
+    return bulk(job, False)
@@ -0,0 +1,183 @@
+from django.test import SimpleTestCase
+from shared_secret import compression, crypto
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import base64
+import io
+import os
+import shutil
+import tempfile
+import struct
+
+
+class SegmentedCryptoTestCase(SimpleTestCase):
+    """ Test for the streaming segmented encryption format """
+
+    SEGMENT_SIZE = 1024
+
+    def setUp(self):
+        self.key = os.urandom(32)
+
+    def encrypt(self, data, key=None):
+        dst = io.BytesIO()
+        crypto.encrypt_stream(io.BytesIO(data), dst, key or self.key, self.SEGMENT_SIZE)
+        return dst.getvalue()
+
+    def decrypt(self, data, key=None):
+        dst = io.BytesIO()
+        crypto.decrypt_stream(io.BytesIO(data), dst, key or self.key)
+        return dst.getvalue()
+
+    def test_round_trip(self):
+        """ Test encryption and decryption on segment boundaries """
+        for size in (0, 1, self.SEGMENT_SIZE - 1, self.SEGMENT_SIZE, self.SEGMENT_SIZE * 3, self.SEGMENT_SIZE * 3 + 7):
+            data = os.urandom(size)
+            encrypted = self.encrypt(data)
+            self.assertTrue(encrypted.startswith(crypto.MAGIC))
+            self.assertEqual(data, self.decrypt(encrypted))
+
+    def test_parallel(self):
+        """ Test segments processed by a thread pool are written in order and still authenticated """
+        data = os.urandom(self.SEGMENT_SIZE * 20 + 3)
+        for workers in (2, 4):
+            encrypted = io.BytesIO()
+            crypto.encrypt_stream(io.BytesIO(data), encrypted, self.key, self.SEGMENT_SIZE, workers=workers)
+            self.assertEqual(data, self.decrypt(encrypted.getvalue()))
+            decrypted = io.BytesIO()
+            crypto.decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted, self.key, workers=workers)
+            self.assertEqual(data, decrypted.getvalue())
+            tampered = bytearray(encrypted.getvalue())
+            tampered[-100] ^= 1
+            self.assertRaises(crypto.DecryptionError, lambda: crypto.decrypt_stream(
+                io.BytesIO(bytes(tampered)), io.BytesIO(), self.key, workers=workers))
+
+    def test_compression(self):
+        """ Test compressed files are smaller, decrypt to the original content and are read sequentially """
+        data = b'2026-10-18 12:00:00 INFO job done\n' * 1000
+        for codec in (compression.ZLIB, compression.ZSTD):
+            if not compression.available(codec):
+                continue
+            encrypted = io.BytesIO()
+            done = []
+            crypto.encrypt_stream(io.BytesIO(data), encrypted, self.key, self.SEGMENT_SIZE, done.append, codec=codec)
+            self.assertEqual(len(data), done[-1])
+            self.assertLess(len(encrypted.getvalue()), len(data) // 4)
+            self.assertEqual(data, self.decrypt(encrypted.getvalue()))
+            reader = crypto.open_reader(io.BytesIO(encrypted.getvalue()), self.key)
+            self.assertIsNone(reader.size)
+            self.assertEqual(data[100:5000], b''.join(reader.iter_range(100, 5000)))
+            # the codec is authenticated with the header
+            tampered = bytearray(encrypted.getvalue())
+            tampered[crypto.HEADER_SIZE - 1] = compression.NONE
+            self.assertRaises(crypto.DecryptionError, lambda: self.decrypt(bytes(tampered)))
+        self.assertEqual(compression.ZLIB, compression.codec_for('text/csv', 'zlib', ['text/']))
+        self.assertEqual(compression.NONE, compression.codec_for('image/png', 'zlib', ['text/']))
+        self.assertEqual(compression.NONE, compression.codec_for('text/csv', None, ['text/']))
+
+    def test_wrong_key(self):
+        """ Test decryption with a different key fails """
+        encrypted = self.encrypt(b'some data')
+        self.assertRaises(crypto.DecryptionError, lambda: self.decrypt(encrypted, os.urandom(32)))
+
+    def test_tampering(self):
+        """ Test modified, truncated or reordered segments are detected """
+        data = os.urandom(self.SEGMENT_SIZE * 3)
+        encrypted = bytearray(self.encrypt(data))
+        encrypted[crypto.HEADER_SIZE + 10] ^= 1
+        self.assertRaises(crypto.DecryptionError, lambda: self.decrypt(bytes(encrypted)))
+        encrypted = self.encrypt(data)
+        block = self.SEGMENT_SIZE + crypto.TAG_SIZE
+        # drop the last segment
+        self.assertRaises(crypto.DecryptionError, lambda: self.decrypt(encrypted[:-block]))
+        # swap first and second segment
+        body = encrypted[crypto.HEADER_SIZE:]
+        swapped = encrypted[:crypto.HEADER_SIZE] + body[block:2 * block] + body[:block] + body[2 * block:]
+        self.assertRaises(crypto.DecryptionError, lambda: self.decrypt(swapped))
+
+    def test_atomic_output(self):
+        """ Test decrypt_path leaves nothing behind on failure and replaces the output only when complete """
+        directory = tempfile.mkdtemp()
+        source, output = os.path.join(directory, 'source'), os.path.join(directory, 'output')
+        with open(source, 'wb') as file:
+            file.write(self.encrypt(b'some data'))
+        self.assertRaises(crypto.DecryptionError, lambda: crypto.decrypt_path(source, output, os.urandom(32)))
+        self.assertEqual(['source'], os.listdir(directory))
+        crypto.decrypt_path(source, output, self.key)
+        with open(output, 'rb') as file:
+            self.assertEqual(b'some data', file.read())
+        shutil.rmtree(directory)
+
+    def test_taken_output(self):
+        """ Test a file already at the output name is never replaced, only an empty reservation is """
+        directory = tempfile.mkdtemp()
+        source, output = os.path.join(directory, 'source'), os.path.join(directory, 'output')
+        with open(source, 'wb') as file:
+            file.write(self.encrypt(b'some data'))
+        with open(output, 'wb') as file:
+            file.write(b'someone else')
+        for reserved in (False, True):
+            self.assertRaises(FileExistsError, lambda: crypto.decrypt_path(source, output, self.key, reserved=reserved))
+        with open(output, 'rb') as file:
+            self.assertEqual(b'someone else', file.read())
+        self.assertEqual(['output', 'source'], sorted(os.listdir(directory)))
+        # the empty file reserving the name is replaced
+        open(output, 'wb').close()
+        crypto.decrypt_path(source, output, self.key, reserved=True)
+        with open(output, 'rb') as file:
+            self.assertEqual(b'some data', file.read())
+        shutil.rmtree(directory)
+
+    def test_file_key(self):
+        """ Test the key of a file opens that file only and legacy files have none """
+        first, second = io.BytesIO(self.encrypt(b'first file')), io.BytesIO(self.encrypt(b'second file'))
+        key = crypto.file_key(first, self.key)
+        self.assertIsInstance(key, crypto.FileKey)
+        self.assertNotEqual(self.key, key)
+        self.assertEqual(0, first.tell())
+        self.assertEqual(b'first file', b''.join(crypto.iter_plaintext(first, key)))
+        self.assertEqual(b'file', b''.join(crypto.open_reader(io.BytesIO(first.getvalue()), key).iter_range(6, 10)))
+        self.assertRaises(crypto.DecryptionError, lambda: b''.join(crypto.iter_plaintext(second, key)))
+        legacy = io.BytesIO(Fernet(base64.urlsafe_b64encode(crypto.legacy_key(self.key))).encrypt(b'legacy'))
+        self.assertIsNone(crypto.file_key(legacy, self.key))
+        self.assertRaises(crypto.DecryptionError, lambda: b''.join(crypto.iter_plaintext(legacy, key)))
+
+    def test_legacy_fernet(self):
+        """ Test files encrypted with the legacy fernet format are still readable """
+        data = os.urandom(crypto.FERNET_READ_SIZE + 123)
+        token = Fernet(base64.urlsafe_b64encode(crypto.legacy_key(self.key))).encrypt(data)
+        self.assertEqual(data, self.decrypt(token))
+        tampered = token[:-10] + (b'A' if token[-10:-9] != b'A' else b'B') + token[-9:]
+        self.assertRaises(crypto.DecryptionError, lambda: self.decrypt(tampered))
+
+    def test_key_derivation(self):
+        """ Test every file gets its own subkey and version 1 files use the legacy key """
+        data = os.urandom(self.SEGMENT_SIZE + 5)
+        first, second = self.encrypt(data), self.encrypt(data)
+        self.assertEqual(crypto.VERSION, first[len(crypto.MAGIC)])
+        salt = first[crypto.HEADER_SIZE - crypto.SALT_SIZE - 1:crypto.HEADER_SIZE - 1]
+        self.assertNotEqual(salt, second[crypto.HEADER_SIZE - crypto.SALT_SIZE - 1:crypto.HEADER_SIZE - 1])
+        self.assertNotEqual(crypto.derive_key(self.key, salt), self.key)
+        # a version 1 file, encrypted with the legacy key and no salt
+        prefix = os.urandom(crypto.NONCE_PREFIX_SIZE)
+        header = struct.pack(crypto.V1_HEADER_FORMAT, crypto.MAGIC, 1, self.SEGMENT_SIZE, prefix)
+        aead = AESGCM(crypto.legacy_key(self.key))
+        body = aead.encrypt(crypto._nonce(prefix, 0, False), data[:self.SEGMENT_SIZE], header)
+        body += aead.encrypt(crypto._nonce(prefix, 1, True), data[self.SEGMENT_SIZE:], header)
+        self.assertEqual(data, self.decrypt(header + body))
+        reader = crypto.open_reader(io.BytesIO(header + body), self.key)
+        self.assertEqual(len(data), reader.size)
+        self.assertEqual(data[10:self.SEGMENT_SIZE + 3], b''.join(reader.iter_range(10, self.SEGMENT_SIZE + 3)))
+
+    def test_random_access(self):
+        """ Test any range of a segmented file can be decrypted on its own """
+        data = os.urandom(self.SEGMENT_SIZE * 4 + 100)
+        reader = crypto.open_reader(io.BytesIO(self.encrypt(data)), self.key)
+        self.assertEqual(len(data), reader.size)
+        for start, stop in ((0, 1), (0, len(data)), (10, self.SEGMENT_SIZE + 10),
+                            (self.SEGMENT_SIZE * 2, self.SEGMENT_SIZE * 3), (len(data) - 5, len(data) + 50)):
+            self.assertEqual(data[start:stop], b''.join(reader.iter_range(start, stop)))
+        # legacy files are read sequentially
+        token = Fernet(base64.urlsafe_b64encode(crypto.legacy_key(self.key))).encrypt(data)
+        reader = crypto.open_reader(io.BytesIO(token), self.key)
+        self.assertIsNone(reader.size)
+        self.assertEqual(data[100:5000], b''.join(reader.iter_range(100, 5000)))
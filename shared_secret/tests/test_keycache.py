@@ -0,0 +1,58 @@
+from django.test import SimpleTestCase
+from shared_secret.models import ShamirSS
+from shared_secret.keycache import KeyCache, key_cache
+from unittest import mock
+import django.contrib.auth.hashers as hashers
+import time
+
+
+class KeyCacheTestCase(SimpleTestCase):
+    """ Test for the verified share sets key cache """
+
+    def setUp(self):
+        self.scheme = ShamirSS(name='test', mers_exp=107, k=3, n=5, verifier=ShamirSS.VERIFIER_PASSWORD)
+        self.shares = self.scheme.get_shares()
+        key_cache.clear()
+
+    def tearDown(self):
+        key_cache.clear()
+
+    def test_validate_once(self):
+        """ Test the password hasher runs once per share set """
+        shares = self.shares[:3]
+        with mock.patch.object(hashers, 'check_password', wraps=hashers.check_password) as check:
+            self.assertTrue(self.scheme.validate_shares(shares))
+            self.assertTrue(self.scheme.validate_shares(list(reversed(shares))))
+            self.assertEqual(check.call_count, 1)
+            key = self.scheme.get_file_key(shares)
+            # wrong shares are never cached
+            value = self.scheme.decode_shares([self.shares[3]])[0][1]
+            wrong = [shares[0], shares[1], self.scheme.encode_shares([(shares[2][0], value)])[0]]
+            self.assertFalse(self.scheme.validate_shares(wrong))
+            self.assertFalse(self.scheme.validate_shares(wrong))
+            self.assertEqual(check.call_count, 3)
+        # check cached key matches the recovered one
+        key_cache.clear()
+        self.assertEqual(key, self.scheme.get_file_key(shares))
+
+    def test_forget(self):
+        """ Test wiped entries are not reused """
+        shares = self.shares[1:4]
+        self.assertTrue(self.scheme.validate_shares(shares))
+        self.assertIsNotNone(key_cache.get(self.scheme, shares))
+        self.scheme.forget_shares(shares)
+        self.assertIsNone(key_cache.get(self.scheme, shares))
+        # refreshed shares invalidate the cache
+        self.assertTrue(self.scheme.validate_shares(shares))
+        self.scheme.get_shares()
+        self.assertIsNone(key_cache.get(self.scheme, shares))
+
+    def test_bounds(self):
+        """ Test entries expire and the cache size is bounded """
+        cache = KeyCache(max_size=2, ttl=0.05)
+        for i in range(3):
+            cache.put(self.scheme, [(1, str(i))], bytes([i]) * 32)
+        self.assertIsNone(cache.get(self.scheme, [(1, '0')]))
+        self.assertEqual(bytes([2]) * 32, cache.get(self.scheme, [(1, '2')]))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get(self.scheme, [(1, '2')]))
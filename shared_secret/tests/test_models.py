@@ -1,11 +1,20 @@
 from django.test import TestCase
 from shared_secret.models import ShamirSS
 from shared_secret.forms import SSForm
+from shared_secret import compression, crypto
+from file_handler.models import Document, Folder
+from django.core.files.base import ContentFile
 import django.contrib.auth.hashers as hashers
 from django.conf import settings
+from cryptography.fernet import Fernet
+import base64
 import os
 import hashlib
 import random
+import io
+import json
+from django.core.management import call_command
+from unittest import mock
 
 
 class ShamirSSTestCase(TestCase):
@@ -56,29 +65,136 @@ class ShamirSSTestCase(TestCase):
         self.assertTrue(random_int == enc_dec[0][1])
         # check all shares generated correctly
         shares = self.scheme.get_shares()
-        encoded_secret = self.scheme.secret
         self.assertTrue(len(shares) == self.scheme.n)
         # check hashed secret is correct picking k random shares
         rnd_shares = self._pick_k_random_values(shares, self.scheme.k)
         rec_secret = self.scheme.get_secret(
             self.scheme.decode_shares(rnd_shares))
-        self.assertTrue(hashers.check_password(
-            str(rec_secret), encoded_secret))
+        self.assertTrue(self.scheme.check_secret(rec_secret))
         # check hashed secret is correct picking n random shares
         secret_all = self.scheme.get_secret(self.scheme.decode_shares(shares))
-        self.assertTrue(hashers.check_password(
-            str(secret_all), encoded_secret))
+        self.assertTrue(self.scheme.check_secret(secret_all))
         # check value error if lower than k shares provided
         rnd_shares_2 = self._pick_k_random_values(shares, self.scheme.k - 1)
         self.assertRaises(ValueError, lambda: self.scheme.get_secret(
             self.scheme.decode_shares(rnd_shares_2)))
         # check for wrong shares
         rnd_shares_3 = self._pick_k_random_values(shares, self.scheme.k)
-        rnd_shares_3[0] = (rnd_shares_3[0][0], rnd_shares_3[1][1])
+        swapped = (rnd_shares_3[0][0], rnd_shares_3[1][1])
+        self.assertRaises(ValueError, lambda: self.scheme.decode_shares([swapped]))
+        rnd_shares_3[0] = self._wrong_share(self.scheme, rnd_shares_3[0], rnd_shares_3[1])
         wrong_secret = self.scheme.get_secret(
             self.scheme.decode_shares(rnd_shares_3))
-        self.assertFalse(hashers.check_password(
-            str(wrong_secret), encoded_secret))
+        self.assertFalse(self.scheme.check_secret(wrong_secret))
+
+    def test_large_scheme(self):
+        """ Test wide fields and share counts in the hundreds """
+        scheme = ShamirSS(name='large', mers_exp=1279, k=300, n=700)
+        self.assertTrue(SSForm(data={'name': 'large', 'mers_exp': 1279, 'k': 300, 'n': 700}).is_valid())
+        shares = scheme.get_shares()
+        self.assertEqual(700, len(shares))
+        self.assertTrue(scheme.validate_shares(random.sample(shares, 300)))
+        self.assertTrue(scheme.validate_shares(shares[-300:]))
+        wrong = random.sample(shares, 300)
+        wrong[0] = (wrong[0][0], wrong[1][1])
+        self.assertFalse(scheme.validate_shares(wrong))
+
+    def test_verifier(self):
+        """ Test both verifier modes and the upgrade of stored verifiers on successful validation """
+        self.scheme.verifier = ShamirSS.VERIFIER_PASSWORD
+        shares = self.scheme.get_shares()
+        self.assertTrue(hashers.identify_hasher(self.scheme.secret))
+        self.scheme.save()
+        secret = self.scheme.get_secret(self.scheme.decode_shares(shares))
+        self.assertTrue(self.scheme.check_secret(secret))
+        self.assertFalse(self.scheme.check_secret(secret + 1))
+        # the scheme moves to blake2, the password hash is replaced on next successful check only
+        ShamirSS.objects.filter(pk=self.scheme.pk).update(verifier=ShamirSS.VERIFIER_BLAKE2)
+        scheme = ShamirSS.objects.get(pk=self.scheme.pk)
+        self.assertFalse(scheme.validate_shares([(shares[0][0], shares[1][1])] + shares[1:4]))
+        self.assertEqual(self.scheme.secret, ShamirSS.objects.get(pk=scheme.pk).secret)
+        with mock.patch.object(hashers, 'check_password', wraps=hashers.check_password) as check:
+            self.assertTrue(scheme.validate_shares(shares[:4]))
+            self.assertTrue(ShamirSS.objects.get(pk=scheme.pk).check_secret(secret))
+            self.assertEqual(1, check.call_count)
+        stored = ShamirSS.objects.get(pk=scheme.pk).secret
+        self.assertTrue(stored.startswith('blake2$'))
+        self.assertLessEqual(len(stored), ShamirSS._meta.get_field('secret').max_length)
+        self.assertFalse(scheme.check_secret(secret + 1))
+        # wide fields fit too
+        wide = ShamirSS(name='wide', mers_exp=1279, k=2, n=3)
+        wide_shares = wide.get_shares()
+        self.assertTrue(wide.validate_shares(wide_shares[1:]))
+
+    def test_validate_share_sets(self):
+        """ Test batch validation finds valid subsets and corrupted shares with few hash checks """
+        self.scheme.verifier = ShamirSS.VERIFIER_PASSWORD
+        shares = self.scheme.get_shares()
+        corrupted = self._wrong_share(self.scheme, shares[5], shares[6])
+        pool = shares[:5] + [corrupted] + shares[6:]
+        share_sets = [pool[0:4], pool[2:6], list(reversed(pool[:4])), pool[6:10], pool[:2], [(1, 'not base64!')]]
+        with mock.patch.object(hashers, 'check_password', wraps=hashers.check_password) as check:
+            report = self.scheme.validate_share_sets(share_sets)
+            # pool[0:4], its reverse and pool[6:10] recover the same secret
+            self.assertEqual(2, check.call_count)
+        self.assertEqual([True, False, True, True, False, False], report['valid'])
+        self.assertEqual(2, report['secrets_checked'])
+        self.assertEqual([corrupted], report['bad'])
+        self.assertEqual([(1, 'not base64!')], report['malformed'])
+        self.assertEqual(sorted(shares[:5] + shares[6:10]), report['good'])
+        self.assertEqual([], report['unverifiable'])
+        # nothing can be told without a valid subset
+        report = self.scheme.validate_share_sets([pool[2:6]])
+        self.assertEqual(([False], [], []), (report['valid'], report['good'], report['bad']))
+        self.assertEqual(pool[2:6], report['unverifiable'])
+        # shares are reported as supplied, legacy ones included
+        points = self.scheme.decode_shares(shares)
+        legacy = [(index, base64.b64encode(str(value).encode()).decode()) for index, value in points]
+        report = self.scheme.validate_share_sets([legacy[:4], [legacy[4], corrupted]])
+        self.assertEqual(([True, False], legacy[:5], [corrupted]), (report['valid'], report['good'], report['bad']))
+        # management command
+        self.scheme.save()
+        path = settings.MEDIA_ROOT + 'share_sets.json'
+        with open(path, 'w') as file:
+            json.dump(share_sets[:4], file)
+        out = io.StringIO()
+        call_command('check_shares', str(self.scheme.id), path, stdout=out)
+        os.remove(path)
+        self.assertIn('bad shares: {}\n'.format(corrupted[0]), out.getvalue())
+
+    def test_provision(self):
+        """ Test bulk provisioning creates valid schemes and rejects invalid ones """
+        schemes = [ShamirSS(name='team {}'.format(i), mers_exp=127, k=2 + i % 3, n=5) for i in range(7)]
+        schemes.append(ShamirSS(name='wide', mers_exp=521, k=120, n=300))
+        created = ShamirSS.provision(schemes)
+        self.assertEqual(8, ShamirSS.objects.count())
+        self.assertEqual([scheme.name for scheme in schemes], [scheme.name for scheme, _ in created])
+        for scheme, shares in created:
+            self.assertEqual(scheme.n, len(shares))
+            stored = ShamirSS.objects.get(pk=scheme.pk)
+            self.assertTrue(stored.validate_shares(random.sample(shares, stored.k)))
+        self.assertRaises(ValueError, lambda: ShamirSS.provision([ShamirSS(name='bad', mers_exp=127, k=6, n=5)]))
+        out = io.StringIO()
+        call_command('provision_schemes', '3', '--k', '2', '--n', '3', '--name', 'new', stdout=out, stderr=io.StringIO())
+        data = json.loads(out.getvalue())
+        self.assertEqual(['new-1', 'new-2', 'new-3'], [scheme['name'] for scheme in data])
+        self.assertTrue(ShamirSS.objects.get(pk=data[0]['id']).validate_shares(data[0]['shares'][1:]))
+
+    def test_legacy_key(self):
+        """ Test files encrypted with the old decimal key are still decrypted with the shares """
+        self.assertEqual(base64.b64encode(b'12345' + b'0' * 27), self.scheme.get_key(12345))
+        self.assertEqual(base64.b64encode(str(2 ** 106).encode()[:32]), self.scheme.get_key(2 ** 106))
+        shares = self.scheme.get_shares()
+        secret = self.scheme.get_secret(self.scheme.decode_shares(shares))
+        self.assertEqual((107 + 7) // 8, len(self.scheme.get_file_key(shares)))
+        file_name = settings.MEDIA_ROOT + 'test_legacy.txt'
+        with open(file_name + '.enc', 'wb') as file:
+            file.write(Fernet(self.scheme.get_key(secret)).encrypt(b'legacy content'))
+        self.assertEqual('test_legacy.txt', self.scheme.decrypt_file(file_name + '.enc', shares))
+        with open(file_name, 'rb') as file:
+            self.assertEqual(b'legacy content', file.read())
+        os.remove(file_name)
+        os.remove(file_name + '.enc')
 
     def test_file_encryption_decryption(self):
         """ Test successful file encryption and decryption """
@@ -94,39 +210,75 @@ class ShamirSSTestCase(TestCase):
         test_file_2.close()
         # create shares for the scheme
         shares = self.scheme.get_shares()
-        # encrypt/decrypt test file 1
-        enc_dec_test_file_1 = self.scheme.decrypt_file(
-            settings.MEDIA_ROOT + self.scheme.encrypt_file(file_name_1, shares), shares)
-        # encrypt/decrypt test file 2
-        enc_dec_test_file_2 = self.scheme.decrypt_file(
-            settings.MEDIA_ROOT + self.scheme.encrypt_file(file_name_2, shares), shares)
-        # create hashes of the two files
-        hash_1 = self.hash_file(settings.MEDIA_ROOT + enc_dec_test_file_1)
-        hash_2 = self.hash_file(settings.MEDIA_ROOT + enc_dec_test_file_2)
+        # encrypt/decrypt test files
+        enc_dec_test_file_1 = self.round_trip(file_name_1, shares)
+        enc_dec_test_file_2 = self.round_trip(file_name_2, shares)
         # compare hashes
-        self.assertTrue(hash_1 == hash_2)
-        # remove encrypted files
-        os.remove(settings.MEDIA_ROOT + enc_dec_test_file_1 + '.enc')
-        os.remove(settings.MEDIA_ROOT + enc_dec_test_file_2 + '.enc')
+        self.assertTrue(self.hash_file(enc_dec_test_file_1) == self.hash_file(enc_dec_test_file_2))
+        os.remove(enc_dec_test_file_1)
+        os.remove(enc_dec_test_file_2)
         # test encryption with files having different content
         with open(file_name_2, 'a') as file:
             file.write('this make file 2 different\n')
-        # encrypt/decrypt test file 1
-        enc_dec_test_file_1 = self.scheme.decrypt_file(
-            settings.MEDIA_ROOT + self.scheme.encrypt_file(file_name_1, shares), shares)
-        # encrypt/decrypt test file 2
-        enc_dec_test_file_2 = self.scheme.decrypt_file(
-            settings.MEDIA_ROOT + self.scheme.encrypt_file(file_name_2, shares), shares)
-        # create hashes of the two files
-        hash_1 = self.hash_file(settings.MEDIA_ROOT + enc_dec_test_file_1)
-        hash_2 = self.hash_file(settings.MEDIA_ROOT + enc_dec_test_file_2)
-        # compare hashes
-        self.assertTrue(hash_1 != hash_2)
+        enc_dec_test_file_1 = self.round_trip(file_name_1, shares)
+        enc_dec_test_file_2 = self.round_trip(file_name_2, shares)
+        self.assertTrue(self.hash_file(enc_dec_test_file_1) != self.hash_file(enc_dec_test_file_2))
+        # encrypted files are never written over an existing file
+        self.scheme.encrypt_file(file_name_1, shares)
+        self.assertRaises(FileExistsError, lambda: self.scheme.encrypt_file(file_name_1, shares))
         # remove test files
-        os.remove(settings.MEDIA_ROOT + enc_dec_test_file_1 + '.enc')
-        os.remove(settings.MEDIA_ROOT + enc_dec_test_file_2 + '.enc')
-        os.remove(settings.MEDIA_ROOT + enc_dec_test_file_1)
-        os.remove(settings.MEDIA_ROOT + enc_dec_test_file_2)
+        for name in (enc_dec_test_file_1, enc_dec_test_file_2, file_name_1 + '.enc', file_name_1, file_name_2):
+            os.remove(name)
+
+    def round_trip(self, file_name, shares):
+        """ encrypt then decrypt file_name, return the path of the decrypted copy """
+        encrypted = settings.MEDIA_ROOT + self.scheme.encrypt_file(file_name, shares)
+        decrypted = self.scheme.decrypt_file(encrypted, shares, output_file=file_name + '.dec')
+        os.remove(encrypted)
+        return settings.MEDIA_ROOT + decrypted
+
+    def test_compressed_document(self):
+        """ Test text documents are compressed before encryption when enabled """
+        self.scheme.save()
+        shares = self.scheme.get_shares()
+        content = b'id,name,value\n' + b''.join(b'%d,row,%d\n' % (i, i * 7) for i in range(2000))
+        document = Document.objects.create(name='data', folder=Folder.objects.create(name='folder'),
+                                           file=ContentFile(content, name='test_compressed.csv'))
+        with self.settings(COMPRESSION_CODEC='zlib'):
+            self.assertTrue(self.scheme.encrypt_document(document, shares))
+        with open(document.file_path(), 'rb') as file:
+            encrypted = file.read()
+        self.assertEqual(compression.ZLIB, encrypted[crypto.HEADER_SIZE - 1])
+        self.assertLess(len(encrypted), len(content) // 2)
+        self.assertTrue(self.scheme.decrypt_document(document, shares))
+        with open(document.file_path(), 'rb') as file:
+            self.assertEqual(content, file.read())
+        document.delete()
+
+    def test_share_encoding(self):
+        """ Test binary shares carry index, scheme and checksum and legacy shares are still accepted """
+        self.scheme.save()
+        shares = self.scheme.get_shares()
+        self.assertTrue(all(share.startswith('v2.') for _, share in shares))
+        points = self.scheme.decode_shares(shares)
+        self.assertEqual(points, self.scheme.decode_shares(self.scheme.encode_shares(points)))
+        legacy = [(index, base64.b64encode(str(value).encode()).decode()) for index, value in points]
+        self.assertEqual(points, self.scheme.decode_shares(legacy))
+        self.assertTrue(self.scheme.validate_shares(legacy[:4]))
+        # wide values keep a fixed size
+        wide = ShamirSS(name='wide', mers_exp=1279, k=2, n=2)
+        self.assertEqual(1, len(set(len(share) for _, share in wide.encode_shares([(1, 1), (2, 2 ** 1278)]))))
+        # corrupted, truncated or foreign shares are rejected
+        index, share = shares[0]
+        flipped = share[:10] + ('A' if share[10] != 'A' else 'B') + share[11:]
+        other = ShamirSS.objects.create(name='other', mers_exp=107, k=4, n=18)
+        for bad in (flipped, share[:-4], other.encode_shares([points[0]])[0][1]):
+            self.assertRaises(ValueError, lambda: self.scheme.decode_shares([(index, bad)]))
+
+    def _wrong_share(self, scheme, share, other):
+        """ return share holding the value of other share, correctly encoded """
+        value = scheme.decode_shares([other])[0][1]
+        return scheme.encode_shares([(share[0], value)])[0]
 
     def hash_file(self, file):
         """ return sha1 hash of a file """
@@ -0,0 +1,85 @@
+from django.test import SimpleTestCase
+from shared_secret import polynomial
+from shared_secret.models import ShamirSS
+from fractions import Fraction
+import random
+
+
+def binomial(n, k):
+    result = Fraction(1)
+    for i in range(k):
+        result = result * (n - i) / (i + 1)
+    return int(result)
+
+
+class PolynomialTestCase(SimpleTestCase):
+    """ Test for modular interpolation helpers """
+
+    PRIME = 2 ** 127 - 1
+
+    def test_batch_inverse(self):
+        """ Test batch inversion agrees with single inversions """
+        values = [1, 2, 3, 12345, self.PRIME - 1, 2 ** 100]
+        inverses = polynomial.batch_inverse(values, self.PRIME)
+        for value, inv in zip(values, inverses):
+            self.assertEqual(inv, polynomial.inverse(value, self.PRIME))
+            self.assertEqual(1, value * inv % self.PRIME)
+        self.assertRaises(ValueError, lambda: polynomial.batch_inverse([3, self.PRIME], self.PRIME))
+
+    def test_interpolate_at_zero(self):
+        """ Test interpolation recovers the secret from any k shares """
+        for k in (2, 3, 7, 30):
+            shares = ShamirSS()._generate_shares(k, k + 3, self.PRIME)
+            secret = shares.pop()
+            self.assertEqual(secret, polynomial.interpolate_at_zero(shares[:k], self.PRIME))
+            self.assertEqual(secret, polynomial.interpolate_at_zero(shares[-k:], self.PRIME))
+            # exact rational Lagrange basis as reference
+            x_s = tuple(x for x, _ in shares[1:k + 1])
+            for x_i, c_i in zip(x_s, polynomial.basis_at_zero(x_s, self.PRIME)):
+                exact = Fraction(1)
+                for x_j in x_s:
+                    if x_j != x_i:
+                        exact *= Fraction(x_j, x_j - x_i)
+                self.assertEqual(c_i, exact.numerator * polynomial.inverse(exact.denominator, self.PRIME) % self.PRIME)
+
+    def test_multiply(self):
+        """ Test binary and decimal polynomial products agree with schoolbook multiplication """
+        a = [random.randrange(self.PRIME) for i in range(40)]
+        b = [random.randrange(self.PRIME) for i in range(70)]
+        expected = [0] * (len(a) + len(b) - 1)
+        for i, x in enumerate(a):
+            for j, y in enumerate(b):
+                expected[i + j] = (expected[i + j] + x * y) % self.PRIME
+        self.assertEqual(expected, polynomial._multiply_binary(a, b, self.PRIME))
+        self.assertEqual(expected, polynomial._multiply_decimal(a, b, self.PRIME))
+        self.assertEqual([], polynomial.multiply([], b, self.PRIME))
+
+    def test_evaluate_newton(self):
+        """ Test shares evaluated in the binomial basis on both the small and large path """
+        for k, n in ((1, 3), (5, 12), (150, 400)):
+            coefficients = [random.randrange(self.PRIME) for i in range(k)]
+            values = polynomial.evaluate_newton(coefficients, n, self.PRIME)
+            self.assertEqual(n, len(values))
+            for x in (1, 2, n // 2, n):
+                expected = sum(c * binomial(x, j) for j, c in enumerate(coefficients)) % self.PRIME
+                self.assertEqual(expected, values[x - 1])
+            if k > 1:
+                points = list(zip(range(1, n + 1), values))
+                self.assertEqual(coefficients[0], polynomial.interpolate_at_zero(random.sample(points, k), self.PRIME))
+                self.assertEqual(coefficients[0], polynomial.interpolate_at_zero(points[:k], self.PRIME))
+
+    def test_evaluate_newton_many(self):
+        """ Test polynomials evaluated together match one by one evaluation """
+        for k, n in ((3, 5), (120, 300)):
+            polynomials = [[random.randrange(self.PRIME) for i in range(k)] for j in range(4)]
+            self.assertEqual([polynomial.evaluate_newton(c, n, self.PRIME) for c in polynomials],
+                             polynomial.evaluate_newton_many(polynomials, n, self.PRIME))
+        # small pools go through the cached binomial table, shorter polynomials included
+        polynomials = [[random.randrange(self.PRIME) for i in range(k)] for k in (1, 4, 2)]
+        for coefficients, values in zip(polynomials, polynomial.evaluate_newton_many(polynomials, 6, self.PRIME)):
+            self.assertEqual([sum(c * binomial(x, j) for j, c in enumerate(coefficients)) % self.PRIME
+                              for x in range(1, 7)], values)
+
+    def test_distinct_points(self):
+        """ Test repeated share indexes are rejected """
+        self.assertRaises(ValueError, lambda: polynomial.interpolate_at_zero([(1, 5), (2, 7), (1, 9)], self.PRIME))
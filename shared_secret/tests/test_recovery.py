@@ -0,0 +1,93 @@
+from django.test import TestCase
+from django.conf import settings
+from django.core.files import File
+from django.core.management import call_command
+from shared_secret.models import ShamirSS, FileOperation
+from shared_secret import crypto
+from shared_secret.tasks import recover_file_operations
+from file_handler.models import Document, Folder
+from unittest import mock
+import io
+import os
+import socket
+import subprocess
+import sys
+
+
+class FileOperationTestCase(TestCase):
+    """ Test for the crash safe document file replacement """
+
+    TEST_FILE_NAME = 'test_recovery.txt'
+
+    def setUp(self):
+        self.scheme = ShamirSS.objects.create(name='test', mers_exp=107, k=2, n=3)
+        self.shares = self.scheme.get_shares()
+        self.scheme.save()
+        folder = Folder.objects.create(name='test_folder')
+        with open(self.TEST_FILE_NAME, 'w+') as file:
+            file.write('something to fill this up\n\n')
+            self.document = Document.objects.create(name='test_doc', folder=folder, file=File(file))
+        os.remove(self.TEST_FILE_NAME)
+        self.source = self.document.file.name
+        self.target = self.source + '.enc'
+
+    def tearDown(self):
+        for name in (self.source, self.target, self.target + crypto.PART_SUFFIX):
+            if os.path.isfile(settings.MEDIA_ROOT + name):
+                os.remove(settings.MEDIA_ROOT + name)
+
+    def touch(self, name):
+        with open(settings.MEDIA_ROOT + name, 'w') as file:
+            file.write('leftover')
+
+    def test_failed_write(self):
+        """ Test a failing encryption leaves neither output, partial file nor journal entry """
+        with mock.patch.object(crypto, 'encrypt_stream', side_effect=OSError('disk full')):
+            self.assertRaises(OSError, lambda: self.scheme.encrypt_document(self.document, self.shares[:2]))
+        self.assertFalse(os.path.exists(settings.MEDIA_ROOT + self.target))
+        self.assertFalse(os.path.exists(settings.MEDIA_ROOT + self.target + crypto.PART_SUFFIX))
+        self.assertTrue(os.path.isfile(self.document.file_path()))
+        self.assertEqual(0, FileOperation.objects.count())
+        # a successful encryption is journaled until the source file is removed on commit
+        self.assertTrue(self.scheme.encrypt_document(self.document, self.shares[:2]))
+        self.assertEqual(1, FileOperation.objects.count())
+
+    def test_recover(self):
+        """ Test interrupted operations are rolled back or finished depending on the document """
+        # crash while writing: partial output, document untouched
+        self.touch(self.target + crypto.PART_SUFFIX)
+        self.crashed()
+        self.assertEqual((0, 1), FileOperation.recover_all())
+        self.assertFalse(os.path.exists(settings.MEDIA_ROOT + self.target + crypto.PART_SUFFIX))
+        self.assertTrue(os.path.isfile(settings.MEDIA_ROOT + self.source))
+        # crash before commit: complete output, document untouched
+        self.touch(self.target)
+        self.crashed()
+        self.assertEqual((0, 1), FileOperation.recover_all())
+        self.assertFalse(os.path.exists(settings.MEDIA_ROOT + self.target))
+        self.assertTrue(os.path.isfile(settings.MEDIA_ROOT + self.source))
+        # crash after commit: document points to the output, source left behind
+        self.touch(self.target)
+        self.crashed()
+        Document.objects.filter(pk=self.document.pk).update(file=self.target)
+        out = io.StringIO()
+        call_command('recover_files', stdout=out)
+        self.assertIn('1 operations finished, 0 rolled back', out.getvalue())
+        self.assertFalse(os.path.exists(settings.MEDIA_ROOT + self.source))
+        self.assertTrue(os.path.isfile(settings.MEDIA_ROOT + self.target))
+        # operations of live processes are left alone, those of other hosts until they are old enough
+        FileOperation.objects.create(document=self.document, source=self.source, target=self.target)
+        self.assertEqual((0, 0), FileOperation.recover_all())
+        FileOperation.objects.update(owner='elsewhere:1')
+        self.assertEqual((0, 0), FileOperation.recover_all(older_than=60))
+        # the runjobs startup hook waits for the grace period
+        self.assertIsNone(recover_file_operations())
+        self.assertEqual((1, 0), FileOperation.recover_all())
+
+    def crashed(self):
+        """ journal an operation of a process which exited """
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        owner = '{}:{}'.format(socket.gethostname(), process.pid)
+        return FileOperation.objects.create(document=self.document, source=self.source, target=self.target,
+                                            owner=owner)
@@ -1,9 +1,14 @@
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from shared_secret.models import ShamirSS
+from shared_secret import access, crypto
 from file_handler.models import Document, Folder
 from django.core.files import File
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from jobs.models import Job
+from jobs import worker
+from urllib.parse import parse_qs, urlparse
 import random
 import os
 
@@ -31,6 +36,7 @@ class TestSharedSecretViews(TestCase):
             file.write('something to fill this up\n\n')
             self.document = Document.objects.create(name='test_doc', folder=self.folder, file=File(file))
         os.remove('test_file.txt')
+        self.source_path = self.document.file_path()
 
     def test_index(self):
         """ Test for index view """
@@ -156,9 +162,16 @@ class TestSharedSecretViews(TestCase):
         random_shares = self._pick_k_random_values(shares, scheme.k)
         post_data = {'share_' + str(share[0]): share[1] for share in random_shares}
         post_data['scheme'] = scheme.id
-        expected_url = '/folder/{}/'.format(self.document.folder.id)
         response = self.client.post(enc_url.format(self.document.id, scheme.id), post_data, follow=True)
-        self.assertRedirects(response, expected_url=expected_url, status_code=302, target_status_code=200)
+        job = Job.objects.latest('id')
+        self.assertRedirects(response, expected_url='/jobs/{}/'.format(job.id), status_code=302, target_status_code=200)
+        self.assertEqual(job.kind, 'encrypt')
+        self.assertEqual(job.get_payload()['next'], '/folder/{}/'.format(self.document.folder.id))
+        # run the encryption job
+        self.assertEqual(worker.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.secret, '')
         # check document model changes
         self.document.refresh_from_db()
         self.assertTrue(os.path.isfile(self.document.file_path()))
@@ -185,7 +198,8 @@ class TestSharedSecretViews(TestCase):
         scheme = ShamirSS(**self.scheme_data)
         shares = scheme.get_shares()
         scheme.save()
-        enc_file_path = scheme.encrypt_file(self.document.file_path(), shares)
+        enc_file_path = scheme.encrypt_file(self.document.file_path(), shares,
+                                            output_file=settings.MEDIA_ROOT + scheme.target_name(self.document))
         os.remove(self.document.file_path())
         self.document.file.name = enc_file_path
         self.document.scheme = scheme
@@ -197,14 +211,107 @@ class TestSharedSecretViews(TestCase):
         random_shares = self._pick_k_random_values(shares, scheme.k)
         post_data = {'share_' + str(share[0]): share[1] for share in random_shares}
         post_data['scheme'] = scheme.id
-        expected_url = '/folder/{}/'.format(self.document.folder.id)
         response = self.client.post(dec_url.format(self.document.id), post_data, follow=True)
-        self.assertRedirects(response, expected_url=expected_url, status_code=302, target_status_code=200)
+        job = Job.objects.latest('id')
+        self.assertRedirects(response, expected_url='/jobs/{}/'.format(job.id), status_code=302, target_status_code=200)
+        # run the decryption job
+        self.assertEqual(worker.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
         self.document.refresh_from_db()
         self.assertTrue(os.path.isfile(self.document.file_path()))
         self.assertIsNone(self.document.scheme)
         self.assertEqual(self.document.filename(), self.TEST_FILE_NAME)
 
+    def test_bulk_folder(self):
+        """ Test encryption and decryption of a whole folder subtree """
+        child = Folder.objects.create(name='child', parent=self.folder)
+        with open(self.TEST_FILE_NAME, 'w+') as file:
+            file.write('something else\n')
+            child_document = Document.objects.create(name='child_doc', folder=child, file=File(file))
+        os.remove(self.TEST_FILE_NAME)
+        scheme = ShamirSS(**self.scheme_data)
+        shares = scheme.get_shares()
+        scheme.save()
+        random_shares = self._pick_k_random_values(shares, scheme.k)
+        post_data = {'share_' + str(share[0]): share[1] for share in random_shares}
+        post_data['scheme'] = scheme.id
+        # check encryption of the subtree
+        response = self.client.get('/s/encrypt_folder/{}/{}/'.format(self.folder.id, scheme.id))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/s/encrypt_folder/{}/{}/'.format(self.folder.id, scheme.id), post_data)
+        job = Job.objects.latest('id')
+        self.assertEqual(response['Location'], '/jobs/{}/'.format(job.id))
+        worker.run_pending()
+        job.refresh_from_db()
+        report = job.get_result()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(report['documents'], 2)
+        self.assertEqual(report['succeeded'], 2)
+        for document in (self.document, child_document):
+            document.refresh_from_db()
+            self.assertEqual(document.scheme, scheme)
+            self.assertTrue(document.filename().endswith('.enc'))
+            self.assertTrue(os.path.isfile(document.file_path()))
+        # check decryption of the subtree
+        self.client.post('/s/decrypt_folder/{}/{}/'.format(self.folder.id, scheme.id), post_data)
+        worker.run_pending()
+        self.assertEqual(Job.objects.latest('id').get_result()['succeeded'], 2)
+        for document in (self.document, child_document):
+            document.refresh_from_db()
+            self.assertIsNone(document.scheme)
+            self.assertFalse(document.filename().endswith('.enc'))
+        with open(child_document.file_path()) as f:
+            self.assertEqual(f.read(), 'something else\n')
+        os.remove(child_document.file_path())
+
+    def test_unlock(self):
+        """ Test plaintext access to an encrypted document """
+        unlock_url = '/s/unlock/{}/'
+        # check plaintext document
+        response = self.client.get(unlock_url.format(self.document.id))
+        self.assertEqual(response.status_code, 404)
+        scheme = ShamirSS(**self.scheme_data)
+        shares = scheme.get_shares()
+        scheme.save()
+        enc_file_path = scheme.encrypt_file(self.document.file_path(), shares)
+        os.remove(self.document.file_path())
+        self.document.file.name = enc_file_path
+        self.document.scheme = scheme
+        self.document.save()
+        response = self.client.get(unlock_url.format(self.document.id))
+        self.assertEqual(response.status_code, 200)
+        # check redirect to download with an access token
+        random_shares = self._pick_k_random_values(shares, scheme.k)
+        post_data = {'share_' + str(share[0]): share[1] for share in random_shares}
+        post_data['scheme'] = scheme.id
+        response = self.client.post(unlock_url.format(self.document.id), post_data)
+        self.assertEqual(response.status_code, 302)
+        download_url = response['Location']
+        self.assertTrue(download_url.startswith('/download/{}/?token='.format(self.document.id)))
+        # the session keeps the key of this file, not the key of the scheme, the url only names it
+        token = parse_qs(urlparse(download_url).query)['token'][0]
+        key = access.read_token(self.client.session, token, self.document)
+        self.assertIsInstance(key, crypto.FileKey)
+        self.assertNotEqual(scheme.get_file_key(random_shares), key)
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'something to fill this up\n\n')
+        # check range requests
+        response = self.client.get(download_url, HTTP_RANGE='bytes=10-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-14/27')
+        self.assertEqual(b''.join(response.streaming_content), b'to fi')
+        response = self.client.get(download_url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        # the url is useless outside the session it was granted to
+        other = Client()
+        other.login(username=self.DUMMY_USERNAME, password=self.DUMMY_PASSWORD)
+        self.assertEqual(other.get(download_url).status_code, 403)
+        # check forged token
+        response = self.client.get('/download/{}/?token=forged'.format(self.document.id))
+        self.assertEqual(response.status_code, 403)
+
     def check_shares(self, shares_1, shares_2):
         """ helper function: return True if shares are different """
         for i, j in zip(shares_1, shares_2):
@@ -224,4 +331,7 @@ class TestSharedSecretViews(TestCase):
         pass
 
     def tearDown(self):
-        os.remove(self.document.file_path())
+        # replaced files are removed on commit, which never comes in a test case
+        for path in {self.source_path, self.document.file_path()}:
+            if os.path.isfile(path):
+                os.remove(path)
@@ -8,6 +8,9 @@ urlpatterns = [
     path('refresh/<int:scheme_id>/', views.refresh, name='refresh'),
     path('encrypt/<int:document_id>/<int:scheme_id>/', views.encrypt, name='encrypt'),
     path('decrypt/<int:document_id>/', views.decrypt, name='decrypt'),
+    path('unlock/<int:document_id>/', views.unlock, name='unlock'),
+    path('encrypt_folder/<int:folder_id>/<int:scheme_id>/', views.encrypt_folder, name='encrypt_folder'),
+    path('decrypt_folder/<int:folder_id>/<int:scheme_id>/', views.decrypt_folder, name='decrypt_folder'),
     path('refresh/<int: scheme_id>/', views.refresh, name='refresh'),
     path('delete_related/<int:scheme_id>/', views.delete_related, name='elete_related'),
     path('delete/<int:scheme_id>/', views.delete, name='delete')
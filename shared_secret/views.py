@@ -1,8 +1,11 @@
 from django.shortcuts import render, redirect, get_object_or_404, get_list_or_404
 from django.contrib.auth.decorators import login_required
 from django.http.response import HttpResponseNotAllowed
+from django.utils.http import urlencode
 from .models import ShamirSS
-from file_handler.models import Document
+from .access import make_token
+from . import crypto
+from file_handler.models import Document, Folder
 from .forms import SSForm, EncryptDecryptForm, DeleteRelatedForm, DeleteSchemeForm, DivErrorList, RefreshForm
 
 
@@ -25,12 +28,13 @@ def create(request):
     if request.method == 'POST':
         form = SSForm(request.POST, error_class=DivErrorList)
         if form.is_valid():
-            # get shares and store hashed secret
-            shares = form.instance.get_shares()
-            form.save()
+            # save first, shares carry the scheme id, then store the secret verifier
+            scheme = form.save()
+            shares = scheme.get_shares()
+            scheme.save(update_fields=['secret'])
             return render(request, 'shared_secret/generate.html', {
                 'shares': shares,
-                'scheme': form.instance
+                'scheme': scheme
             })
     else:
         form = SSForm()
@@ -94,8 +98,10 @@ def encrypt(request, document_id, scheme_id):
     if request.method == 'POST':
         form = EncryptDecryptForm(
             scheme.n, True, request.POST, error_class=DivErrorList)
-        if form.is_valid() and form.encrypt(document):
-            return redirect('/folder/{}'.format(document.folder_id))
+        if form.is_valid():
+            job = form.encrypt(document)
+            if job is not None:
+                return redirect('/jobs/{}/'.format(job.id))
     else:
         form = EncryptDecryptForm(
             scheme.n, initial={'scheme': scheme}, error_class=DivErrorList)
@@ -115,8 +121,9 @@ def decrypt(request, document_id):
     if request.method == 'POST':
         form = EncryptDecryptForm(scheme.n, False, request.POST, initial={
                                   'scheme': scheme}, error_class=DivErrorList)
-        if form.is_valid() and form.decrypt(document):
-            return redirect('/folder/{}'.format(document.folder_id))
+        if form.is_valid():
+            job = form.decrypt(document)
+            return redirect('/jobs/{}/'.format(job.id))
     else:
         form = EncryptDecryptForm(scheme.n, False, initial={
                                   'scheme': scheme}, error_class=DivErrorList)
@@ -126,3 +133,63 @@ def decrypt(request, document_id):
         'scheme': scheme,
         'enc': False
     })
+
+
+@login_required
+def encrypt_folder(request, folder_id, scheme_id):
+    """ encrypt every document of a folder and its subfolders """
+    return bulk(request, folder_id, scheme_id, True)
+
+
+@login_required
+def decrypt_folder(request, folder_id, scheme_id):
+    """ decrypt every document of a folder and its subfolders """
+    return bulk(request, folder_id, scheme_id, False)
+
+
+def bulk(request, folder_id, scheme_id, enc):
+    folder = get_object_or_404(Folder, pk=folder_id)
+    scheme = get_object_or_404(ShamirSS, pk=scheme_id)
+    if request.method == 'POST':
+        form = EncryptDecryptForm(scheme.n, True, request.POST, error_class=DivErrorList)
+        if form.is_valid():
+            job = form.bulk(folder, enc)
+            return redirect('/jobs/{}/'.format(job.id))
+    else:
+        form = EncryptDecryptForm(scheme.n, initial={'scheme': scheme}, error_class=DivErrorList)
+    return render(request, 'shared_secret/bulk.html', {
+        'form': form,
+        'folder': folder,
+        'scheme': scheme,
+        'enc': enc
+    })
+
+
+@login_required
+def unlock(request, document_id):
+    """ grant temporary plaintext access to an encrypted document without decrypting it on disk """
+    document = get_object_or_404(Document, pk=document_id)
+    scheme = get_object_or_404(ShamirSS, pk=document.scheme_id)
+    if request.method == 'POST':
+        form = EncryptDecryptForm(scheme.n, False, request.POST, initial={
+                                  'scheme': scheme}, error_class=DivErrorList)
+        if form.is_valid():
+            scheme, shares = form.get_shares()
+            # the key cached by form validation is reused and wiped right after, only the key
+            # of this file is kept in the session, the url carries an opaque token
+            with open(document.file_path(), 'rb') as file:
+                key = crypto.file_key(file, scheme.get_file_key(shares))
+            scheme.forget_shares(shares)
+            if key is not None:
+                return redirect('/download/{}/?{}'.format(document.id, urlencode({'token': make_token(request.session, document, key)})))
+            form.add_error(None, 'This document was encrypted in an older format, decrypt and encrypt it again first')
+    else:
+        form = EncryptDecryptForm(scheme.n, False, initial={
+                                  'scheme': scheme}, error_class=DivErrorList)
+    return render(request, 'shared_secret/encdec.html', {
+        'form': form,
+        'document': document,
+        'scheme': scheme,
+        'enc': False,
+        'unlock': True
+    })